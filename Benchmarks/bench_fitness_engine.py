@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scripts'))
+import BarSeq_Fitness as bf
+
+# Times the per-gene fitness passes of 5_BarSeqProc_analyzeExp.py (pseudocount psi, weighted uGeneFitness and sumSq/half-gene uGF1/uGF2)
+#	on a synthetic in3genes-style table, comparing a reference reimplementation of the original strain-by-strain loops (legacy_gene_fitness,
+#	not the code of 5_BarSeqProc_analyzeExp.py itself, whose loops also did the file reading and bookkeeping of the script) to the whole-column
+#	version in BarSeq_Fitness.py, and checks that both give the same gene values. The speedup is therefore relative to that reimplementation.
+#
+# Usage:
+#	python3 PATH/Benchmarks/bench_fitness_engine.py <number of strains (default 150000)> <PATH/genes.gc (default KT2440_Files/KT2440_genes.gc)>
+
+
+# Build a synthetic strain table: strains sorted by gene (in genes.gc order) with baseline counts >= 3 and an enrichment count column
+def synthetic_strains(nStrains, genesFile, seed=0):
+	rng = np.random.default_rng(seed)
+	genes = pd.read_csv(genesFile, sep='\t', usecols=['locusId'])['locusId'].values
+	gene_of_strain = np.sort(rng.integers(0, len(genes), size=nStrains))
+	BL = 3 + rng.negative_binomial(2, 0.1, size=nStrains)
+	Enrichment = rng.negative_binomial(2, 0.1*rng.uniform(0.2, 2, size=len(genes))[gene_of_strain])
+	f = rng.uniform(0, 1, size=nStrains)
+	return genes[gene_of_strain], BL, Enrichment, f
+
+# Reference reimplementation of the three passes of the original 5_BarSeqProc_analyzeExp.py, walking the strains with a loci_counter as they did
+#	(rewritten from them and trimmed of the unused bookkeeping, so it is an approximation of their cost, not the original code)
+def legacy_gene_fitness(Used_Genes, Loci_Labels, BL, Enrichment, Gene_Positions, BL_Sums, strain_Sums):
+	readRatio = strain_Sums/BL_Sums
+	psi = np.zeros(shape=(len(Loci_Labels)))
+	loci_counter = 0
+	Gene_psf_list = []
+	for k in range(0,len(BL)):
+		if Used_Genes[k] != Loci_Labels[loci_counter]:
+			pgf = np.median(Gene_psf_list)
+			psi[loci_counter] = (2**pgf)*readRatio[loci_counter] if len(Gene_psf_list) >= 3 else readRatio[loci_counter]
+			Gene_psf_list = []
+			loci_counter = loci_counter + 1
+		ratio_val = readRatio[loci_counter]
+		Gene_psf_list.append(np.log2(Enrichment[k] + np.sqrt(ratio_val)) - np.log2(BL[k] + 1/(np.sqrt(ratio_val))))
+	pgf = np.median(Gene_psf_list)
+	psi[loci_counter] = (2**pgf)*readRatio[loci_counter] if len(Gene_psf_list) >= 3 else readRatio[loci_counter]
+
+	sf = np.zeros(shape=(len(BL)))
+	sw = np.zeros(shape=(len(BL)))
+	for k in range(0,len(BL)):
+		gene_pseudocount = psi[Loci_Labels.get_loc(Used_Genes[k])]
+		sf[k] = np.log2(np.sqrt(gene_pseudocount) + Enrichment[k]) - np.log2(1/np.sqrt(gene_pseudocount) + BL[k])
+		sv = ((1/(1+Enrichment[k])) + (1/(1+BL[k])))/((np.log(2))**2)
+		sw[k] = min(5.044, (1/(sv)))
+
+	uGeneFitness = np.zeros(shape=(len(Loci_Labels)))
+	sumSq = np.zeros(shape=(len(Loci_Labels)))
+	uGF1 = []
+	uGF2 = []
+	start = 0
+	for g in range(0,len(Loci_Labels)):
+		end = start
+		while end < len(BL) and Used_Genes[end] == Loci_Labels[g]:
+			end = end + 1
+		num = [sw[k]*sf[k] for k in range(start,end)]
+		denom = [sw[k] for k in range(start,end)]
+		uGeneFitness[g] = sum(num)/sum(denom)
+		sumSq[g] = sum([sw[k]*((sf[k]-uGeneFitness[g])**2) for k in range(start,end)])/sum(denom)
+		first = [k for k in range(start,end) if Gene_Positions[k] <= 0.5]
+		second = [k for k in range(start,end) if Gene_Positions[k] > 0.5]
+		if sum([BL[k] for k in first]) > 14 and sum([BL[k] for k in second]) > 14:
+			uGF1.append(sum([sw[k]*sf[k] for k in first])/sum([sw[k] for k in first]))
+			uGF2.append(sum([sw[k]*sf[k] for k in second])/sum([sw[k] for k in second]))
+		start = end
+	return psi, uGeneFitness, sumSq, np.array(uGF1), np.array(uGF2)
+
+
+if __name__=='__main__':
+	nStrains = int(sys.argv[1]) if len(sys.argv) > 1 else 150000
+	genesFile = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'KT2440_Files', 'KT2440_genes.gc')
+
+	Used_Genes, BL, Enrichment, f = synthetic_strains(nStrains, genesFile)
+	Sums = pd.DataFrame({'locusId': Used_Genes, 'BL': BL, 'E': Enrichment}).groupby('locusId', sort=False).sum()
+	Sums = Sums[Sums['E'] > 0]
+	keep = pd.Series(Used_Genes).isin(Sums.index).values
+	Used_Genes, BL, Enrichment, f = Used_Genes[keep], BL[keep], Enrichment[keep], f[keep]
+	Loci_Labels, BL_Sums, strain_Sums = Sums.index, Sums['BL'].values, Sums['E'].values
+	print('Synthetic table:', len(BL), 'strains in', len(Loci_Labels), 'genes')
+
+	t0 = time.perf_counter()
+	order, gene_index = bf.strain_gene_index(Used_Genes, Loci_Labels)
+	fit = bf.gene_fitness(BL[order], Enrichment[order], gene_index, f[order], BL_Sums, strain_Sums)
+	t_new = time.perf_counter() - t0
+	print('BarSeq_Fitness.gene_fitness: %.3f s' % t_new)
+
+	t0 = time.perf_counter()
+	legacy = legacy_gene_fitness(list(Used_Genes), Loci_Labels, BL, Enrichment, f, BL_Sums, strain_Sums)
+	t_old = time.perf_counter() - t0
+	print('strain-by-strain loops (reference reimplementation): %.3f s' % t_old)
+	print('speedup over the reference reimplementation: %.0fx' % (t_old/t_new))
+
+	for name, old in zip(['psi', 'uGeneFitness', 'sumSq', 'uGF1', 'uGF2'], legacy):
+		print(name, 'identical' if np.array_equal(old, fit[name]) else 'max abs difference %g' % np.max(np.abs(old - fit[name])))
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, io, json, time, shutil, tempfile, tracemalloc, resource, platform, subprocess, contextlib, itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scripts'))
+import BarSeq_Annotate as ba
+import BarSeq_Baseline as bb
+import BarSeq_Cache as bc
+import BarSeq_Compare as bcmp
+import BarSeq_Pipeline as bpl
+import BarSeq_Pool as bp
+import BarSeq_Results as br
+import BarSeq_Strains as bs
+import synthetic_pool as sp
+
+# Times each python stage on synthetic pools (synthetic_pool.py) of several sizes and records the wall time, CPU time and peak memory of each stage
+#	as JSON, so that runs on different commits can be compared:
+#		load_text		all.poolcount parsed as text (4_BarSeqProc_loadExps.py, cache=False)
+#		cache_build, cache_load		binary column cache built, then read back (BarSeq_Cache.py)
+#		split			in3genes table of each baseline replicate (4_BarSeqProc_loadExps.py)
+#		strain_store	gene-grouped strain store built from the cache (BarSeq_Strains.py)
+#		baseline		baseline artifact of each replicate (BarSeq_Baseline.py)
+#		fitness			gene sums, fitness engine, normalization and t-like statistics of every replicate (5_BarSeqProc_analyzeExp.py)
+#		merge			merged replicate table of each test condition (7_Replicates_Table.py)
+#		compare			every pair of test conditions (8_Fitness_Compare.py, BarSeq_Compare.py)
+#		annotate		the comparisons annotated with the feature table (9_Summary_annotate.py)
+#		results			results store built and saved (BarSeq_Results.py)
+#	Peak memory is the peak of the memory traced by tracemalloc during the stage (numpy and pandas allocations included); the peak resident set size
+#	of the process is recorded after each pool size. Tracing slows down the stages that create many python objects (e.g. parsing text), so
+#	memory=False gives the wall and CPU times alone.
+#
+# Usage:
+#	python3 PATH/Benchmarks/bench_pipeline.py <kwargs>
+#
+#	Optional kwargs (given as name=value):
+#		sizes=10000,100000,1000000	numbers of strains of the synthetic pools
+#		sets=4					number of sets of each pool, the first being the baseline
+#		replicates=ABC			replicate letters of each set
+#		repeat=1				times each stage is run (the fastest run is kept)
+#		output=bench_pipeline.json	JSON file of the results
+#		compare=PATH.json		earlier results to compare with; stages slower by more than threshold are reported and the exit status is 1
+#		threshold=1.25			slowdown ratio reported as a regression
+#		features=PATH			feature table of the annotate stage (default KT2440_Files/GCF_000007565.2_ASM756v2_feature_table_trimmed.txt)
+#		keep=PATH				directory to keep the synthetic pools in (default: a temporary directory, removed at the end)
+#		memory=True				trace the peak memory of each stage
+
+BENCH_VERSION = 1
+default_features = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'KT2440_Files', 'GCF_000007565.2_ASM756v2_feature_table_trimmed.txt')
+
+
+# Run a stage repeat times with the output of the scripts silenced, and return its result with the fastest wall time, its CPU time and the
+#	peak traced memory
+def measure(stage, repeat=1):
+	best = None
+	for run in range(repeat):
+		if tracemalloc.is_tracing():
+			tracemalloc.reset_peak()
+		start_memory = tracemalloc.get_traced_memory()[0]
+		wall = time.perf_counter()
+		cpu = time.process_time()
+		with contextlib.redirect_stdout(io.StringIO()):
+			result = stage()
+		wall = time.perf_counter() - wall
+		cpu = time.process_time() - cpu
+		peak = tracemalloc.get_traced_memory()[1] - start_memory
+		if best is None or wall < best[1]:
+			best = (result, wall, cpu, peak)
+	return best
+
+# Time every stage on one synthetic pool. Returns one record per stage.
+def bench_pool(poolFile, expsFile, featureTable, repeat=1):
+	records = []
+	def run(name, stage, rows=None):
+		result, wall, cpu, peak = measure(stage, repeat)
+		records.append({'stage': name, 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6), 'peak_mb': round(peak/2**20, 3) if tracemalloc.is_tracing() else None,
+			'rows': rows(result) if rows is not None else None})
+		return result
+
+	SetNames = bp.read_setnames(expsFile)
+	sets = bp.replicate_columns(bp.read_header(poolFile), SetNames)
+	baseline = '1'
+	Test_Conditions = [t for t in sets if t != baseline]
+	shutil.rmtree(bc.cache_path(poolFile), ignore_errors=True)
+
+	run('load_text', lambda: bpl.load_pool(poolFile, cache=False), len)
+	run('cache_build', lambda: bc.open_cache(poolFile), lambda meta: meta['nrows'])
+	Counts_Table = run('cache_load', lambda: bc.read_pool(poolFile), len)
+	run('split', lambda: bpl.split_replicates(Counts_Table, baseline, Test_Conditions, sets), lambda tables: sum(len(table) for table in tables.values()))
+	del Counts_Table
+
+	store_dir = run('strain_store', lambda: bs.open_store(poolFile), lambda store_dir: len(bs.load_store(store_dir)['f']))
+	store = bs.load_store(store_dir)
+	columns = {replicate: [BL_column] + [sets[t][replicate] for t in Test_Conditions if replicate in sets[t]] for replicate, BL_column in sets[baseline].items()}
+	Baselines = run('baseline', lambda: {replicate: bb.build_baseline(store, columns[replicate][0]) for replicate in columns},
+		lambda Baselines: sum(len(Baseline['strains']) for Baseline in Baselines.values()))
+
+	set_of_column = {column: t for t in Test_Conditions for column in sets[t].values()}
+	def fitness():
+		replicates = {}
+		for replicate in sorted(columns):
+			Fitness, genes_less_30, Unused_0ct = bpl.analyze_store(bb.baseline_store(store, Baselines[replicate], columns[replicate]), write=False,
+				Baseline=Baselines[replicate])
+			replicates[replicate] = ({set_of_column[column]: table for column, table in Fitness.items()}, genes_less_30,
+				{set_of_column[column]: genes for column, genes in Unused_0ct.items()})
+		return replicates
+	replicates = run('fitness', fitness, lambda replicates: sum(len(table) for Fitness, genes_less_30, Unused_0ct in replicates.values() for table in Fitness.values()))
+
+	def merge():
+		Unused_BL = set().union(*[genes_less_30 for Fitness, genes_less_30, Unused_0ct in replicates.values()])
+		Summaries = {}
+		for t in Test_Conditions:
+			Fitness_Tables = {replicate: Fitness[t] for replicate, (Fitness, genes_less_30, Unused_0ct) in sorted(replicates.items()) if t in Fitness}
+			Summaries[t] = bpl.merge_replicates(Fitness_Tables, Unused_BL.union(*[Unused_0ct[t] for Fitness, genes_less_30, Unused_0ct in replicates.values() if t in Unused_0ct]))
+		return Summaries
+	Summaries = run('merge', merge, lambda Summaries: sum(len(Summary) for Summary in Summaries.values()))
+
+	Comparisons = run('compare', lambda: bcmp.compare_pairs(bcmp.fitness_tensor(Summaries), list(itertools.combinations(Test_Conditions, 2))), len)
+	Index = ba.load_index(featureTable)
+	run('annotate', lambda: ba.annotate(Comparisons.set_index('Locus_Tag'), Index), len)
+
+	results_dir = os.path.join(os.path.dirname(poolFile), 'results')
+	run('results', lambda: br.save_results(br.build_results(replicates, Summaries), results_dir))
+	return records
+
+def git_commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True).stdout.strip() or None
+	except OSError:
+		return None
+
+# Compare two benchmark results: the ratio of the wall times of each pool size and stage found in both, and the stages slower than threshold
+def compare_results(Old, New, threshold=1.25):
+	if Old.get('parameters') != New.get('parameters'):
+		print('Note: the runs were made with different parameters', Old.get('parameters'), New.get('parameters'))
+	old_times = {(record['strains'], record['stage']): record['wall_s'] for record in Old['results']}
+	regressions = []
+	for record in New['results']:
+		key = (record['strains'], record['stage'])
+		if key in old_times and old_times[key] > 0:
+			ratio = record['wall_s']/old_times[key]
+			print('%9d strains %-12s %9.3f s -> %9.3f s  x%.2f%s' % (record['strains'], record['stage'], old_times[key], record['wall_s'], ratio,
+				'  REGRESSION' if ratio > threshold else ''))
+			if ratio > threshold:
+				regressions.append(key)
+	return regressions
+
+
+if __name__=='__main__':
+	kwargs = dict(arg.split('=') for arg in sys.argv[1:])
+	sizes = [int(size) for size in kwargs.get('sizes', '10000,100000,1000000').split(',')]
+	nSets = int(kwargs.get('sets', 4))
+	replicates = kwargs.get('replicates', 'ABC')
+	repeat = int(kwargs.get('repeat', 1))
+	memory = kwargs.get('memory', 'True') in ('True', 'true', '1')
+	featureTable = kwargs.get('features', default_features)
+	work_dir = kwargs['keep'] if 'keep' in kwargs else tempfile.mkdtemp()
+
+	Bench = {'version': BENCH_VERSION, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'python': platform.python_version(),
+		'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count(),
+		'parameters': {'sets': nSets, 'replicates': replicates, 'repeat': repeat, 'memory': memory}, 'results': [], 'max_rss_mb': {}}
+	try:
+		for nStrains in sizes:
+			pool_dir = os.path.join(work_dir, 'pool_%d' % nStrains)
+			start = time.perf_counter()
+			poolFile, expsFile = sp.write_pool(pool_dir, nStrains, nSets=nSets, replicates=replicates)
+			print('%d strains: synthetic pool written in %.1f s' % (nStrains, time.perf_counter() - start))
+			if memory:
+				tracemalloc.start()
+			records = bench_pool(poolFile, expsFile, featureTable, repeat)
+			tracemalloc.stop()
+			for record in records:
+				Bench['results'].append(dict(record, strains=nStrains))
+				print('%9d strains %-12s wall %9.3f s  cpu %9.3f s' % (nStrains, record['stage'], record['wall_s'], record['cpu_s']) +
+					('  peak %9.1f MB' % record['peak_mb'] if record['peak_mb'] is not None else ''))
+			Bench['max_rss_mb'][str(nStrains)] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, 1)
+	finally:
+		if 'keep' not in kwargs:
+			shutil.rmtree(work_dir, ignore_errors=True)
+
+	with open(kwargs.get('output', 'bench_pipeline.json'), 'w') as handle:
+		json.dump(Bench, handle, indent=1)
+	print('Results written to', kwargs.get('output', 'bench_pipeline.json'))
+
+	if 'compare' in kwargs:
+		with open(kwargs['compare']) as handle:
+			Old = json.load(handle)
+		regressions = compare_results(Old, Bench, float(kwargs.get('threshold', 1.25)))
+		if regressions:
+			print(len(regressions), 'stages slower than the threshold')
+			sys.exit(1)
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+import numpy as np
+import sys, os, time
+from scipy import stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scripts'))
+import BarSeq_Stats as bst
+
+# Times the t-tests and q-values of 7_Replicates_Table.py and 8_Fitness_Compare.py on synthetic replicate fitness values: the original per-gene
+#	scipy calls and min(qVals[i:]) loop against BarSeq_Stats.py over every gene and condition pair at once, and checks the values against scipy.
+#	The per-gene loops are timed on a few condition pairs and scaled up to the full number of pairs.
+#
+# Usage:
+#	python3 PATH/Benchmarks/bench_stats.py <number of genes (default 6000)> <number of condition pairs (default 1000)> <number of replicates (default 3)>
+
+
+# Replicate fitness of two conditions for each pair: pairs x genes x replicates arrays, with a fraction of genes shifted between conditions
+def synthetic_fitness(nGenes, nPairs, nReplicates, seed=0):
+	rng = np.random.default_rng(seed)
+	gene_fitness = rng.normal(0, 1, size=(nPairs, nGenes, 1))
+	shift = np.where(rng.random(size=(nPairs, nGenes, 1)) < 0.05, rng.normal(0, 3, size=(nPairs, nGenes, 1)), 0)
+	A = gene_fitness + rng.normal(0, 0.3, size=(nPairs, nGenes, nReplicates))
+	B = gene_fitness + shift + rng.normal(0, 0.3, size=(nPairs, nGenes, nReplicates))
+	return A, B
+
+# The q-values of the original scripts: q(i) = p(i)*N/i, then q*(i) = min(q[i:]) gene by gene
+def legacy_qvalues(sorted_pVals):
+	N = len(sorted_pVals)
+	qVals = []
+	for i in range(1,N+1):
+		qVals = np.append(qVals, min(1, sorted_pVals[i-1]*N/i))
+	sort_qVal = list(qVals)
+	for i in range(0,len(qVals)):
+		minVal = min(qVals[i:])
+		if minVal < sort_qVal[i]:
+			sort_qVal[i] = minVal
+	return qVals, np.array(sort_qVal)
+
+# One condition pair as in 7_ and 8_: a scipy t-test per gene, then the q-values of the sorted p-values
+def legacy_pair(A, B):
+	tscoreArray = []
+	pvalueArray = []
+	for i in range(0,len(A)):
+		tscore, pvalue = stats.ttest_ind(A[i,:], B[i,:], equal_var=True, alternative='two-sided')
+		tscoreArray = np.append(tscoreArray, tscore)
+		pvalueArray = np.append(pvalueArray, pvalue)
+	for i in range(0,len(A)):
+		stats.ttest_1samp(A[i,:], popmean=0)
+	order = np.argsort(pvalueArray, kind='stable')
+	qVals, sort_qVal = legacy_qvalues(pvalueArray[order])
+	return tscoreArray, pvalueArray, order, qVals, sort_qVal
+
+def max_relative_difference(a, b):
+	return np.nanmax(np.abs(a - b)/np.maximum(np.abs(a), 1e-300))
+
+
+if __name__=='__main__':
+	nGenes = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+	nPairs = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+	nReplicates = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+	nLegacy = min(nPairs, 2)
+
+	A, B = synthetic_fitness(nGenes, nPairs, nReplicates)
+	print('Synthetic fitness:', nGenes, 'genes x', nReplicates, 'replicates,', nPairs, 'condition pairs')
+
+	t0 = time.perf_counter()
+	t1, p1 = bst.ttest_1samp(A)
+	t, p = bst.ttest_ind(A, B, equal_var=True)
+	tw, pw = bst.ttest_ind(A, B, equal_var=False)
+	q1, adjusted1 = bst.qvalues(p1)
+	q, adjusted = bst.qvalues(p, cap=1)
+	qs, adjusteds = bst.qvalues(p, cap=1, pi0=bst.storey_pi0(p))
+	t_new = time.perf_counter() - t0
+	print('BarSeq_Stats (one sample, pooled and Welch t-tests, BH and Storey q-values): %.3f s' % t_new)
+
+	t0 = time.perf_counter()
+	legacy = [legacy_pair(A[k], B[k]) for k in range(nLegacy)]
+	t_old = (time.perf_counter() - t0)*nPairs/nLegacy
+	print('per-gene loops: %.1f s (%d pairs timed, scaled to %d)' % (t_old, nLegacy, nPairs))
+	print('speedup: %.0fx' % (t_old/t_new))
+
+	for k, (tscoreArray, pvalueArray, order, qVals, sort_qVal) in enumerate(legacy):
+		print('pair', k, 't max relative difference %g, p %g, q %g, adjusted q %g' % (max_relative_difference(tscoreArray, t[k]), max_relative_difference(pvalueArray, p[k]),
+			max_relative_difference(qVals, q[k][order]), max_relative_difference(sort_qVal, adjusted[k][order])))
+	sp_t1, sp_p1 = stats.ttest_1samp(A, popmean=0, axis=-1)
+	sp_tw, sp_pw = stats.ttest_ind(A, B, axis=-1, equal_var=False)
+	print('one sample vs scipy: t %g, p %g' % (max_relative_difference(sp_t1, t1), max_relative_difference(sp_p1, p1)))
+	print('Welch vs scipy: t %g, p %g' % (max_relative_difference(sp_tw, tw), max_relative_difference(sp_pw, pw)))
+	print('mean Storey pi0: %.3f' % np.mean(bst.storey_pi0(p)))
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os
+
+# Synthetic all.poolcount generator, for timing the python stages without a sequencing run.
+#
+#	Strains are placed on the genes of a genes.gc table (KT2440_genes.gc by default), with the number of strains of each gene drawn around a mean
+#	proportional to the gene length, and a fraction of intergenic strains (no locusId or f). Each strain has an abundance in the
+#	library (log-normal); the counts of each count column are negative binomial around abundance x depth x 2^fitness, where the fitness of each
+#	gene is 0 in the baseline (set 1) and, in the test conditions, 0 for most genes and drawn from a normal distribution (mostly negative) for the
+#	others, shared by the replicates of a condition. A few genes have no insertions at all, as essential genes would.
+#	The count columns are named <set><replicate>.IDX<set><replicate>, and the matching experiment metadata file (SetName, Index) is written next to it.
+#
+# Usage:
+#	python3 PATH/Benchmarks/synthetic_pool.py <output directory> <kwargs>
+#
+#	Optional kwargs (given as name=value):
+#		strains=100000		number of strains
+#		genes=0				number of genes, taken from the start of genes.gc (0: all)
+#		sets=4				number of sets, the first being the baseline
+#		replicates=ABC		replicate letters of each set
+#		intergenic=0.2		fraction of intergenic strains
+#		depth=30			mean baseline reads per strain
+#		dispersion=2		negative binomial size parameter of the counts (lower is noisier)
+#		effects=0.1			fraction of genes with a fitness effect in each test condition
+#		essential=0.05		fraction of genes without insertions
+#		seed=0
+#		genes_file=PATH		genes.gc table (default KT2440_Files/KT2440_genes.gc)
+#
+# Output files:
+#	all.poolcount and exps.tsv in the output directory
+
+default_genes_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'KT2440_Files', 'KT2440_genes.gc')
+
+
+# Synthetic all.poolcount table and experiment metadata table (SetName, Index)
+def synthetic_pool(nStrains, nGenes=0, nSets=4, replicates='ABC', intergenic=0.2, depth=30, dispersion=2, effects=0.1, essential=0.05, seed=0,
+		genesFile=default_genes_file):
+	rng = np.random.default_rng(seed)
+	Genes = pd.read_csv(genesFile, sep='\t', usecols=['locusId', 'scaffoldId', 'begin', 'end', 'strand'])
+	if nGenes:
+		Genes = Genes.iloc[:nGenes]
+	begin = Genes['begin'].to_numpy()
+	end = Genes['end'].to_numpy()
+
+	# in-gene strains: genes picked in proportion to their length (genes without insertions left out), then sorted by position
+	nInGenes = int(round(nStrains*(1 - intergenic)))
+	weights = (end - begin + 1)*(rng.random(len(Genes)) >= essential)
+	gene = rng.choice(len(Genes), size=nInGenes, p=weights/weights.sum())
+	pos = begin[gene] + (rng.random(nInGenes)*(end[gene] - begin[gene] + 1)).astype(np.int64)
+	f = np.where(Genes['strand'].to_numpy()[gene] == '+', (pos - begin[gene])/(end[gene] - begin[gene] + 1), (end[gene] - pos)/(end[gene] - begin[gene] + 1))
+
+	# intergenic strains, anywhere on the scaffold of a random gene
+	other = rng.integers(0, len(Genes), size=nStrains - nInGenes)
+	other_pos = rng.integers(1, end.max() + 1, size=len(other))
+
+	# random 20 nt barcodes and their reverse complements
+	bases = rng.integers(0, 4, size=(nStrains, 20))
+	barcode = np.frombuffer(b'ACGT', dtype='S1')[bases].view('S20').ravel().astype(str)
+	rcbarcode = np.frombuffer(b'TGCA', dtype='S1')[bases[:,::-1]].view('S20').ravel().astype(str)
+
+	Pool = pd.DataFrame({'barcode': barcode, 'rcbarcode': rcbarcode,
+		'scaffold': np.concatenate([Genes['scaffoldId'].to_numpy()[gene], Genes['scaffoldId'].to_numpy()[other]]),
+		'strand': rng.choice(['+', '-'], size=nStrains), 'pos': np.concatenate([pos, other_pos]),
+		'locusId': np.concatenate([Genes['locusId'].to_numpy()[gene], np.full(len(other), np.nan, dtype=object)]),
+		'f': np.concatenate([np.round(f, 3), np.full(len(other), np.nan)])})
+	Pool = Pool.sort_values(['scaffold', 'pos'], kind='stable').reset_index(drop=True)
+
+	# counts: negative binomial around abundance x depth x 2^fitness
+	gene_of_strain = pd.Index(Genes['locusId']).get_indexer(Pool['locusId'])
+	abundance = rng.lognormal(0, 1, size=nStrains)
+	abundance = abundance/abundance.mean()
+	SetNames = []
+	for s in range(1, nSets+1):
+		fitness = np.zeros(len(Genes))
+		if s > 1:
+			affected = rng.random(len(Genes)) < effects
+			fitness[affected] = rng.normal(-1.5, 1.5, size=np.count_nonzero(affected))
+		strain_fitness = np.where(gene_of_strain >= 0, fitness[gene_of_strain], 0)
+		mean = abundance*depth*2**strain_fitness
+		for replicate in replicates:
+			SetName = str(s) + replicate
+			Pool[SetName+'.IDX'+SetName] = rng.negative_binomial(dispersion, dispersion/(dispersion + mean)).astype(np.int64)
+			SetNames.append(SetName)
+	return Pool, pd.DataFrame({'SetName': SetNames, 'Index': ['IDX'+SetName for SetName in SetNames]})
+
+# Write a synthetic pool as all.poolcount and exps.tsv in out_dir. Returns the paths of both files.
+def write_pool(out_dir, nStrains, **kwargs):
+	Pool, Exps = synthetic_pool(nStrains, **kwargs)
+	os.makedirs(out_dir, exist_ok=True)
+	poolFile = os.path.join(out_dir, 'all.poolcount')
+	expsFile = os.path.join(out_dir, 'exps.tsv')
+	Pool.to_csv(poolFile, sep='\t', index=False)
+	Exps.to_csv(expsFile, sep='\t', index=False)
+	return poolFile, expsFile
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <output directory> <kwargs>")
+		sys.exit(0)
+
+	kwargs = dict(arg.split('=') for arg in sys.argv[2:])
+	poolFile, expsFile = write_pool(sys.argv[1], int(kwargs.get('strains', 100000)), nGenes=int(kwargs.get('genes', 0)), nSets=int(kwargs.get('sets', 4)),
+		replicates=kwargs.get('replicates', 'ABC'), intergenic=float(kwargs.get('intergenic', 0.2)), depth=float(kwargs.get('depth', 30)),
+		dispersion=float(kwargs.get('dispersion', 2)), effects=float(kwargs.get('effects', 0.1)), essential=float(kwargs.get('essential', 0.05)),
+		seed=int(kwargs.get('seed', 0)), genesFile=kwargs.get('genes_file', default_genes_file))
+	print('Wrote', poolFile, 'and', expsFile)
@@ -4,6 +4,10 @@ import pandas as pd
 import sys, os
 import matplotlib.pyplot as plt
 import seaborn as sns
+import BarSeq_Annotate as ba
+import BarSeq_Cluster as bcl
+import BarSeq_Metrics as bm
+import BarSeq_Results as br
 from distutils.util import strtobool
 
 #This allows you to change text in illustrator for the PDFs exported in this function
@@ -18,14 +22,22 @@ plt.rcParams.update({'font.sans-serif':'Arial'})
 #Example call:
  #
  #	#python3 10_heatmap.py <PATH/Included_Genes_List_File.csv> <PATH to Annoted genes file>
+ #	#python3 10_heatmap.py <PATH/Included_Genes_List_File.csv> results=<PATH/BL_1/results> reference=<condition> features=<PATH/feature_table.txt>
  #
  #	Note, all the optional inputs below can be declared in the command line to change the heatmap output as desired.
+ #		engine=fast clusters with BarSeq_Cluster.py (blockwise condensed distances, fastcluster if installed) instead of seaborn, for genome-wide heatmaps,
+ #		with reduce=pca or reduce=random to first reduce the fitness values of each gene (or condition) to components=20 dimensions. The linkage is saved in
+ #		heatmap_'Genes_n_Conditions_Filename'.linkage (cache=False to skip), so re-rendering with another cmap, font_scale or figsize does not cluster again.
+ #		results=PATH builds the heatmap from the results store of a baseline written by BarSeq_Pipeline.py (see BarSeq_Results.py) instead of the
+ #		Annotated_Summary files, reading only the listed genes and conditions (the condition names of the store, e.g. 4) from it: the replicates of the
+ #		reference condition (if given, as the glucose only baseline of the Annotated_Summary files) and of each condition, as <condition>_Rep<letter> columns.
+ #		The rows are labelled with the gene names and descriptions of the features=PATH table (as in 9_Summary_annotate.py), by locus tag without it.
  #
  #
  #	Input File:
  #		Included_Genes_List_File -- A file where the first column is the a list of genes the user desires to include in the heatmap output. These become row in the heatmap
  #									The second column is a list of conditions files to include in the heatmap output as columns. Note, this abstracts from the Annotated_Summary Files
- #									Pay particular notcie to the code at Lines 71 and 123, since if your input file isn't named appropriately, this function will break
+ #									Pay particular notcie to condition_file, since if your input files aren't named appropriately, this function will break
  #									Note, replicates are added individually as a column
  #										There is no functionality to use the mean of a particular condition and present it as a column in the heatmap output 
  #
@@ -35,7 +47,67 @@ plt.rcParams.update({'font.sans-serif':'Arial'})
  #		
  #
 
-def main(Genes_n_Conditions_File,Input_Fitfile_Dir_Path, font_scale=1.0, method='average', metric='euclidean', robust='True', figheight=8, figwidth=8, cmap='RdBu', center=0, col_cluster='False', row_cluster='True', linewidths=0 , linecolor='black'):
+# Path of the Annotated_Summary file of a condition (the glucose only baseline compared to the condition)
+def condition_file(Input_Fitfile_Dir_Path, condition):
+	return Input_Fitfile_Dir_Path+'/M9_Glucose_v_M9_'+condition+'_Annotated_Summary.csv'
+
+# Load an Annotated_Summary file once: its header (as written, without renaming repeated column names) and the locus tag, gene name, description and replicate
+#	fitness columns of its rows, the fitness columns parsed as floats, with the first row of each locus tag indexed for hashed lookups
+def load_fitness_file(current_file_name):
+	Header = np.array(pd.read_csv(current_file_name, header=None, nrows=1).iloc[0], dtype=str)
+	current_file = pd.read_csv(current_file_name, header=None, skiprows=1, usecols=[0,2,3,4,5,6,8,9,10], float_precision='round_trip')
+	current_file.index = pd.Index(np.array(current_file[0], dtype=str))
+	return Header, current_file[~current_file.index.duplicated()]
+
+# Heatmap row label of each gene found in a file: locus tag, gene name and description (spaces replaced by underscores), with the [, ] and ' characters of
+#	the array repr used to build the labels removed as they always were, so the labels match those of earlier heatmaps
+def gene_labels(Genes, Gene_Names, Descriptions):
+	return [(gene+'('+repr(name)+')'+': '+repr(description.replace(' ','_').replace('/','--'))).replace('--','/').replace('[','').replace(']','').replace('\'','')
+		for gene, name, description in zip(Genes, Gene_Names, Descriptions)]
+
+# Fitness matrix of the heatmap: the glucose and condition replicate fitness values of the first condition file, then the condition replicate values of the
+#	other files, as float columns (NaN where a gene is not in a file), with one row per gene, labelled from the last condition file. Each file is read
+#	once and all the genes are looked up at once in its locus tag index.
+def heatmap_matrix(Genes, Conditions, Input_Fitfile_Dir_Path):
+	Columns = []
+	Condition_Labels = []
+	for i, condition in enumerate(Conditions):
+		Header, current_file = load_fitness_file(condition_file(Input_Fitfile_Dir_Path, condition))
+		Rows = current_file.reindex(Genes)
+		replicate_columns = list(range(4,7))+list(range(8,11)) if i == 0 else list(range(8,11))
+		Columns.extend(Rows[column].to_numpy(dtype=float) for column in replicate_columns)
+		Condition_Labels.extend(Header[replicate_columns])
+
+	# genes missing from the last file keep their locus tag as label
+	found = current_file.index.get_indexer(Genes) >= 0
+	Labels = np.array(Genes, dtype=object)
+	Labels[found] = gene_labels(Genes[found].tolist(), np.array(Rows[2][found], dtype=str).tolist(), np.array(Rows[3][found], dtype=str).tolist())
+	return pd.DataFrame(np.column_stack(Columns), columns=Condition_Labels, index=pd.Index(Labels, name='Genes'))
+
+# Fitness matrix of the heatmap from a results store instead of the condition files: the replicate fitness values of the reference condition (if given) and of
+#	each condition, as float columns (NaN where a gene is not in the merged table of a condition, or not in the store), with only the slices of the listed
+#	genes and conditions read from the store, and the rows labelled from the annotation index of a feature table (BarSeq_Annotate.py) if one is given
+def results_matrix(Genes, Conditions, Results, reference='', Features=None):
+	present = Results['genes'].get_indexer(pd.Index(Genes)) >= 0
+	Selected = br.select(Results, genes=Genes[present], conditions=([reference] if reference else [])+list(Conditions))
+	Columns = []
+	Condition_Labels = []
+	for c, condition in enumerate(Selected['conditions']):
+		merged = Selected['positions'][c] >= 0
+		for replicate in Selected['condition_replicates'][c]:
+			values = np.full(len(Genes), np.nan)
+			values[present] = np.where(merged, Selected['normGeneFit'][c, :, Selected['replicates'].index(replicate)], np.nan)
+			Columns.append(values)
+			Condition_Labels.append(condition+'_Rep'+replicate)
+
+	# blank gene names and descriptions are labelled nan, as when read back from the Annotated_Summary files
+	Labels = np.array(Genes, dtype=object)
+	if Features is not None:
+		Annotated = ba.annotate(pd.DataFrame(index=pd.Index(Genes)), Features).replace('', np.nan)
+		Labels[:] = gene_labels(list(Genes), np.array(Annotated['gene_name'], dtype=str).tolist(), np.array(Annotated['description'], dtype=str).tolist())
+	return pd.DataFrame(np.column_stack(Columns), columns=Condition_Labels, index=pd.Index(Labels, name='Genes'))
+
+def main(Genes_n_Conditions_File,Input_Fitfile_Dir_Path='', font_scale=1.0, method='average', metric='euclidean', robust='True', figheight=8, figwidth=8, cmap='RdBu', center=0, col_cluster='False', row_cluster='True', linewidths=0 , linecolor='black', engine='seaborn', reduce='none', components=20, cache='True', results='', reference='', features=''):
 
 	#set appropriate **kwargs to ints, floats, bools, or arrays
 	font_scale=float(font_scale)
@@ -47,6 +119,8 @@ def main(Genes_n_Conditions_File,Input_Fitfile_Dir_Path, font_scale=1.0, method=
 	col_cluster=strtobool(col_cluster)
 	row_cluster=strtobool(row_cluster)
 	linewidths = int(linewidths)
+	components = int(components)
+	cache=strtobool(cache)
 
 	# load the .csv file with pandas, reading all rows and columns, including headers and convert to np array 
 	Whole_File = pd.read_csv(Genes_n_Conditions_File, header=None)
@@ -56,119 +130,24 @@ def main(Genes_n_Conditions_File,Input_Fitfile_Dir_Path, font_scale=1.0, method=
 	Genes = np.array(Whole_File[1:,0],dtype=str)
 	Conditions = np.array(Whole_File[1:,1],dtype=str)
 
+	# the gene list ends at the first blank gene, and the condition list (after the first condition) at the first blank condition, since the two columns
+	# of the input file can have different lengths
+	Genes = Genes[:list(Genes).index('')] if '' in Genes else Genes
+	Conditions = Conditions[:1+list(Conditions[1:]).index('')] if '' in Conditions[1:] else Conditions
+
 #######################################################################################################################################################################################
-# For each gene, navigate to each file for the conditions listed in the input file and add the fitness values into an array
+# For each condition file, look up the fitness values of every gene at once and add them into a float array
 #	the array format is conditions and replicates across columns and different genes down rows
 #######################################################################################################################################################################################
 
-	#Start building the numpy fitness value array. For this, iterate through each condition file and extract fitness values for the designated genes
-	# for the first dfitness file, also extract the glucose alone fitness values
-	fitness_array =[]
-	condition_counter = 1 	#This is a counter to keep track of whether this is the first fitness file or not
-	for i in range(0, len(Conditions)):
-		if condition_counter == 1: 
-			current_file_name= Input_Fitfile_Dir_Path+'/M9_Glucose_v_M9_'+Conditions[i]+'_Annotated_Summary.csv'
-			current_file = pd.read_csv(current_file_name, header=None)
-			current_file = np.array(current_file[:])
-			genes_list = np.array(current_file[1:,0],dtype=str)
-			Description_List = np.array(current_file[1:,3],dtype=str)
-			Gene_Names = np.array(current_file[1:,2],dtype=str)
-			glucose_fitness = np.array(current_file[1:,4:7], dtype=float)
-			condition_fitness = np.array(current_file[1:,8:11], dtype=float)
-			Rep_labels = np.append(np.array(current_file[0,4:7], dtype=str),np.array(current_file[0,8:11],dtype=str))
-			
-			#Build an array for the Condition Labels, extracted from the input file
-			Condition_Labels = Rep_labels
-			
-			#add the matching fitness values for this condition (and glucose) into seperate arrays for each replicate for all the genes listed in the heatmap input file
-			GluA = []
-			GluB = []
-			GluC = []
-			CondA = []
-			CondB = []
-			CondC = []
-			NEW_Description=[]
-			for j in range(0, len(Genes)):
-				if len(Genes[j]) < 1:  #This happens if there are less genes than conditions in the file
-					break
-				if Genes[j] not in genes_list: #Not all genes may exist in all datasets, if this happens fill with fitness_array with blank cells and move to next gene
-					GluA = np.append(GluA, '')
-					GluB = np.append(GluB, '')
-					GluC = np.append(GluC, '')
-					CondA = np.append(CondA, '')
-					CondB = np.append(CondB, '')
-					CondC = np.append(CondC, '') 
-					NEW_Description = np.append(NEW_Description, Genes[j])  #This accounts for if the locus ID and associated description is not present in the fitness files
-					continue
-				a = np.where(genes_list == Genes[j])
-				GluA = np.append(GluA, glucose_fitness[a,0])
-				GluB = np.append(GluB, glucose_fitness[a,1])
-				GluC = np.append(GluC, glucose_fitness[a,2])
-				CondA = np.append(CondA, condition_fitness[a,0])
-				CondB = np.append(CondB, condition_fitness[a,1])
-				CondC = np.append(CondC, condition_fitness[a,2])
-				
-				#The following .replace lines are my work around for in the description contains a forward slash in the string and also replaces spaces with underscores
-				Gene_Description = str(np.char.replace(Description_List[a],' ','_')) 
-				Gene_Description = str(np.char.replace(Gene_Description,'/','--'))
-				NEW_Description=np.append(NEW_Description,np.char.replace([Genes[j]+'('+str(Gene_Names[a])+')'+': '+Gene_Description],'--','/')) #The forward slash is added back in for the descriptions that contain them
-				
-				# I was having issues with ' and [] symbols showing up in the merged strings, so this was my crude work-around
-				NEW_Description=np.char.replace(NEW_Description,'[','')
-				NEW_Description=np.char.replace(NEW_Description,']','')
-				NEW_Description=np.char.replace(NEW_Description,'\'','')
-			fitness_array = np.column_stack((GluA,GluB,GluC,CondA,CondB,CondC))
-			condition_counter = condition_counter+1
+	with bm.stage('load', rows_in=len(Genes), conditions=len(Conditions)) as record:
+		if results:
+			Full_array = results_matrix(Genes, Conditions, br.open_results(results), reference, ba.load_index(features) if features else None)
 		else:
-			if len(Conditions[i]) < 1:  #This happens if there are less conditions than genes in the file
-				break
-			current_file_name= Input_Fitfile_Dir_Path+'/M9_Glucose_v_M9_'+Conditions[i]+'_Annotated_Summary.csv'
-			current_file = pd.read_csv(current_file_name, header=None)
-			current_file = np.array(current_file[:])
-			genes_list = np.array(current_file[1:,0],dtype=str)
-			Description_List = np.array(current_file[1:,3],dtype=str)
-			Gene_Names = np.array(current_file[1:,2],dtype=str)
-			condition_fitness = np.array(current_file[1:,8:11], dtype=float)
-			Rep_labels=[]
-			Rep_labels = np.append(Rep_labels,np.array(current_file[0,8:11],dtype=str))
-			Condition_Labels = np.append(Condition_Labels,Rep_labels)
-			CondA = []
-			CondB = []
-			CondC = []
-			NEW_Description=[]
-			for j in range(0, len(Genes)):
-				if len(Genes[j]) < 1:  #This happens if there are less genes than conditions in the file
-					break
-				if Genes[j] not in genes_list: #Not all genes may exist in all datasets, if this happens fill with fitness_array with blank cells and move to next gene
-					CondA = np.append(CondA, '')
-					CondB = np.append(CondB, '')
-					CondC = np.append(CondC, '')
-					NEW_Description = np.append(NEW_Description, Genes[j]) # This accounts for if the locus ID and associated description is not present in the fitness files
-					continue
-				a = np.where(genes_list == Genes[j])
-				CondA = np.append(CondA, condition_fitness[a,0])
-				CondB = np.append(CondB, condition_fitness[a,1])
-				CondC = np.append(CondC, condition_fitness[a,2])
-
-				#The following .replace lines are my work around for in the description contains a forward slash in the string and also replaces spaces with underscores
-				Gene_Description = str(np.char.replace(Description_List[a],' ','_')) 
-				Gene_Description = str(np.char.replace(Gene_Description,'/','--'))
-				NEW_Description=np.append(NEW_Description,np.char.replace([Genes[j]+'('+str(Gene_Names[a])+')'+': '+Gene_Description],'--','/')) #The forward slash is added back in for the descriptions that contain them
-
-				# I was having issues with ' and [] symbols showing up in the merged strings, so this was my crude work-around
-				NEW_Description=np.char.replace(NEW_Description,'[','')
-				NEW_Description=np.char.replace(NEW_Description,']','')
-				NEW_Description=np.char.replace(NEW_Description,'\'','')
-
-			fitness_array = np.column_stack((fitness_array,CondA,CondB,CondC))
-			condition_counter = condition_counter+1
-	
-	#Make a dataframe for all the data with 'Genes' as the row label and 'Condition' as the column label
+			Full_array = heatmap_matrix(Genes, Conditions, Input_Fitfile_Dir_Path)
+		record['rows_out'] = len(Full_array)
 
-	Full_array = pd.DataFrame(fitness_array,columns=Condition_Labels,index=NEW_Description)
-	Full_array.index.name='Genes'
-	
-	#Deterimine file name from input file name and save csv table for heatmap
+	#Deterimine file name from input file name and save csv table for heatmap (an export only, the heatmap is built from the array itself)
 	output_file = 'heatmap_'+Genes_n_Conditions_File.split('/')[-1]
 	Full_array.to_csv(output_file)
 	
@@ -176,23 +155,35 @@ def main(Genes_n_Conditions_File,Input_Fitfile_Dir_Path, font_scale=1.0, method=
 # GENERATE HEATMAP USING SEABORN
 ####################################################################################################################################################################################################################
 
-	Heatmap_File = pd.read_csv(output_file, na_values="NaN")
-	Heatmap_File = Heatmap_File.dropna(how='any') # drops all rows with NaNs, since these can't exist in a heatmap
-	Heatmap_File= Heatmap_File.set_index('Genes')
+	Heatmap_File = Full_array.dropna(how='any') # drops all rows with NaNs, since these can't exist in a heatmap
 	Heatmap_File.columns.name='Conditions'
 
-	#build the seaborn heatmap (cluster map)
-	sns.set(font_scale=font_scale)
-	clustered_HM = sns.clustermap(Heatmap_File, method=method, metric=metric, robust=robust, figsize=figsize, cmap=cmap, center=center, col_cluster=col_cluster, row_cluster=row_cluster, linewidths=linewidths , linecolor=linecolor)
+	#with engine=fast, the rows (and columns) are clustered by BarSeq_Cluster.py (or the linkage read back from the cache) and seaborn only draws the dendrograms
+	row_linkage = None
+	col_linkage = None
+	if engine == 'fast':
+		cache_dir = output_file.split('.csv')[0]+'.linkage' if cache else None
+		with bm.stage('cluster', rows_in=len(Heatmap_File), method=method, metric=metric, reduce=reduce):
+			if row_cluster:
+				row_linkage = bcl.cached_linkage(Heatmap_File.values, method, metric, reduce, components, cache_dir)
+			if col_cluster:
+				col_linkage = bcl.cached_linkage(Heatmap_File.values.T, method, metric, reduce, components, cache_dir)
+
+	#build the seaborn heatmap (cluster map), which also clusters the rows and columns with engine=seaborn
+	with bm.stage('clustermap', rows_in=len(Heatmap_File), engine=engine):
+		sns.set(font_scale=font_scale)
+		clustered_HM = sns.clustermap(Heatmap_File, method=method, metric=metric, robust=robust, figsize=figsize, cmap=cmap, center=center, col_cluster=col_cluster, row_cluster=row_cluster, linewidths=linewidths , linecolor=linecolor, row_linkage=row_linkage, col_linkage=col_linkage)
 
 	output_file = output_file.split('.csv')[0]+'.pdf'
-	plt.savefig(output_file, dpi = 300)
+	with bm.stage('savefig'):
+		plt.savefig(output_file, dpi = 300)
 
 	#, pivot_kws={'index':'Genes', 'columns':'Conditions'}
 
 
 if __name__=='__main__':
+	paths = [arg for arg in sys.argv[2:3] if '=' not in arg]   #Annotated_Summary files directory (left out with results=PATH)
 	main(sys.argv[1],
-		sys.argv[2],   #required compare file name
-		**dict(arg.split('=') for arg in sys.argv[3:])) # take in optional kwargs
+		*paths,
+		**dict(arg.split('=') for arg in sys.argv[2+len(paths):])) # take in optional kwargs
 
@@ -1,23 +1,39 @@
 #!/usr/bin/python3
 import numpy as np
 import pandas as pd
-import sys, os
+import sys, os, glob
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
-from adjustText import adjust_text
 from distutils.util import strtobool
+import BarSeq_Compare as bcmp
+import BarSeq_Labels as bl
+import BarSeq_Metrics as bm
+import BarSeq_Results as br
 
 #This allows you to change text in illustrator for the PDFs exported in this function
 plt.rcParams['pdf.fonttype'] = 42
 #This changes the sans-serif font output for plots to Arial
 plt.rcParams.update({'font.sans-serif':'Arial'})
 
+#Number of genes above which rasterized='auto' draws the points as an image
+rasterize_above = 20000
+
 #####
 #Generate a scatterplot using the comparison summary data from 6A_Gene_Annotate and color any values where the y-condition (test) differs from the x-condition (reference) 
 #####
 
 # Usage:
 #	python3 PATH/11_2D_Graph.py <PATH/Annotated_Summary.csv> <kwags>
+#	python3 PATH/11_2D_Graph.py <PATH/directory> workers=N <kwags>		renders every _Annotated_Summary.csv file of the directory, in N worker processes
+#																		(default: one per CPU), with the same kwargs
+#
+#	rasterized=auto draws the points as an image inside the PDF (at 300 dpi) for comparisons of more than 20,000 genes (True or False to choose)
+#	label_mode=grid places the labels with BarSeq_Labels.py instead of adjust_text, for many labels (e.g. Show_Sig_Labels=True with a permissive q_val_cutoff):
+#		at most label_iterations=50 repulsion iterations between neighbouring labels and points (and at most label_time seconds, if given), then a
+#		deterministic greedy placement of the labels still overlapping
+#	results=PATH/BL_1/results compares the two conditions named by the file name (e.g. 2_v_3, no file needed) from the results store of the baseline
+#		written by BarSeq_Pipeline.py (see BarSeq_Results.py), reading only these two conditions from it, instead of reading the Annotated_Summary file
 #
 # Input File:
 #	Annotated_Summary.csv- File generated as output from the 9_Summary_annotate.py function
@@ -26,9 +42,21 @@ plt.rcParams.update({'font.sans-serif':'Arial'})
 #	'Annotated_Summary_identifier'_<q_val_cutoff>.pdf -- PDF of a scatterplot named according to the name of the Annotated_Summary file used as input,
 #		where the q value cutoff used to flag significant genes is also provided in the title
 
+# Gene IDs (locus tags), mean fitness values of each condition and adjusted q-values of a comparison: the columns of its Annotated_Summary .csv file,
+#	read with pandas (the numbers parsed as floats), or with a results store, the comparison of the two conditions as 8_Fitness_Compare.py computes
+#	it (the same genes, order and values), from the store slices of these two conditions only
+def load_comparison(Compare_File, Cond1Label, Cond2Label, results=''):
+	if results:
+		Pair = bcmp.compare_pairs(br.fitness_tensor(br.open_results(results), [Cond1Label, Cond2Label]), [(Cond1Label, Cond2Label)])
+		return (np.array(Pair['Locus_Tag'], dtype=str), Pair['Condition_1_mean'].to_numpy(dtype=float), Pair['Condition_2_mean'].to_numpy(dtype=float),
+			Pair['adjusted_q-value'].to_numpy(dtype=float))
+	Whole_File = pd.read_csv(Compare_File, header=None, skiprows=1, usecols=[0,7,11,15], float_precision='round_trip')
+	return np.array(Whole_File[0],dtype=str), Whole_File[7].to_numpy(dtype=float), Whole_File[11].to_numpy(dtype=float), Whole_File[15].to_numpy(dtype=float)
+
 def main(Compare_File, q_val_cutoff=0.1, Show_Sig_Labels='False', Additional_Genes_Labeled='', force_text_val=.2, force_points_val=10, label_font=6, label_color='blue', 
 	arrow_color='blue', nonsig_marker = '.', sig_marker='*', diff_between=1.5, high_marker_color='cyan', low_marker_color='r', marker_size='18', 
-	yequalsx_line='False', yequalsx_line_style = '-', yequalsx_line_color= 'blue', fitness_diff_line_style = '--', fitness_diff_line_color = 'red'):
+	yequalsx_line='False', yequalsx_line_style = '-', yequalsx_line_color= 'blue', fitness_diff_line_style = '--', fitness_diff_line_color = 'red', rasterized='auto',
+	label_mode='adjust', label_iterations=50, label_time='', results=''):
 	#Break apart the Additional_Genes_Labeled and arrange into a numpy array
 	Additional_GeneLabels =[]
 	if len(Additional_Genes_Labeled)>0:
@@ -43,6 +71,8 @@ def main(Compare_File, q_val_cutoff=0.1, Show_Sig_Labels='False', Additional_Gen
 	diff_between=float(diff_between)
 	yequalsx_line=strtobool(yequalsx_line)
 	Show_Sig_Labels=strtobool(Show_Sig_Labels)
+	label_iterations=int(label_iterations)
+	label_time=float(label_time) if label_time != '' else None
 
 	#Derive labels for the graph from the Compare_File name
 	noPath_label=Compare_File.split("/")[-1]
@@ -50,81 +80,32 @@ def main(Compare_File, q_val_cutoff=0.1, Show_Sig_Labels='False', Additional_Gen
 	long_Cond2Label=noPath_label.split("_v_")[1]
 	Cond2Label=long_Cond2Label.split("_Annotated")[0]
 
-	# load the .csv files with pandas, reading all rows and columns, including headers and convert to np array 
-	Whole_File = pd.read_csv(Compare_File, header=None)
-	Whole_File = np.array(Whole_File[:])
+	with bm.stage('load', comparison=Cond1Label+'_v_'+Cond2Label) as record:
+		GenesIDs, meansA, meansB, sort_qVal = load_comparison(Compare_File, Cond1Label, Cond2Label, results)
+		record['rows_out'] = len(GenesIDs)
 
-	#Extract out gene IDs (locus tags), mean fitness values, and q-scores
-	GenesIDs = np.array(Whole_File[1:,0],dtype=str)
-	meansA = np.array(Whole_File[1:,7],dtype=float)
-	meansB = np.array(Whole_File[1:,11],dtype=float)
-	sort_qVal = np.array(Whole_File[1:,15],dtype=float)
+	#each comparison is drawn on its own figure, so several can be rendered in one process
+	figure = plt.figure()
 
 	#plot points where Cond2-Cond1 > 1 in blue
 	#plot points where Cond2-Cond1 < -1 in red
 	#plot points where 1 > Cond2-Cond1 > -1
-	#This populates seperate arrays form performing this during plotting
-	Difference = []
-
-	high_test_x_noSig =[]
-	high_test_y_noSig =[]
-	high_test_x_Sig =[]
-	high_test_y_Sig =[]
-	high_test_sig_labels =[]
-
-	low_test_x_noSig =[]
-	low_test_y_noSig =[]
-	low_test_x_Sig =[]
-	low_test_y_Sig =[]
-	low_test_sig_labels =[]
-
-
-	equal_test_x_noSig =[]
-	equal_test_y_noSig =[]
-	equal_test_x_Sig =[]
-	equal_test_y_Sig =[]
-
-	for i in range(0, len(GenesIDs)):
-		Difference = np.append(Difference, meansB[i] - meansA[i])
-
-		if Difference[i] > diff_between and sort_qVal[i] > q_val_cutoff:
-			high_test_x_noSig = np.append(high_test_x_noSig,meansA[i])
-			high_test_y_noSig = np.append(high_test_y_noSig,meansB[i])
-
-		if Difference[i] > diff_between and sort_qVal[i] < q_val_cutoff:
-			high_test_x_Sig = np.append(high_test_x_Sig,meansA[i])
-			high_test_y_Sig = np.append(high_test_y_Sig,meansB[i])
-			high_test_sig_labels = np.append(high_test_sig_labels,GenesIDs[i])
-
-		if Difference[i] < -diff_between and sort_qVal[i] > q_val_cutoff:
-			low_test_x_noSig = np.append(low_test_x_noSig,meansA[i])
-			low_test_y_noSig = np.append(low_test_y_noSig,meansB[i])
-
-		if Difference[i] < -diff_between and sort_qVal[i] < q_val_cutoff:
-			low_test_x_Sig = np.append(low_test_x_Sig,meansA[i])
-			low_test_y_Sig = np.append(low_test_y_Sig,meansB[i])
-			low_test_sig_labels= np.append(low_test_sig_labels,GenesIDs[i])
-
-		if Difference[i] < diff_between and Difference[i] > -diff_between and sort_qVal[i] > q_val_cutoff:
-			equal_test_x_noSig = np.append(equal_test_x_noSig,meansA[i])
-			equal_test_y_noSig = np.append(equal_test_y_noSig,meansB[i])
-
-		if Difference[i] < diff_between and Difference[i] > -diff_between and sort_qVal[i] < q_val_cutoff:
-			equal_test_x_Sig = np.append(equal_test_x_Sig,meansA[i])
-			equal_test_y_Sig = np.append(equal_test_y_Sig,meansB[i])
-
-	#plot points where Cond2-Cond1 > diff_between in cyan and not significant with circles
-	plt.scatter(high_test_x_noSig, high_test_y_noSig, color=high_marker_color, marker=nonsig_marker, s=marker_size, lw=0)
-	#plot points where Cond2-Cond1 > diff_between in cyan and not significant with stars
-	plt.scatter(high_test_x_Sig, high_test_y_Sig, color=high_marker_color, marker=sig_marker, s=marker_size, lw=0)
-	#plot points where Cond2-Cond1 < -diff_between in red and not significant with circles
-	plt.scatter(low_test_x_noSig, low_test_y_noSig, color=low_marker_color, marker=nonsig_marker, s=marker_size, lw=0)
-	#plot points where Cond2-Cond1 < -diff_between in red and not significant with stars
-	plt.scatter(low_test_x_Sig, low_test_y_Sig, color=low_marker_color, marker=sig_marker, s=marker_size, lw=0)
-	#plot points where diff_between > Cond2-Cond1 > -diff_between in black and not significant with circles
-	plt.scatter(equal_test_x_noSig, equal_test_y_noSig, color='k', marker=nonsig_marker, s=marker_size, lw=0)
-	#plot points where diff_between > Cond2-Cond1 > -diff_between in black and not significant with stars
-	plt.scatter(equal_test_x_Sig, equal_test_y_Sig, color='k', marker=sig_marker, s=marker_size, lw=0)
+	#Each gene is classified at once with boolean masks over the means and q-values (genes with a q-value or difference right at the cutoffs are not plotted)
+	Difference = meansB - meansA
+	high = Difference > diff_between
+	low = Difference < -diff_between
+	equal = (Difference < diff_between) & (Difference > -diff_between)
+	noSig = sort_qVal > q_val_cutoff
+	Sig = sort_qVal < q_val_cutoff
+	high_test_sig_labels = GenesIDs[high & Sig]
+	low_test_sig_labels = GenesIDs[low & Sig]
+
+	#draw each category as one point layer: Cond2-Cond1 > diff_between in cyan, < -diff_between in red, in between in black, with circles when not
+	#significant and stars when significant. Large sets are rasterized (at the dpi of the PDF) so the PDF stays small and quick to draw
+	rasterized = len(GenesIDs) > rasterize_above if rasterized == 'auto' else strtobool(rasterized)
+	for category, color in ((high, high_marker_color), (low, low_marker_color), (equal, 'k')):
+		plt.scatter(meansA[category & noSig], meansB[category & noSig], color=color, marker=nonsig_marker, s=marker_size, lw=0, rasterized=rasterized)
+		plt.scatter(meansA[category & Sig], meansB[category & Sig], color=color, marker=sig_marker, s=marker_size, lw=0, rasterized=rasterized)
 
 	#Fill in the Title and the axes titles
 	plt.title(Cond1Label+' vs '+Cond2Label, fontsize=12)
@@ -167,19 +148,27 @@ def main(Compare_File, q_val_cutoff=0.1, Show_Sig_Labels='False', Additional_Gen
 		Sig_GeneLabels =[]
 	GeneLabels=np.append(Additional_GeneLabels,Sig_GeneLabels)
 	if len(GeneLabels)>0:
-		for n in range(0,len(GenesIDs)):
-			if GenesIDs[n] in GeneLabels: 
-				LabelIDs = np.append(LabelIDs, GenesIDs[n])
-				LabelmeansA = np.append(LabelmeansA, meansA[n])
-				LabelmeansB = np.append(LabelmeansB, meansB[n])
+		#look up every gene at once in a hashed index of the labels
+		labelled = pd.Index(GenesIDs).isin(pd.Index(GeneLabels))
+		LabelIDs = GenesIDs[labelled]
+		LabelmeansA = meansA[labelled]
+		LabelmeansB = meansB[labelled]
 
 	#plot the labels
-	texts=[]
-	for i in range(0,len(LabelIDs)):
-		texts.append(plt.text(LabelmeansA[i], LabelmeansB[i], LabelIDs[i], weight='bold', c=label_color, fontsize=label_font))
-
-	#Use arrows to point from labels to the corresponding point
-	adjust_text(texts,force_text=force_text_val,force_points=force_points_val,arrowprops=dict(arrowstyle = '->', connectionstyle='arc3,rad=0', color=arrow_color))
+	with bm.stage('labels', rows_in=len(LabelIDs), label_mode=label_mode):
+		if label_mode == 'grid':
+			#bounded-cost placement (BarSeq_Labels.py): repulsion between neighbouring labels and points only, then a greedy fallback, with arrows to the points
+			plotted = (high | low | equal) & (noSig | Sig)
+			texts = bl.place_labels(plt.gca(), LabelmeansA, LabelmeansB, LabelIDs, points=(meansA[plotted], meansB[plotted]), point_size=marker_size,
+				max_iterations=label_iterations, time_budget=label_time, arrow_color=arrow_color, weight='bold', c=label_color, fontsize=label_font)
+		else:
+			texts=[]
+			for i in range(0,len(LabelIDs)):
+				texts.append(plt.text(LabelmeansA[i], LabelmeansB[i], LabelIDs[i], weight='bold', c=label_color, fontsize=label_font))
+
+			#Use arrows to point from labels to the corresponding point (adjustText is only needed for this label mode)
+			from adjustText import adjust_text
+			adjust_text(texts,force_text=force_text_val,force_points=force_points_val,arrowprops=dict(arrowstyle = '->', connectionstyle='arc3,rad=0', color=arrow_color))
 	####################################################################################################################################################################################################################################################
 
 	#Add a legend for the scatterplot
@@ -191,11 +180,28 @@ def main(Compare_File, q_val_cutoff=0.1, Show_Sig_Labels='False', Additional_Gen
 	plt.legend(handles=[black_star, diff_line], labels=legend, loc='lower right', fontsize=8)
 
 	#Save the scatterplot as a PDF
-	plt.savefig(Cond1Label+'_v_'+Cond2Label+'_'+str(q_val_cutoff)+'.pdf', dpi = 300)
+	output_file = Cond1Label+'_v_'+Cond2Label+'_'+str(q_val_cutoff)+'.pdf'
+	with bm.stage('savefig', rasterized=bool(rasterized)):
+		plt.savefig(output_file, dpi = 300)
+	plt.close(figure)
+	return output_file
+
+# Render the scatterplot of every _Annotated_Summary.csv file of a directory in a pool of worker processes (matplotlib figures are not shared
+#	between threads), with the same kwargs for each
+def batch(Compare_Dir, workers=None, **kwargs):
+	Compare_Files = sorted(glob.glob(os.path.join(Compare_Dir, '*_v_*_Annotated_Summary.csv')))
+	with bm.stage('batch', rows_in=len(Compare_Files)), ProcessPoolExecutor(max_workers=int(workers) if workers else None) as pool:
+		futures = [pool.submit(main, Compare_File, **kwargs) for Compare_File in Compare_Files]
+		for Compare_File, future in zip(Compare_Files, futures):
+			print(Compare_File, '->', future.result())
 
 if __name__=='__main__':
-	main(sys.argv[1],   #required compare file name
-		**dict(arg.split('=') for arg in sys.argv[2:])) # take in optional kwargs
+	if os.path.isdir(sys.argv[1]):
+		batch(sys.argv[1],   #directory of compare files
+			**dict(arg.split('=') for arg in sys.argv[2:])) # take in optional kwargs (and workers)
+	else:
+		main(sys.argv[1],   #required compare file name
+			**dict(arg.split('=') for arg in sys.argv[2:])) # take in optional kwargs
 
 
 
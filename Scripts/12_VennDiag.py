@@ -8,6 +8,7 @@ import statsmodels
 from statsmodels.stats.multitest import multipletests
 from venn import venn
 import matplotlib.pyplot as plt
+import BarSeq_Metrics as bm
 
 #This allows you to change text in illustrator for the PDFs exported in this function
 import matplotlib
@@ -56,7 +57,9 @@ if A == 6:
 # migrate locus tag and q-value data into a numpy array
 # find the condition label from the input dataset title
 # make lists of genes that have a q-value below the input q-value cutoff 
-CondA = pd.read_csv(Condition1)
+with bm.stage('load', condition=os.path.basename(Condition1)) as record:
+	CondA = pd.read_csv(Condition1)
+	record['rows_out'] = len(CondA)
 CondA = np.array(CondA[:], dtype=str)
 CondAGenes = CondA[1:,0]
 CondAqvals = CondA[1:,15]
@@ -67,7 +70,9 @@ for i in range(0,len(CondAqvals)):
 	if CondAqvals[i] < q_val: 
 		SigAIDs = np.append(SigAIDs, CondAGenes[i])
 
-CondB = pd.read_csv(Condition2)
+with bm.stage('load', condition=os.path.basename(Condition2)) as record:
+	CondB = pd.read_csv(Condition2)
+	record['rows_out'] = len(CondB)
 CondB = np.array(CondB[:], dtype=str)
 CondBGenes = CondB[1:,0]
 CondBqvals = CondB[1:,15]
@@ -79,7 +84,9 @@ for i in range(0,len(CondBqvals)):
 		SigBIDs = np.append(SigBIDs, CondBGenes[i])
 
 if A == 5:
-	CondC = pd.read_csv(Condition3)
+	with bm.stage('load', condition=os.path.basename(Condition3)) as record:
+		CondC = pd.read_csv(Condition3)
+		record['rows_out'] = len(CondC)
 	CondC = np.array(CondC[:], dtype=str)
 	CondCGenes = CondC[1:,0]
 	CondCqvals = CondC[1:,15]
@@ -90,7 +97,9 @@ if A == 5:
 		if CondCqvals[i] < q_val: 
 			SigCIDs = np.append(SigCIDs, CondCGenes[i])
 if A == 6:
-	CondC = pd.read_csv(Condition3)
+	with bm.stage('load', condition=os.path.basename(Condition3)) as record:
+		CondC = pd.read_csv(Condition3)
+		record['rows_out'] = len(CondC)
 	CondC = np.array(CondC[:], dtype=str)
 	CondCGenes = CondC[1:,0]
 	CondCqvals = CondC[1:,15]
@@ -102,7 +111,9 @@ if A == 6:
 		if CondCqvals[i] < q_val: 
 			SigCIDs = np.append(SigCIDs, CondCGenes[i])
 
-	CondD = pd.read_csv(Condition4)
+	with bm.stage('load', condition=os.path.basename(Condition4)) as record:
+		CondD = pd.read_csv(Condition4)
+		record['rows_out'] = len(CondD)
 	CondD = np.array(CondD[:], dtype=str)
 	CondDGenes = CondD[1:,0]
 	CondDqvals = CondD[1:,15]
@@ -161,9 +172,11 @@ if A == 4:
 	columns=[array1_label,array2_label,array1_label+'+'+array2_label]
 	Newdf.to_csv(array1_label+'_'+array2_label+'_'+q_val+'_Venn_Segments.csv', header=columns)
 	#make the venn diagram
-	venn(Venn_dict,fmt="{size}",fontsize=12,figsize=(8, 8))
+	with bm.stage('venn', rows_in=sum(len(genes) for genes in Venn_dict.values()), sets=len(Venn_dict)):
+		venn(Venn_dict,fmt="{size}",fontsize=12,figsize=(8, 8))
 	plt.title('Significant (q < '+q_val+') Genes for \n'+array1_label+' and '+array2_label)
-	plt.savefig(array1_label+'_'+array2_label+'_'+q_val+'_Venn.pdf', dpi = 300)
+	with bm.stage('savefig'):
+		plt.savefig(array1_label+'_'+array2_label+'_'+q_val+'_Venn.pdf', dpi = 300)
 
 if A == 5:
 	listA = np.append(CondALabel,SigAIDs)
@@ -225,9 +238,11 @@ if A == 5:
 	columns=[array1_label,array2_label,array3_label,array1_label+'+'+array2_label,array1_label+'+'+array3_label,array2_label+'+'+array3_label,array1_label+'+'+array2_label+'+'+array3_label]
 	Newdf.to_csv(array1_label+'_'+array2_label+'_'+array3_label+'_'+q_val+'_Venn_Segments.csv', header=columns)
 	#make the venn diagram
-	venn(Venn_dict,fmt="{size}",fontsize=12,figsize=(8, 8))
+	with bm.stage('venn', rows_in=sum(len(genes) for genes in Venn_dict.values()), sets=len(Venn_dict)):
+		venn(Venn_dict,fmt="{size}",fontsize=12,figsize=(8, 8))
 	plt.title('Significant (q < '+q_val+') Genes for\n'+array1_label+', '+array2_label+', and '+array3_label)
-	plt.savefig(array1_label+'_'+array2_label+'_'+array3_label+'_'+q_val+'_Venn.pdf', dpi = 300)
+	with bm.stage('savefig'):
+		plt.savefig(array1_label+'_'+array2_label+'_'+array3_label+'_'+q_val+'_Venn.pdf', dpi = 300)
 
 if A == 6:
 	listA = np.append(CondALabel,SigAIDs)
@@ -313,6 +328,8 @@ if A == 6:
 	columns=[array1_label,array2_label,array3_label,array4_label,array1_label+'+'+array2_label,array1_label+'+'+array3_label,array1_label+'+'+array4_label,array2_label+'+'+array3_label,array2_label+'+'+array4_label,array3_label+'+'+array4_label, array1_label+'+'+array2_label+'+'+array3_label, array1_label+'+'+array2_label+'+'+array4_label, array1_label+'+'+array3_label+'+'+array4_label, array2_label+'+'+array3_label+'+'+array4_label, array1_label+'+'+array2_label+'+'+array3_label+'+'+array4_label]
 	Newdf.to_csv(array1_label+'_'+array2_label+'_'+array3_label+'_'+array4_label+'_'+q_val+'_Venn_Segments.csv', header=columns)
 	#make the venn diagram
-	venn(Venn_dict,fmt="{size}",fontsize=12,figsize=(8, 8))
+	with bm.stage('venn', rows_in=sum(len(genes) for genes in Venn_dict.values()), sets=len(Venn_dict)):
+		venn(Venn_dict,fmt="{size}",fontsize=12,figsize=(8, 8))
 	plt.title('Significant (q < '+q_val+') Genes for\n'+array1_label+', '+array2_label+', '+array3_label+', and '+array4_label)
-	plt.savefig(array1_label+'_'+array2_label+'_'+array3_label+'_'+array4_label+'_'+q_val+'_Venn.pdf', dpi = 300)
+	with bm.stage('savefig'):
+		plt.savefig(array1_label+'_'+array2_label+'_'+array3_label+'_'+array4_label+'_'+q_val+'_Venn.pdf', dpi = 300)
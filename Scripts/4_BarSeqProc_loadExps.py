@@ -1,28 +1,36 @@
 #!/usr/bin/python3
-from numpy import *
 import numpy as np
-import pandas as pd
 import sys, os
+import BarSeq_Metrics as bm
+import BarSeq_Pool as bp
 
 # This function loads your all.poolcount file, splits into groups based upon biological replicate, groups insertions according to gene locus, and eliminates strains that have 
 # fewer than three insertions in the baseline sample, according to the baseline used. 
 
-# NOTE- This function breaks if using less than or more than 3 biological replicates. Modify accordingly.
+# Replicates are read from the SetName of each count column (SetName.Index, e.g. 1A.ATCACG is replicate A of set 1), so any number of replicates
+# (A, B, C, D, etc.) can be used, and sets do not need to have the same number of replicates.
 
 # Usage:
-#   python3 PATH/4_BarSeqProc_loadExps.py <PATH/all.poolcount_file> <baseline_condition> <Test Conditions>
+#   python3 PATH/4_BarSeqProc_loadExps.py <PATH/all.poolcount_file> <baseline_condition> <Test Conditions> <kwargs>
 
 # Inputs:
 #   all.poolcount file is file generated by BarSeqR.pl function 
 #   baseline condition chosen as a reference (1, 2, 3, etc.)
 #   Test Conditions Chosen '4,5,6,etc.''   NOTE. This is the set number as it apears in the .poolcount file. Not the neccisarily particular condition index.
 #		So third set in would be '3'. Seperate condition set numbers with commas e.g. '2,3,4,5'
+#
+#   Optional kwargs (given as name=value):
+#	exps=PATH/BarSeq.tsv	experiment metadata file; only the count columns of its SetNames are used (default: all count columns)
+#	cache=True	load all.poolcount from a binary cache written next to it on first use and rebuilt when the file changes (see BarSeq_Cache.py).
+#				cache=False streams the text file in chunks every time
+#
+# Only the baseline and test condition columns are read, and rows outside of genes are dropped as they are read (BarSeq_Pool.read_counts)
 
 # Output files:
 #   <baseline condition><replicates>_counts-in-genes.csv—Files made from extracting rows from the all.poolcount file where the barcoded transposon insertion
-#		falls within a gene and breaking apart by replicates A-C 
+#		falls within a gene and breaking apart by replicates (A, B, C, etc.). The baseline column is followed by the test condition columns, in the order given
 #   <baseline condition><replicates>_in3genes.csv—File made from extracting rows from the <baseline condition><replicate>_counts-in-genes.csv file, where >= 3
-#		counts for each distinct transposon insertion exists in the T=0 baseline condition. This breaks apart into sets based upon replicate A,B, or C
+#		counts for each distinct transposon insertion exists in the T=0 baseline condition. This breaks apart into sets based upon replicate (A, B, C, etc.)
 
 
 if len(sys.argv) < 3:
@@ -43,84 +51,65 @@ baseline = sys.argv[2]
 baseline = np.array(baseline)
 Test_Conditions = sys.argv[3]
 Test_Conditions = np.array(Test_Conditions.split(',')) #needed to change the string to an array and ignore the commas in the argv input
+kwargs = dict(arg.split('=') for arg in sys.argv[4:])
+SetNames = bp.read_setnames(kwargs['exps']) if 'exps' in kwargs else None
+cache = kwargs.get('cache', 'True') in ('True', 'true', '1')
 
 
 #################################################################################
-##### Split all.poolcount data into the three biological replicates #####
+##### Split all.poolcount columns into the biological replicates            #####
 ################################################################################# 
 
-# Use Pandas to make import all.poolcount as a dataframe
-Counts_Table = pd.read_csv(poolFile, sep="\t")
+# Index the count columns of all.poolcount once from its header: (set number, replicate) -> column position (BarSeq_Pool.column_index)
+Pool_Columns = bp.read_header(poolFile)
+Column_Index = bp.column_index(Pool_Columns, SetNames)
+Meta_Columns = [column for column in Pool_Columns if column in bp.pool_columns]
 
-# Determine the total number of condition columns in the master dataframe
-Total_Columns = list(range(7,Counts_Table.shape[1],1))
-
-# Dataframe For Replicate A, B, and C
-drop_indexA = list(np.delete(Total_Columns, slice(0,len(Total_Columns), 3))) #Indexes to drop to create replicate dataframes
-drop_indexB = list(np.delete(Total_Columns, slice(1,len(Total_Columns), 3))) 
-drop_indexC = list(np.delete(Total_Columns, slice(2,len(Total_Columns), 3)))
-
-drop_colsA = [j for i,j in enumerate(Counts_Table.columns) if i in drop_indexA] #fetch the column names at the indexes you wish to drop from the datasets
-drop_colsB = [j for i,j in enumerate(Counts_Table.columns) if i in drop_indexB]
-drop_colsC = [j for i,j in enumerate(Counts_Table.columns) if i in drop_indexC] 
-
-Counts_Table_A = Counts_Table.drop(drop_colsA, axis=1) # Drop the other two replicate columns from the master dataframe
-Counts_Table_B = Counts_Table.drop(drop_colsB, axis=1)
-Counts_Table_C = Counts_Table.drop(drop_colsC, axis=1)
+Baseline_Replicates = [replicate for (number, replicate) in Column_Index if number == str(baseline)]
+if len(Baseline_Replicates) == 0:
+	print("Baseline condition " + str(baseline) + " is not a set of " + poolFile + "... aborting...")
+	sys.exit(0)
+for number in Test_Conditions:
+	if not any(set_number == number for (set_number, replicate) in Column_Index):
+		print("Test condition " + number + " is not a set of " + poolFile + "... aborting...")
+		sys.exit(0)
+	for (set_number, replicate) in Column_Index:
+		if set_number == number and replicate not in Baseline_Replicates:
+			print("Test condition " + number + " replicate " + replicate + " has no baseline replicate and will not be used")
 
 
 ################################################################################
-# Determine the Baseline Condition (to be placed in the first column of count  #
-# data in each dataframe) and the enrichment condition indexes that will be    #
-# compared to the designated baseline                                          #
+# The baseline condition is placed in the first column of count data in each  #
+# replicate table, followed by the enrichment conditions that will be compared #
+# to the designated baseline (those that have the replicate)                   #
 ################################################################################
 
-
-BL_Enrichment_Col_Indexes = str(int(baseline)-1) #Taking away 1 accounts for python indexing
-for i in range(0,len(Test_Conditions)):
-    BL_Enrichment_Col_Indexes = np.append(BL_Enrichment_Col_Indexes,str(int(Test_Conditions[i])-1)) #Taking away 1 accounts for python indexing
-BL_Enrichment_Col_Indexes = BL_Enrichment_Col_Indexes.astype(int)
-
-# First determine the total number of condition columns in the replicate dataframes (all should be the same)
-Total_Conditions_Columns = list(range(7,Counts_Table_A.shape[1],1))
-drop_index_Conditions = list(np.delete(Total_Conditions_Columns, BL_Enrichment_Col_Indexes)) #Indexes of conditions to drop from each Replicate dataframe
-
-# Eliminate the condition columns not needed for the current analysis each Replicate Dataframe
-drop_Cond_colsA = [j for i,j in enumerate(Counts_Table_A.columns) if i in drop_index_Conditions] 
-Table_A = Counts_Table_A.drop(drop_Cond_colsA, axis=1)
-
-drop_Cond_colsB = [j for i,j in enumerate(Counts_Table_B.columns) if i in drop_index_Conditions] 
-Table_B = Counts_Table_B.drop(drop_Cond_colsB, axis=1)
-
-drop_Cond_colsC = [j for i,j in enumerate(Counts_Table_C.columns) if i in drop_index_Conditions] 
-Table_C = Counts_Table_C.drop(drop_Cond_colsC, axis=1)
+Table_Columns = {}
+for replicate in Baseline_Replicates:
+	Table_Columns[replicate] = [Pool_Columns[Column_Index[(number, replicate)]] for number in [str(baseline)] + list(Test_Conditions) if (number, replicate) in Column_Index]
 
 
 ###################################################################################
-# Trim Replicate Tables to only include rows where an insertion is within a gene  #
-# and then trim to only include rows where the mutant count for each unqiue       #
-# transposon is at least 3 in the baseline                                        #
+# Load the rows where an insertion is within a gene for the needed columns, split #
+# them into the replicate tables and then trim to only include rows where the     #
+# mutant count for each unqiue transposon is at least 3 in the baseline           #
 ###################################################################################
 
-#select only rows that are within genes (ingenes); write output to csv    
-ingenes_A = Table_A.dropna(subset=['locusId'])
-ingenes_B = Table_B.dropna(subset=['locusId'])
-ingenes_C = Table_C.dropna(subset=['locusId'])
-
-ingenes_A.to_csv(('BL_'+str(baseline)+'A_counts-in-genes.csv'), index=False, header=True)
-ingenes_B.to_csv(('BL_'+str(baseline)+'B_counts-in-genes.csv'), index=False, header=True)
-ingenes_C.to_csv(('BL_'+str(baseline)+'C_counts-in-genes.csv'), index=False, header=True)
-      
-# select only rows that have >= 3 reads/strain in T0 (in3genes); write output to csv
-colname_A = ingenes_A.columns[7] # Need to identify the column names for the baseline columns in the replicate tables
-colname_B = ingenes_B.columns[7]
-colname_C = ingenes_C.columns[7]
-
-in3genes_A = ingenes_A[ingenes_A[colname_A] >= 3]
-in3genes_B = ingenes_B[ingenes_B[colname_B] >= 3]
-in3genes_C = ingenes_C[ingenes_C[colname_C] >= 3]
-
-in3genes_A.to_csv(('BL_'+str(baseline)+'A_in3genes.csv'), index=False, header=True)
-in3genes_B.to_csv(('BL_'+str(baseline)+'B_in3genes.csv'), index=False, header=True)
-in3genes_C.to_csv(('BL_'+str(baseline)+'C_in3genes.csv'), index=False, header=True)
-
+Used_Columns = [column for replicate in Table_Columns for column in Table_Columns[replicate]]
+with bm.stage('load', cache=cache) as record:
+	ingenes = bp.read_counts(poolFile, Used_Columns, cache=cache)
+	record['rows_out'] = len(ingenes)
+
+for replicate in Table_Columns:
+	#select only rows that are within genes (ingenes); write output to csv
+	ingenes_rep = ingenes[Meta_Columns + Table_Columns[replicate]]
+	with bm.stage('write', rows_in=len(ingenes_rep), baseline=baseline, replicate=replicate):
+		ingenes_rep.to_csv(('BL_'+str(baseline)+replicate+'_counts-in-genes.csv'), index=False, header=True)
+
+	# select only rows that have >= 3 reads/strain in T0 (in3genes); write output to csv
+	with bm.stage('split', rows_in=len(ingenes_rep), baseline=baseline, replicate=replicate) as record:
+		BL_column = Table_Columns[replicate][0]
+		in3genes = ingenes_rep[ingenes_rep[BL_column] >= 3]
+		record['rows_out'] = len(in3genes)
+	with bm.stage('write', rows_in=len(in3genes), baseline=baseline, replicate=replicate):
+		in3genes.to_csv(('BL_'+str(baseline)+replicate+'_in3genes.csv'), index=False, header=True)
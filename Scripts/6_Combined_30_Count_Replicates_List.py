@@ -1,14 +1,18 @@
 #!/usr/bin/python3
-import numpy as np
-import pandas as pd
-import sys, os
+import sys, os, glob
+import BarSeq_Metrics as bm
+import BarSeq_Pipeline as bpl
 
-#	This function takes the _<30_Unused_BL_genes.csv files from the three replicates and merges them into one file, eliminating any duplicates from the list.
+#	This function takes the _<30_Unused_BL_genes.csv files from the replicates (any number) and merges them into one file, eliminating any duplicates from the list.
 # 		This is an essential step prior to generating the replicates table, since if a gene doesn't have a fitness value for all replicates, this file is used to trim 
 #		it from the dataset.
+#	Only the locusId column of each file is read, in chunks, and the input files are found relative to <PATH_input_output_Files> without changing the
+#		working directory. The _Unused_0ct_Exp_genes.csv files of the conditions can also be folded into the list (zero_counts=...), so that the output
+#		file is the complete exclusion list of 7_Replicates_Table.py.
 
 #	Usage: 
-#		python3 PATH/6_Combined_30_Count_Replicates_List.py <PATH_input_output_Files> <output_filename> <replicate_A_<30_Unused_BL_genes.csv> <replicate_B_<30_Unused_BL_genes.csv> <replicate_C_<30_Unused_BL_genes.csv>
+#		python3 PATH/6_Combined_30_Count_Replicates_List.py <PATH_input_output_Files> <output_filename> <replicate_A_<30_Unused_BL_genes.csv> <replicate_B_<30_Unused_BL_genes.csv> <replicate_C_<30_Unused_BL_genes.csv> [...] <kwargs>
+#		python3 PATH/6_Combined_30_Count_Replicates_List.py <PATH_input_output_Files> <output_filename> '1?.*_<30_Unused_BL_genes.csv'
 #
 #		NOTE, the '<' must be escaped in Bash scripting using a '\'
 #
@@ -16,6 +20,11 @@ import sys, os
 #		<replicate_A_<30_Unused_BL_genes.csv> The genes from replicate A that didn't meet the >30 counts in a gene cutoff condition
 #		<replicate_B_<30_Unused_BL_genes.csv> The genes from replicate B that didn't meet the >30 counts in a gene cutoff condition
 #		<replicate_C_<30_Unused_BL_genes.csv> The genes from replicate C that didn't meet the >30 counts in a gene cutoff condition
+#		Any number of replicate files can be given, as file names or glob patterns (quoted, so that the shell does not expand them)
+#
+#	Optional kwargs (given as name=value):
+#		zero_counts='2?.*_Unused_0ct_Exp_genes.csv'	_Unused_0ct_Exp_genes.csv files (file names or glob patterns, separated with commas) whose genes are
+#													also added to the list
 #	
 #	Output file:
 #		<output_filename> is a csv file with a list of all the unused (<30 count) genes from each of the baseline replicates, where duplicate names are deleted from the list.
@@ -24,39 +33,20 @@ import sys, os
 # sysnames
 In_out_path = sys.argv[1]
 out_file = sys.argv[2]
-RepA_less_30 = sys.argv[3]
-RepB_less_30 = sys.argv[4]
-RepC_less_30 = sys.argv[5]
-
-#make sure you are in input/output directory
-os.chdir(In_out_path)
-
-#Import the lists from csv files and combine the resultant locsId lists into one array each
-pdA = pd.read_csv(RepA_less_30)
-A = pdA.loc[:, 'locusId']
-
-pdB = pd.read_csv(RepB_less_30)
-B = pdB.loc[:, 'locusId']
-
-pdC = pd.read_csv(RepC_less_30)
-C = pdC.loc[:, 'locusId']
-
-
-#Append all lists together
-All = []
-All = np.append(All, A)
-All = np.append(All, B)
-All = np.append(All, C)
-
-#Make a list of strings from the set of unique strings in the list
-
-All_trimmed=list(set(All))
-All_trimmed.sort()
-
-#Save as csv in the input/output directory with the given output file name
-
-np.savetxt(out_file, All_trimmed, delimiter=',', fmt='%s')
-
-
-
-
+less_30_patterns = [arg for arg in sys.argv[3:] if '=' not in arg]
+kwargs = dict(arg.split('=') for arg in sys.argv[3:] if '=' in arg)
+zero_count_patterns = kwargs['zero_counts'].split(',') if 'zero_counts' in kwargs else []
+
+# Input files in the input/output directory, matching each file name or glob pattern
+def input_files(patterns):
+	files = []
+	for pattern in patterns:
+		path = os.path.join(In_out_path, pattern)
+		files.extend(sorted(glob.glob(path)) or [path])
+	return files
+
+#Import the locusId lists from csv files and combine them into one set, then save the sorted list as csv in the input/output directory with the given output file name
+with bm.stage('exclusion') as record:
+	genes = bpl.exclusion_set(input_files(less_30_patterns), input_files(zero_count_patterns))
+	record['rows_out'] = len(genes)
+bpl.write_exclusion(genes, os.path.join(In_out_path, out_file))
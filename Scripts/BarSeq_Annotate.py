@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, json, glob
+from concurrent.futures import ThreadPoolExecutor
+import BarSeq_Cache as bc
+
+# Annotation of comparison summaries (the _Summary.csv files of 8_Fitness_Compare.py, or any table indexed by locus tag) with the new locus tag, gene
+#	name and description of each gene from a feature table (e.g. GCF_000007565.2_ASM756v2_feature_table_trimmed.txt), as in 9_Summary_annotate.py.
+#
+#	The old_locus_tag, locus_tag, symbol and name columns of the feature table are read once and saved as an annotation index next to it
+#	(<feature_table>.index.npz), reused as long as the size and modification time of the feature table are unchanged, or its hash is (as for the
+#	all.poolcount cache of BarSeq_Cache.py). Genes are looked up by old locus tag (PP_xxxx), then by new locus tag (PP_RSxxxxx), keeping the first
+#	row of the feature table for each tag, with a hash join over the whole summary at once.
+#
+#	annotate_batch annotates every _Summary.csv file of a directory (or matching a glob pattern) with one annotation index, reading, joining and
+#	writing the files in a pool of worker threads that share the index.
+#
+# Usage:
+#	python3 PATH/BarSeq_Annotate.py <PATH/feature_table.txt>		builds (or checks) the annotation index of the feature table
+#	python3 PATH/BarSeq_Annotate.py <PATH/feature_table.txt> <directories or glob patterns of _Summary.csv files> workers=N
+#		writes C1_v_C2_Annotated_Summary.csv next to each C1_v_C2_Summary.csv (workers: number of threads, default one per CPU plus 4)
+
+INDEX_VERSION = 1
+
+# Feature table column of each annotation column, and the annotation columns in output order
+feature_columns = {'old_locus_tag': 'old_locus_tag', 'new_locus_tag': 'locus_tag', 'gene_name': 'symbol', 'description': 'name'}
+annotation_columns = ['old_locus_tag', 'new_locus_tag', 'gene_name', 'description']
+
+
+def index_path(genesTable):
+	return genesTable + '.index.npz'
+
+# Read the annotation columns of the feature table, as text with missing values left blank
+def read_features(genesTable):
+	Features = pd.read_csv(genesTable, sep='\t', dtype=str, keep_default_na=False, usecols=list(feature_columns.values()))
+	return {name: Features[column].to_numpy(dtype=str) for name, column in feature_columns.items()}
+
+# Annotation index of a feature table: its annotation columns, loaded from the saved index if it is up to date and read (and saved) otherwise.
+#	If the index cannot be written (e.g. a read-only directory), the feature table is read directly.
+def load_index(genesTable, cache=True):
+	path = index_path(genesTable)
+	key = bc.source_key(genesTable)
+	if cache and os.path.isfile(path):
+		with np.load(path) as saved:
+			meta = json.loads(str(saved['meta']))
+			columns = {name: saved[name] for name in annotation_columns}
+		if meta.get('version') == INDEX_VERSION and meta['size'] == key['size'] and (meta['mtime_ns'] == key['mtime_ns'] or meta['sha256'] == bc.source_hash(genesTable)):
+			return build_index(columns)
+
+	columns = read_features(genesTable)
+	if cache:
+		meta = dict(key, sha256=bc.source_hash(genesTable), version=INDEX_VERSION)
+		try:
+			with open(path + '.tmp', 'wb') as handle:
+				np.savez(handle, meta=np.array(json.dumps(meta)), **columns)
+			os.replace(path + '.tmp', path)
+		except OSError as error:
+			print('Could not save the annotation index of', genesTable, '('+str(error)+')')
+	return build_index(columns)
+
+# Lookup tables of the annotation columns: the row of the first feature with each old and new locus tag (blank tags are left out), and the
+#	new locus tag, gene name and description of each row as csv text
+def build_index(columns):
+	Index = dict(columns)
+	Index['csv'] = [','.join(csv_field(value) for value in values) for values in zip(*[columns[name] for name in annotation_columns[1:]])]
+	for name in ['old_locus_tag', 'new_locus_tag']:
+		tags = pd.Index(columns[name])
+		first = ~tags.duplicated() & (tags != '')
+		Index[name+'_keys'] = tags[first]
+		Index[name+'_rows'] = np.flatnonzero(first)
+	return Index
+
+# Row of the feature table of each gene (by old locus tag, then by new locus tag), -1 if the gene is not in the feature table
+def feature_rows(Index, genes):
+	genes = pd.Index(genes)
+	rows = np.full(len(genes), -1, dtype=np.int64)
+	for name in ['new_locus_tag', 'old_locus_tag']:
+		positions = Index[name+'_keys'].get_indexer(genes)
+		rows = np.where(positions >= 0, Index[name+'_rows'][positions], rows)
+	return rows
+
+# Add the new locus tag, gene name and description of each gene of a summary table (indexed by old or new locus tag) in front of its columns,
+#	left blank if the gene is not in the feature table. The index of the annotated table (old_locus_tag) keeps the summary's locus tags.
+def annotate(Summary, Index):
+	rows = feature_rows(Index, Summary.index)
+	found = rows >= 0
+	Annotation = {}
+	for name in annotation_columns[1:]:
+		values = np.full(len(rows), '', dtype=object)
+		values[found] = Index[name][rows[found]]
+		Annotation[name] = values
+	Annotated = pd.concat([pd.DataFrame(Annotation, index=Summary.index), Summary], axis=1)
+	Annotated.index.name = 'old_locus_tag'
+	return Annotated
+
+# A text value as a csv field, quoted as by pandas.to_csv when it holds a comma, quote or line break
+def csv_field(value):
+	return '"' + value.replace('"', '""') + '"' if any(character in value for character in ',"\r\n') else value
+
+# Annotate a summary file with the annotation index and write it to out_File. The lines of the summary are copied as they are, after the
+#	annotation columns of their locus tag, as annotate would give for the summary read as text.
+def annotate_file(summaryFile, Index, out_File):
+	with open(summaryFile) as handle:
+		header = handle.readline().rstrip('\r\n')
+		lines = [line for line in handle.read().splitlines() if line]
+	rows = feature_rows(Index, [line.split(',', 1)[0] for line in lines])
+	with open(out_File, 'w') as handle:
+		handle.write(','.join(annotation_columns) + ',' + header.split(',', 1)[1] + '\n')
+		for line, row in zip(lines, rows):
+			tag, rest = line.split(',', 1)
+			handle.write(tag + ',' + (Index['csv'][row] if row >= 0 else ',,') + ',' + rest + '\n')
+
+# Annotate each summary file with the annotation index and write it to the matching output file
+def annotate_files(summaryFiles, Index, outFiles):
+	for summaryFile, out_File in zip(summaryFiles, outFiles):
+		annotate_file(summaryFile, Index, out_File)
+
+# Output file of a summary file: C1_v_C2_Summary.csv -> C1_v_C2_Annotated_Summary.csv
+def annotated_path(summaryFile):
+	root = summaryFile[:-len('_Summary.csv')] if summaryFile.endswith('_Summary.csv') else os.path.splitext(summaryFile)[0]
+	return root + '_Annotated_Summary.csv'
+
+# Summary files of directories (every _Summary.csv file that is not already annotated) or glob patterns, in sorted order without repeats
+def summary_files(patterns):
+	files = []
+	for pattern in patterns:
+		if os.path.isdir(pattern):
+			files.extend(path for path in sorted(glob.glob(os.path.join(pattern, '*_Summary.csv'))) if not path.endswith('_Annotated_Summary.csv'))
+		else:
+			files.extend(sorted(glob.glob(pattern)))
+	return list(dict.fromkeys(files))
+
+# Annotate every summary file of the directories or glob patterns with the annotation index of genesTable (loaded once), workers files at a time
+#	(default: the ThreadPoolExecutor default), each written to its annotated_path. Returns the output files.
+def annotate_batch(patterns, genesTable, workers=None):
+	Index = load_index(genesTable)
+	summaryFiles = summary_files(patterns)
+	outFiles = [annotated_path(summaryFile) for summaryFile in summaryFiles]
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		list(pool.map(lambda files: annotate_files([files[0]], Index, [files[1]]), zip(summaryFiles, outFiles)))
+	return outFiles
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <path to feature table> <directories or glob patterns of _Summary.csv files> <kwargs>")
+		sys.exit(0)
+
+	patterns = [arg for arg in sys.argv[2:] if '=' not in arg]
+	kwargs = dict(arg.split('=') for arg in sys.argv[2:] if '=' in arg)
+	if patterns:
+		outFiles = annotate_batch(patterns, sys.argv[1], int(kwargs['workers']) if 'workers' in kwargs else None)
+		print(len(outFiles), 'summary files annotated')
+	else:
+		Index = load_index(sys.argv[1])
+		print(index_path(sys.argv[1]) + ':', len(Index['old_locus_tag']), 'features,', len(Index['old_locus_tag_keys']), 'old locus tags,',
+			len(Index['new_locus_tag_keys']), 'new locus tags')
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+import numpy as np
+import sys, os, json, shutil
+from collections import OrderedDict
+import BarSeq_Fitness as bf
+import BarSeq_Strains as bs
+
+# Baseline artifact: what the stage 5 analysis derives from a baseline count column of the strain store (BarSeq_Strains.py) alone, computed once and
+#	shared by every test condition analyzed against that baseline. An artifact is a dict of:
+#		column			the baseline count column
+#		strains			rows of the store with >= 3 baseline reads (the strains of the in3genes table of 4_BarSeqProc_loadExps.py), grouped by gene
+#		genes, scaffolds	locusId and scaffold of the genes of these strains, in store order
+#		gene_offsets	the strains of gene g are strains[gene_offsets[g]:gene_offsets[g+1]]
+#		BL_counts		baseline reads of each of these strains
+#		BL_Sums			baseline reads of each gene
+#		used			genes with >= 30 baseline reads, analyzed for fitness (the others are the <30_Unused_BL_genes)
+#		BL_Vn			baseline term of the naive gene variance Vn, 1/(1+BL_Sums) (see BarSeq_Fitness.gene_tStat)
+#
+#	open_baseline keeps the memory_size most recently used artifacts in memory, and saves artifacts in the baselines directory of the strain store,
+#	keeping the disk_size most recently used ones there. Saved artifacts are dropped when the strain store is rebuilt (all.poolcount changed) and
+#	rebuilt when the read thresholds change.
+#
+# Usage:
+#	python3 PATH/BarSeq_Baseline.py <PATH/all.poolcount_file> <baseline count column(s)>		builds (or checks) the artifact of each baseline column,
+#		e.g. 1A.IDX1A,1B.IDX1B
+
+BASELINE_VERSION = 1
+baseline_arrays = ['strains', 'genes', 'scaffolds', 'gene_offsets', 'BL_counts', 'BL_Sums', 'used', 'BL_Vn']
+memory_size = 8
+disk_size = 64
+
+_memory = OrderedDict()
+
+
+# Build the artifact of a baseline count column of a store
+def build_baseline(store, column):
+	BL_counts = store['counts'][:,store['columns'].index(column)]
+	in3 = BL_counts >= bf.minStrainReads
+	strains = np.flatnonzero(in3)
+	strain_counts = np.bincount(bs.strain_genes(store)[strains], minlength=len(store['genes']))
+	kept_genes = strain_counts > 0
+	gene_offsets = np.zeros(np.count_nonzero(kept_genes)+1, dtype=np.int64)
+	gene_offsets[1:] = np.cumsum(strain_counts[kept_genes])
+	BL_counts = np.asarray(BL_counts[strains])
+	BL_Sums = np.add.reduceat(BL_counts, gene_offsets[:-1], dtype=np.int64) if len(strains) else np.zeros(0, dtype=np.int64)
+	return {'column': column, 'strains': strains, 'genes': np.asarray(store['genes'][kept_genes], dtype=object),
+		'scaffolds': np.asarray(store['scaffolds'][kept_genes], dtype=object), 'gene_offsets': gene_offsets, 'BL_counts': BL_counts, 'BL_Sums': BL_Sums,
+		'used': BL_Sums >= bf.minGeneReads, 'BL_Vn': 1/(1+BL_Sums)}
+
+# The store restricted to the strains of a baseline artifact and to the given count columns (the baseline column first), as
+#	BarSeq_Strains.select_strains gives for the >= 3 baseline reads strains
+def baseline_store(store, Baseline, columns):
+	positions = [store['columns'].index(column) for column in columns]
+	counts = np.empty((len(Baseline['strains']), len(columns)), dtype=store['counts'].dtype, order='F')
+	for k, position in enumerate(positions):
+		counts[:,k] = Baseline['BL_counts'] if columns[k] == Baseline['column'] else store['counts'][:,position][Baseline['strains']]
+	return {'genes': Baseline['genes'], 'scaffolds': Baseline['scaffolds'], 'gene_offsets': Baseline['gene_offsets'],
+		'pos': store['pos'][Baseline['strains']], 'f': store['f'][Baseline['strains']], 'counts': counts, 'columns': list(columns)}
+
+# What an artifact depends on: the strain store (by the hash of its all.poolcount file), the baseline column and the read thresholds
+def baseline_key(store_dir, column):
+	with open(os.path.join(store_dir, 'meta.json')) as handle:
+		store_meta = json.load(handle)
+	return {'version': BASELINE_VERSION, 'sha256': store_meta.get('sha256'), 'column': column, 'minStrainReads': bf.minStrainReads,
+		'minGeneReads': bf.minGeneReads}
+
+def baseline_path(store_dir, column):
+	return os.path.join(store_dir, 'baselines', column)
+
+# Save an artifact as .npy files and meta.json, and load it back memory-mapped
+def save_baseline(Baseline, baseline_dir, key):
+	tmp_dir = baseline_dir + '.tmp' + str(os.getpid())
+	shutil.rmtree(tmp_dir, ignore_errors=True)
+	os.makedirs(tmp_dir)
+	for name in baseline_arrays:
+		values = Baseline[name]
+		if values.dtype == object:
+			values = np.array(values, dtype=str)
+		np.save(os.path.join(tmp_dir, name+'.npy'), values)
+	with open(os.path.join(tmp_dir, 'meta.json'), 'w') as handle:
+		json.dump(key, handle)
+	shutil.rmtree(baseline_dir, ignore_errors=True)
+	os.rename(tmp_dir, baseline_dir)
+
+def load_baseline(baseline_dir, mmap_mode='r'):
+	with open(os.path.join(baseline_dir, 'meta.json')) as handle:
+		key = json.load(handle)
+	Baseline = {name: np.load(os.path.join(baseline_dir, name+'.npy'), mmap_mode=mmap_mode) for name in baseline_arrays}
+	Baseline['genes'] = np.asarray(Baseline['genes'], dtype=object)
+	Baseline['scaffolds'] = np.asarray(Baseline['scaffolds'], dtype=object)
+	Baseline['column'] = key['column']
+	return Baseline, key
+
+# Remove the saved artifacts of a strain store beyond the keep most recently used
+def evict_baselines(store_dir, keep=None):
+	keep = disk_size if keep is None else keep
+	baselines_dir = os.path.join(store_dir, 'baselines')
+	if not os.path.isdir(baselines_dir):
+		return
+	saved = [os.path.join(baselines_dir, name) for name in os.listdir(baselines_dir) if os.path.isfile(os.path.join(baselines_dir, name, 'meta.json'))]
+	saved.sort(key=lambda baseline_dir: os.path.getmtime(os.path.join(baseline_dir, 'meta.json')), reverse=True)
+	for baseline_dir in saved[keep:]:
+		shutil.rmtree(baseline_dir, ignore_errors=True)
+
+# Artifact of a baseline count column of the strain store in store_dir: from memory, from its saved copy, or built from the store (loaded from
+#	store_dir unless given) and saved. A store without an all.poolcount hash (e.g. a temporary store) is only kept in memory.
+def open_baseline(store_dir, column, store=None):
+	key = baseline_key(store_dir, column)
+	memory_key = (os.path.abspath(store_dir), json.dumps(key, sort_keys=True))
+	if memory_key in _memory:
+		_memory.move_to_end(memory_key)
+		return _memory[memory_key]
+
+	baseline_dir = baseline_path(store_dir, column)
+	Baseline = None
+	if key['sha256'] is not None and os.path.isfile(os.path.join(baseline_dir, 'meta.json')):
+		Baseline, saved_key = load_baseline(baseline_dir)
+		if saved_key == key:
+			os.utime(os.path.join(baseline_dir, 'meta.json'))
+		else:
+			Baseline = None
+	if Baseline is None:
+		Baseline = build_baseline(bs.load_store(store_dir) if store is None else store, column)
+		if key['sha256'] is not None:
+			try:
+				save_baseline(Baseline, baseline_dir, key)
+				evict_baselines(store_dir)
+			except OSError as error:
+				print('Could not save the baseline artifact of', column, '('+str(error)+')')
+
+	_memory[memory_key] = Baseline
+	while len(_memory) > memory_size:
+		_memory.popitem(last=False)
+	return Baseline
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 3:
+		print("Usage: " + sys.argv[0] + " <path to all.poolcount> <baseline count column(s)>")
+		sys.exit(0)
+
+	store_dir = bs.open_store(sys.argv[1])
+	for column in sys.argv[2].split(','):
+		Baseline = open_baseline(store_dir, column)
+		print(baseline_path(store_dir, column) + ':', len(Baseline['strains']), 'strains with >=', bf.minStrainReads, 'baseline reads in', len(Baseline['genes']),
+			'genes,', int(np.count_nonzero(Baseline['used'])), 'with >=', bf.minGeneReads, 'baseline reads')
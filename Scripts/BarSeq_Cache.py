@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, json, hashlib, shutil
+
+# Binary column cache of the all.poolcount file generated by 3_BarSeqR.pl, so that the text file is parsed only once.
+#
+#	The first time a pool is loaded, it is parsed chunk by chunk (the whole text table is never held in memory) and every column is saved as a .npy
+#	file in a <all.poolcount>.cache directory next to it: the count columns as uint32, text columns (barcode, rcbarcode, scaffold, strand, locusId) as
+#	categoricals (int32 codes, -1 for a missing value, and their sorted categories), and pos and f with the dtype they are read with. The cache records the
+#	size, modification time and sha256 hash of the source file. It is reused as long as the size and modification time are unchanged, or the hash is
+#	(e.g. a copied file), and rebuilt otherwise. Later loads memory-map the .npy files and only read the requested columns.
+#
+# Usage:
+#	python3 PATH/BarSeq_Cache.py <PATH/all.poolcount_file>		builds (or checks) the cache of the file
+#
+#	From python, read_pool(poolFile) returns the all.poolcount table as pd.read_csv(poolFile, sep="\t") would, with the text columns read as str.
+
+CACHE_VERSION = 1
+count_dtype = np.uint32
+
+# The all.poolcount columns that come before the count columns
+pool_columns = ['barcode', 'rcbarcode', 'scaffold', 'strand', 'pos', 'locusId', 'f']
+
+
+def cache_path(poolFile):
+	return poolFile + '.cache'
+
+def source_key(poolFile):
+	stat = os.stat(poolFile)
+	return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def source_hash(poolFile, block_size=1<<20):
+	sha = hashlib.sha256()
+	with open(poolFile, 'rb') as handle:
+		for block in iter(lambda: handle.read(block_size), b''):
+			sha.update(block)
+	return sha.hexdigest()
+
+# Integer codes of the text values of a chunk (-1 for a missing value) and the distinct values they point to, as bytes (1 byte per character for
+#	plain ascii text such as barcodes and locus tags) or str
+def chunk_codes(values):
+	codes, uniques = pd.factorize(values)
+	try:
+		uniques = np.array(uniques, dtype=bytes)
+	except UnicodeEncodeError:
+		uniques = np.array(uniques, dtype=str)
+	return codes.astype(np.int32), uniques
+
+# Codes and sorted categories of a text column from the codes and distinct values of each of its chunks, the values of all chunks being
+#	deduplicated at once
+def merge_codes(codes, uniques):
+	if any(piece.dtype.kind == 'U' for piece in uniques):
+		uniques = [piece.astype(str) for piece in uniques]
+	offsets = np.cumsum([0] + [len(piece) for piece in uniques[:-1]])
+	categories, inverse = np.unique(np.concatenate(uniques), return_inverse=True)
+	inverse = inverse.astype(np.int32)
+	return np.concatenate([np.where(piece >= 0, inverse[np.maximum(piece, 0) + offset], -1) for piece, offset in zip(codes, offsets)]), categories
+
+# Whether the values of a numeric column fit the count dtype: no missing, negative, non-integer or > 2^32 values
+def fits_counts(values):
+	return values.notna().all() and (values >= 0).all() and (values <= np.iinfo(count_dtype).max).all() and (values % 1 == 0).all()
+
+# Parse all.poolcount and save each column in cache_dir, along with meta.json describing the columns and the source file. The file is read chunk by
+#	chunk and only the encoded columns are kept (count columns as uint32, text columns as int32 codes and the distinct values of each chunk), never
+#	the whole table.
+#	The text columns of pool_columns are read as str, as in BarSeq_Pool.read_counts. A column that is numeric in some chunks and text in others is
+#	read again on its own and saved as text.
+def build_cache(poolFile, cache_dir, chunksize=100000):
+	header = list(pd.read_csv(poolFile, sep="\t", nrows=0).columns)
+	text_columns = {'barcode', 'rcbarcode', 'scaffold', 'strand', 'locusId'}
+	pieces = {name: [] for name in header}
+	dtypes = {name: [] for name in header}
+	uniques = {name: [] for name in header}
+	nrows = 0
+	for chunk in pd.read_csv(poolFile, sep="\t", dtype={name: str for name in header if name in text_columns}, chunksize=chunksize):
+		nrows += len(chunk)
+		for name in header:
+			values = chunk[name]
+			dtypes[name].append(values.dtype)
+			if values.dtype.kind in 'iuf':
+				pieces[name].append(values.to_numpy(dtype=count_dtype) if name not in pool_columns and fits_counts(values) else values.to_numpy())
+			else:
+				codes, chunk_uniques = chunk_codes(values)
+				pieces[name].append(codes)
+				uniques[name].append(chunk_uniques)
+
+	tmp_dir = cache_dir + '.tmp'
+	shutil.rmtree(tmp_dir, ignore_errors=True)
+	os.makedirs(tmp_dir)
+
+	columns = []
+	for k, name in enumerate(header):
+		numeric = all(dtype.kind in 'iuf' for dtype in dtypes[name])
+		# numeric in some chunks and text in others: the column is read again on its own, as text
+		if not numeric and any(dtype.kind in 'iuf' for dtype in dtypes[name]):
+			values = pd.read_csv(poolFile, sep="\t", usecols=[name], dtype=str)[name]
+			codes, chunk_uniques = chunk_codes(values)
+			pieces[name] = [codes]
+			uniques[name] = [chunk_uniques]
+			dtypes[name] = [values.dtype]
+		column = {'name': name, 'file': 'col%05d.npy' % k}
+		if numeric:
+			# counts, unless the column holds missing, negative or > 2^32 values in any chunk
+			is_count = name not in pool_columns and nrows > 0 and all(piece.dtype == count_dtype for piece in pieces[name])
+			column['dtype'] = str(np.result_type(*dtypes[name]) if dtypes[name] else np.dtype(float))
+			column['kind'] = 'counts' if is_count else 'numeric'
+			values = np.concatenate(pieces[name]) if pieces[name] else np.zeros(0)
+			np.save(os.path.join(tmp_dir, column['file']), values if is_count else values.astype(column['dtype']))
+		else:
+			column['dtype'] = str(dtypes[name][0])
+			column['kind'] = 'categorical'
+			column['categories'] = 'cat%05d.npy' % k
+			codes, categories = merge_codes(pieces[name], uniques[name])
+			np.save(os.path.join(tmp_dir, column['file']), codes)
+			np.save(os.path.join(tmp_dir, column['categories']), categories)
+		pieces[name] = uniques[name] = None
+		columns.append(column)
+
+	meta = dict(source_key(poolFile), sha256=source_hash(poolFile), version=CACHE_VERSION, nrows=nrows, columns=columns)
+	with open(os.path.join(tmp_dir, 'meta.json'), 'w') as handle:
+		json.dump(meta, handle)
+	shutil.rmtree(cache_dir, ignore_errors=True)
+	os.rename(tmp_dir, cache_dir)
+	return meta
+
+# Return the meta data of an up to date cache of poolFile, building the cache if there is none or the source file has changed
+def open_cache(poolFile, cache_dir=None):
+	if cache_dir is None:
+		cache_dir = cache_path(poolFile)
+	meta_file = os.path.join(cache_dir, 'meta.json')
+	key = source_key(poolFile)
+	meta = None
+	if os.path.isfile(meta_file):
+		with open(meta_file) as handle:
+			meta = json.load(handle)
+	if meta is None or meta.get('version') != CACHE_VERSION or meta['size'] != key['size']:
+		meta = build_cache(poolFile, cache_dir)
+	elif meta['mtime_ns'] != key['mtime_ns']:
+		if meta['sha256'] == source_hash(poolFile):
+			meta['mtime_ns'] = key['mtime_ns']
+			with open(meta_file, 'w') as handle:
+				json.dump(meta, handle)
+		else:
+			meta = build_cache(poolFile, cache_dir)
+	meta['dir'] = cache_dir
+	return meta
+
+# Memory-mapped values of a cached column (the codes, for a categorical column), and the categories of a categorical column
+def load_column(meta, name):
+	column = next(column for column in meta['columns'] if column['name'] == name)
+	return np.load(os.path.join(meta['dir'], column['file']), mmap_mode='r')
+
+def load_categories(meta, name):
+	column = next(column for column in meta['columns'] if column['name'] == name)
+	return np.load(os.path.join(meta['dir'], column['categories'])).astype(str)
+
+# all.poolcount as a DataFrame from its cache, with the given columns (default: all, in file order) and rows (default: all, as positions or a mask).
+#	Count columns are uint32, categorical columns are expanded back to their text values with missing values as NaN. If the cache cannot be
+#	written (e.g. a read-only directory), the file is parsed directly.
+def read_pool(poolFile, columns=None, cache_dir=None, rows=None):
+	try:
+		meta = open_cache(poolFile, cache_dir)
+	except OSError as error:
+		print('Could not cache', poolFile, '('+str(error)+'), reading it directly')
+		Table = pd.read_csv(poolFile, sep="\t", usecols=columns)
+		return Table if rows is None else Table.iloc[rows].reset_index(drop=True)
+
+	Table = {}
+	for column in meta['columns']:
+		if columns is not None and column['name'] not in columns:
+			continue
+		values = load_column(meta, column['name'])
+		if rows is not None:
+			values = values[rows]
+		if column['kind'] == 'categorical':
+			categories = np.append(load_categories(meta, column['name']).astype(object), np.nan)
+			Table[column['name']] = pd.Series(categories[values], copy=False).astype(column['dtype'])
+		else:
+			Table[column['name']] = pd.Series(values, copy=False)
+	return pd.DataFrame(Table)
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <path to all.poolcount>")
+		sys.exit(0)
+
+	meta = open_cache(sys.argv[1])
+	print(meta['dir'] + ':', meta['nrows'], 'rows,', sum(column['kind'] == 'counts' for column in meta['columns']), 'count columns')
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, json, time, hashlib
+from scipy.cluster import hierarchy
+from scipy.spatial import distance
+try:
+	import fastcluster
+except ImportError:
+	fastcluster = None
+
+# Hierarchical clustering of the rows (genes) or columns (conditions and replicates) of a heatmap fitness matrix, for 10_heatmap.py engine=fast, in place
+#	of the clustering of sns.clustermap, so that genome-wide matrices (every gene with a fitness value) can be clustered:
+#		- the rows can first be reduced to their first components principal components (reduce=pca, from the SVD of the centered matrix) or to a
+#		  Gaussian random projection of components dimensions (reduce=random)
+#		- the euclidean, sqeuclidean, cosine and correlation distances are computed block by block, from the dot products of the rows, into the condensed
+#		  float64 vector both linkage backends take without a copy (n(n-1)/2 values, as from scipy.spatial.distance.pdist, with no square matrix and only
+#		  one block of temporary values); other metrics use pdist
+#		- the linkage uses fastcluster when it is installed (with linkage_vector, which needs no distances at all, for the euclidean single, centroid,
+#		  median and ward methods), and scipy.cluster.hierarchy.linkage otherwise
+#		- the linkage is saved in a cache directory under a hash of the matrix and the clustering parameters, so re-rendering the same heatmap with
+#		  another cmap, font_scale or figsize does not cluster it again
+#	The linkage matrices are those of scipy.cluster.hierarchy, which sns.clustermap takes as row_linkage and col_linkage.
+#
+# Usage:
+#	python3 PATH/BarSeq_Cluster.py <PATH/heatmap_file.csv> <kwargs>		clusters the rows of a heatmap csv file written by 10_heatmap.py (rows with
+#		missing values left out) and writes the genes in dendrogram order
+#
+#	Optional kwargs (given as name=value):
+#		method=average			linkage method, as for scipy.cluster.hierarchy.linkage
+#		metric=euclidean		distance metric, as for scipy.spatial.distance.pdist
+#		reduce=none				none, pca or random
+#		components=20			number of dimensions kept by reduce=pca or reduce=random
+#		cache=PATH				linkage cache directory (default: <heatmap_file>.linkage)
+#		output=PATH.csv			genes in dendrogram order (default: <heatmap_file>_order.csv)
+
+LINKAGE_VERSION = 2
+block_size = 1024
+cache_size = 16
+vector_methods = ('single', 'centroid', 'median', 'ward')
+
+
+# Rows of a matrix reduced to components dimensions: their principal component scores (pca) or a Gaussian random projection (random)
+def reduce_rows(matrix, reduction='none', components=20, seed=0):
+	matrix = np.asarray(matrix, dtype=float)
+	if reduction == 'none' or components >= matrix.shape[1]:
+		return matrix
+	if reduction == 'pca':
+		U, S, Vt = np.linalg.svd(matrix - matrix.mean(axis=0), full_matrices=False)
+		return U[:,:components]*S[:components]
+	if reduction == 'random':
+		projection = np.random.default_rng(seed).standard_normal((matrix.shape[1], components))/np.sqrt(components)
+		return matrix @ projection
+	raise ValueError('unknown reduction ' + str(reduction) + ', expected none, pca or random')
+
+# Condensed distances between the rows of a matrix, as scipy.spatial.distance.pdist gives them (float64, which the scipy and fastcluster linkages use
+#	as they are). The euclidean, sqeuclidean, cosine and correlation distances are computed from the dot products of block_size rows at a time with
+#	the rows after them.
+def condensed_distances(matrix, metric='euclidean'):
+	matrix = np.asarray(matrix, dtype=float)
+	if metric not in ('euclidean', 'sqeuclidean', 'cosine', 'correlation'):
+		return distance.pdist(matrix, metric)
+	if metric == 'correlation':
+		matrix = matrix - matrix.mean(axis=1)[:,None]
+	if metric in ('cosine', 'correlation'):
+		matrix = matrix/np.linalg.norm(matrix, axis=1)[:,None]
+	n = len(matrix)
+	squares = np.einsum('ij,ij->i', matrix, matrix)
+	distances = np.empty(n*(n-1)//2)
+	for start in range(0, n, block_size):
+		stop = min(start + block_size, n)
+		# the distances are computed in place in the block of dot products
+		block = matrix[start:stop] @ matrix[start:].T
+		if metric in ('cosine', 'correlation'):
+			np.subtract(1, block, out=block)
+		else:
+			block *= -2
+			block += squares[start:stop,None]
+			block += squares[None,start:]
+			np.maximum(block, 0, out=block)
+			if metric == 'euclidean':
+				np.sqrt(block, out=block)
+		# row i of the block holds the distances of row start+i to the rows start..n-1, of which those after it are the condensed values
+		for i in range(stop - start):
+			row = start + i
+			offset = row*n - row*(row+1)//2
+			distances[offset:offset + n - row - 1] = block[i, i+1:]
+		del block  # freed before the next block is computed
+	return distances
+
+# Linkage of the rows of a matrix (see the methods above)
+def row_linkage(matrix, method='average', metric='euclidean', reduction='none', components=20):
+	matrix = reduce_rows(matrix, reduction, components)
+	if fastcluster is not None and metric == 'euclidean' and method in vector_methods:
+		return fastcluster.linkage_vector(matrix, method=method, metric=metric)
+	distances = condensed_distances(matrix, metric)
+	if fastcluster is not None:
+		return fastcluster.linkage(distances, method=method)
+	return hierarchy.linkage(distances, method=method)
+
+# What a linkage depends on: the matrix values (hashed) and the clustering parameters
+def linkage_key(matrix, method, metric, reduction, components):
+	matrix = np.ascontiguousarray(matrix, dtype=float)
+	key = {'version': LINKAGE_VERSION, 'shape': list(matrix.shape), 'sha256': hashlib.sha256(matrix.tobytes()).hexdigest(), 'method': method, 'metric': metric,
+		'reduction': reduction, 'components': components if reduction != 'none' else None}
+	return key, hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+# Linkage of the rows of a matrix, from cache_dir if it was computed before with the same values and parameters, computed (and saved there) otherwise.
+#	Only the cache_size most recently used linkages are kept in cache_dir.
+def cached_linkage(matrix, method='average', metric='euclidean', reduction='none', components=20, cache_dir=None):
+	if cache_dir is None:
+		return row_linkage(matrix, method, metric, reduction, components)
+	key, digest = linkage_key(matrix, method, metric, reduction, components)
+	linkage_file = os.path.join(cache_dir, digest+'.npy')
+	if os.path.isfile(linkage_file):
+		os.utime(linkage_file)
+		return np.load(linkage_file)
+
+	linkage = row_linkage(matrix, method, metric, reduction, components)
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		tmp_file = linkage_file + '.tmp' + str(os.getpid()) + '.npy'
+		np.save(tmp_file, linkage)
+		os.replace(tmp_file, linkage_file)
+		saved = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.npy') and '.tmp' not in name),
+			key=os.path.getmtime, reverse=True)
+		for old_file in saved[cache_size:]:
+			os.remove(old_file)
+	except OSError as error:
+		print('Could not save the linkage in', cache_dir, '('+str(error)+')')
+	return linkage
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <path to heatmap csv file> <kwargs>")
+		sys.exit(0)
+
+	kwargs = dict(arg.split('=') for arg in sys.argv[2:])
+	Heatmap_File = pd.read_csv(sys.argv[1], index_col=0).dropna(how='any')
+	start = time.perf_counter()
+	linkage = cached_linkage(Heatmap_File.values, kwargs.get('method', 'average'), kwargs.get('metric', 'euclidean'), kwargs.get('reduce', 'none'),
+		int(kwargs.get('components', 20)), kwargs.get('cache', sys.argv[1].split('.csv')[0]+'.linkage'))
+	print(len(Heatmap_File), 'genes clustered in', round(time.perf_counter() - start, 3), 's')
+	pd.Series(Heatmap_File.index[hierarchy.leaves_list(linkage)], name=Heatmap_File.index.name).to_csv(kwargs.get('output', sys.argv[1].split('.csv')[0]+'_order.csv'), index=False)
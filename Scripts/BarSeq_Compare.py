@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, itertools
+import BarSeq_Results as br
+import BarSeq_Stats as bst
+
+# Comparison of many enrichment conditions at once, generalizing 8_Fitness_Compare.py to every pair of conditions (or every condition against a
+#	reference condition).
+#
+#	The merged replicate tables of the conditions (_Fitness_Summary.csv files of 7_Replicates_Table.py, or the tables of BarSeq_Pipeline.merge_replicates)
+#	are loaded once into a shared conditions x genes x replicates fitness tensor, with the position of each gene in each table (-1 if the table does not
+#	have it). The pairs are then compared in batches of array operations: the genes found in both conditions of each pair, the two-tailed two sample
+#	t-test of every gene and pair, and the q-values of each pair (capped at 1 and adjusted for monotonicity, see BarSeq_Stats.py). Each pair gives the
+#	same rows, order and values as 8_Fitness_Compare.py would.
+#
+#	The results can be written as one long-format table (one row per pair and gene) or as one <Condition_1>_v_<Condition_2>_Summary.csv file per pair.
+#
+# Usage:
+#	python3 PATH/BarSeq_Compare.py <PATH/Condition_Fitness_Summary.csv files> <kwargs>
+#	python3 PATH/BarSeq_Compare.py results=PATH/BL_1/results <kwargs>
+#
+# Inputs:
+#	The _Fitness_Summary.csv file of each condition, as generated by 7_Replicates_Table.py; the condition label is the file name without
+#		_Fitness_Summary.csv (e.g. 4_Fitness_Summary.csv -> 4)
+#	or the results store of a baseline written by BarSeq_Pipeline.py (see BarSeq_Results.py), of which only the compared conditions are read
+#
+#	Optional kwargs (given as name=value):
+#		reference=4				compare every other condition to this one (as Condition_2), instead of every pair of conditions
+#		pairs=4:5,4:6			compare only these pairs, the first of each pair being Condition_1
+#		format=long				long: one All_Comparisons.csv table, pairs: one <Condition_1>_v_<Condition_2>_Summary.csv file per pair
+#		output=PATH				file name of the long-format table (default All_Comparisons.csv)
+#		results=PATH			read the conditions from this results store instead of _Fitness_Summary.csv files
+#
+# Output files:
+#	All_Comparisons.csv has the columns Condition_1, Condition_2, Locus_Tag, Condition_1_mean, Condition_2_mean, t-statistic, p-value, q-value and
+#		adjusted_q-value, each pair sorted by p-value as in the _Summary.csv file of 8_Fitness_Compare.py
+#	<Condition_1>_v_<Condition_2>_Summary.csv as generated by 8_Fitness_Compare.py (format=pairs)
+
+long_columns = ['Condition_1', 'Condition_2', 'Locus_Tag', 'Condition_1_mean', 'Condition_2_mean', 't-statistic', 'p-value', 'q-value', 'adjusted_q-value']
+
+
+# Fitness tensor of the merged replicate tables of the conditions ({condition: table indexed by gene with NormGeneFit_A, etc. and mean columns}):
+#	a dict of conditions, genes (the genes of every table, in the order they first appear), replicates (the replicate letters of each condition),
+#	fitness (conditions x genes x replicates, NaN for missing values), means (conditions x genes) and positions (conditions x genes, the row of
+#	each gene in the table of each condition, -1 if missing)
+def fitness_tensor(Summaries):
+	conditions = list(Summaries)
+	genes = pd.Index(pd.unique(np.concatenate([np.asarray(Summary.index, dtype=object) for Summary in Summaries.values()])))
+	replicates = [[column.split('_')[1] for column in Summary.columns if column.startswith('NormGeneFit_')] for Summary in Summaries.values()]
+	fitness = np.full((len(conditions), len(genes), max(len(letters) for letters in replicates)), np.nan)
+	means = np.full((len(conditions), len(genes)), np.nan)
+	positions = np.full((len(conditions), len(genes)), -1, dtype=np.int64)
+	for c, Summary in enumerate(Summaries.values()):
+		rows = genes.get_indexer(Summary.index)
+		fitness[c, rows, :len(replicates[c])] = Summary[['NormGeneFit_'+replicate for replicate in replicates[c]]].to_numpy(dtype=float)
+		means[c, rows] = Summary['mean'].to_numpy(dtype=float)
+		positions[c, rows] = np.arange(len(rows))
+	return {'conditions': conditions, 'genes': genes, 'replicates': replicates, 'fitness': fitness, 'means': means, 'positions': positions}
+
+# Condition pairs to compare: the given pairs, every condition against reference (as Condition_2), or every pair of conditions in order
+def condition_pairs(conditions, pairs=None, reference=None):
+	if pairs is not None:
+		return [tuple(pair) for pair in pairs]
+	if reference is not None:
+		return [(condition, reference) for condition in conditions if condition != reference]
+	return list(itertools.combinations(conditions, 2))
+
+# Compare the condition pairs of a fitness tensor, batch pairs at a time. Returns the long-format table of every pair (long_columns), the genes of
+#	each pair sorted by p-value, then by their order in the Condition_1 table.
+def compare_pairs(Tensor, pairs, batch=100):
+	index = {condition: c for c, condition in enumerate(Tensor['conditions'])}
+	nReplicates = [len(letters) for letters in Tensor['replicates']]
+	c1 = np.array([index[Cond1] for Cond1, Cond2 in pairs], dtype=np.int64)
+	c2 = np.array([index[Cond2] for Cond1, Cond2 in pairs], dtype=np.int64)
+
+	# pairs with the same numbers of replicates are tested together
+	results = [None]*len(pairs)
+	groups = pd.Series(range(len(pairs))).groupby([[nReplicates[c] for c in c1], [nReplicates[c] for c in c2]], sort=False).indices
+	for (n1, n2), members in groups.items():
+		for start in range(0, len(members), batch):
+			k = members[start:start+batch]
+			both = (Tensor['positions'][c1[k]] >= 0) & (Tensor['positions'][c2[k]] >= 0)
+			t, p = bst.ttest_ind(Tensor['fitness'][c1[k], :, :n1], Tensor['fitness'][c2[k], :, :n2], equal_var=True)
+
+			# sort each pair's genes found in both conditions by p-value, then by their order in Condition_1, and the other genes last
+			order = np.lexsort((Tensor['positions'][c1[k]], p, ~both), axis=-1)
+			nGenes = both.sum(axis=1)
+			sorted_p = np.where(np.take_along_axis(both, order, axis=-1), np.take_along_axis(p, order, axis=-1), np.nan)
+			q, adjusted = bst.qvalues(sorted_p, cap=1, n=nGenes)
+			for j, pair in enumerate(k):
+				rows = order[j, :nGenes[j]]
+				results[pair] = (rows, t[j, rows], sorted_p[j, :nGenes[j]], q[j, :nGenes[j]], adjusted[j, :nGenes[j]])
+
+	sizes = [len(result[0]) for result in results]
+	rows = np.concatenate([result[0] for result in results])
+	pair_of_row = np.repeat(np.arange(len(pairs)), sizes)
+	return pd.DataFrame({'Condition_1': np.repeat([Cond1 for Cond1, Cond2 in pairs], sizes), 'Condition_2': np.repeat([Cond2 for Cond1, Cond2 in pairs], sizes),
+		'Locus_Tag': np.asarray(Tensor['genes'])[rows], 'Condition_1_mean': Tensor['means'][c1[pair_of_row], rows],
+		'Condition_2_mean': Tensor['means'][c2[pair_of_row], rows], 't-statistic': np.concatenate([result[1] for result in results]),
+		'p-value': np.concatenate([result[2] for result in results]), 'q-value': np.concatenate([result[3] for result in results]),
+		'adjusted_q-value': np.concatenate([result[4] for result in results])})
+
+# Compare the merged replicate tables of the conditions for the given pairs (default: every pair, or every condition against reference)
+def compare_all(Summaries, pairs=None, reference=None, batch=100):
+	Tensor = fitness_tensor(Summaries)
+	return compare_pairs(Tensor, condition_pairs(Tensor['conditions'], pairs, reference), batch)
+
+# The comparison of one pair as in the _Summary.csv file of 8_Fitness_Compare.py, from its rows of the long-format table (Pair): indexed by Locus_Tag,
+#	with the replicate and mean fitness of each condition, the t-statistic, p-value and q-values
+def pair_table(Summary_1, Summary_2, Cond1Label, Cond2Label, Pair):
+	genes = pd.Index(Pair['Locus_Tag'].values, name='Locus_Tag')
+	columns = {}
+	for Summary, Label in [(Summary_1, Cond1Label), (Summary_2, Cond2Label)]:
+		Table = Summary.loc[genes]
+		for column in Summary.columns:
+			if column.startswith('NormGeneFit_'):
+				columns[Label+'_Rep'+column.split('_')[1]] = Table[column].values
+		columns[Label+'_mean'] = Table['mean'].values
+	for column in ['t-statistic', 'p-value', 'q-value', 'adjusted_q-value']:
+		columns[column] = Pair[column].values
+	return pd.DataFrame(columns, index=genes)
+
+# Write the comparisons of a long-format table as one <Condition_1>_v_<Condition_2>_Summary.csv file per pair
+def write_pair_tables(Summaries, Comparisons, out_dir='.'):
+	for (Cond1, Cond2), Pair in Comparisons.groupby(['Condition_1', 'Condition_2'], sort=False):
+		Comparison = pair_table(Summaries[Cond1], Summaries[Cond2], Cond1, Cond2, Pair)
+		Comparison.to_csv(os.path.join(out_dir, Cond1+'_v_'+Cond2+'_Summary.csv'), index_label='# Locus_Tag')
+
+
+if __name__=='__main__':
+	files = [arg for arg in sys.argv[1:] if '=' not in arg]
+	kwargs = dict(arg.split('=') for arg in sys.argv[1:] if '=' in arg)
+	if len(files) < 2 and 'results' not in kwargs:
+		print("Usage: " + sys.argv[0] + " <PATH/Condition_Fitness_Summary.csv files> <kwargs>")
+		sys.exit(0)
+
+	pairs = [tuple(pair.split(':')) for pair in kwargs['pairs'].split(',')] if 'pairs' in kwargs else None
+	if 'results' in kwargs:
+		Results = br.open_results(kwargs['results'])
+		pairs = condition_pairs(Results['conditions'], pairs, kwargs.get('reference'))
+		conditions = list(dict.fromkeys(condition for pair in pairs for condition in pair))
+		Comparisons = compare_pairs(br.fitness_tensor(Results, conditions), pairs)
+		Summaries = {condition: br.summary_table(Results, condition) for condition in conditions} if kwargs.get('format', 'long') == 'pairs' else None
+	else:
+		Summaries = {}
+		for summaryFile in files:
+			Summaries[os.path.basename(summaryFile).split('_Fitness_Summary.csv')[0]] = pd.read_csv(summaryFile, index_col=0, float_precision='round_trip')
+		Comparisons = compare_all(Summaries, pairs, kwargs.get('reference'))
+	if kwargs.get('format', 'long') == 'pairs':
+		write_pair_tables(Summaries, Comparisons)
+	else:
+		Comparisons.to_csv(kwargs.get('output', 'All_Comparisons.csv'), index=False)
+	print(Comparisons.groupby(['Condition_1', 'Condition_2'], sort=False).ngroups, 'condition pairs compared')
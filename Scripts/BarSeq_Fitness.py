@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import math
+import bisect
+import BarSeq_Metrics as bm
+
+# Whole-column gene fitness calculations used by 5_BarSeqProc_analyzeExp.py. These reproduce the strain-by-strain passes of the original script
+#	(pseudocount psi, weighted uGeneFitness, and sumSq/half-gene uGF1/uGF2) according to the methods used in Wetmore, Kelly M., et al. MBio (2015),
+#	but work on every strain at once using the gene offsets of the strains grouped by locusId.
+#
+#	Per-gene sums are taken with np.bincount, which adds the strains of a gene in table order, and powers use the C library pow() (see c_pow),
+#	so results are identical to the Python sum() over the lists of NumPy scalars that the original loops built.
+#
+# Usage (from another script in this directory):
+#	import BarSeq_Fitness as bf
+#	order, gene_index = bf.strain_gene_index(Used_Genes, Loci_Labels)
+#	fit = bf.gene_fitness(BL_counts[order], Enrichment_counts[order], gene_index, f[order], BL_Sums, strain_Sums)
+#	or, for every condition of a baseline at once, with strains x conditions counts and genes x conditions sums
+#	fit = bf.condition_fitness(bf.gene_fitness_matrix(BL_counts[order], Enrichment_matrix[order], gene_index, f[order], BL_Sums, strain_Sums_matrix), c)
+#	normGeneFitness = bf.normalize_gene_fitness(fit['uGeneFitness'])
+#	tStat_abs = bf.gene_tStat(normGeneFitness, fit, BL_Sums, strain_Sums)
+
+maxWt = 5.044 	# = ((2/21)/((np.log(2))**2))**(-1), strains with low variance are favored, but not too much
+qnorm = 0.674 	# qnorm(0.75) = 0.674, 75th percentile of normal distribution
+sigma = 0.1 	# small constant to represent uncertainty in normalization for small fitness values
+minStrainReads = 3 	# baseline reads for a strain to be used (the in3genes table of 4_BarSeqProc_loadExps.py)
+minGeneReads = 30 	# baseline reads for a gene to be analyzed (genes below are listed in <30_Unused_BL_genes.csv)
+
+
+##########################################################################
+# Group strains by gene: index of each strain's gene and gene offsets    #
+##########################################################################
+
+# Returns the (stable) order that groups the strains by their position in Loci_Labels and the gene index of each strain in that order.
+#	Strains whose locusId is not in Loci_Labels are dropped. For in3genes tables the strains of a gene are already contiguous and in
+#	Loci_Labels order, so the returned order is the original row order.
+def strain_gene_index(Used_Genes, Loci_Labels):
+	gene_index = pd.Index(Loci_Labels).get_indexer(Used_Genes)
+	order = np.flatnonzero(gene_index >= 0)
+	order = order[np.argsort(gene_index[order], kind='stable')]
+	return order, gene_index[order]
+
+# Start offset of each gene's strains and number of strains per gene, from a sorted gene index
+def gene_offsets(gene_index, nGenes):
+	counts = np.bincount(gene_index, minlength=nGenes)
+	starts = np.zeros(nGenes, dtype=np.int64)
+	np.cumsum(counts[:-1], out=starts[1:])
+	return starts, counts
+
+# Elementwise x**y with the C library pow(), as NumPy scalars do. The array power (SIMD, or x*x for squares) can differ in the last bit.
+math_pow = np.frompyfunc(math.pow, 2, 1)
+
+def c_pow(x, y):
+	return math_pow(x, y).astype(float)
+
+# Sum of values over the strains of each gene, for each column of a strains x conditions array, added in strain order
+def gene_sums(values, gene_index, nGenes):
+	nColumns = values.shape[1]
+	bins = (gene_index[:,None]*nColumns + np.arange(nColumns)).ravel()
+	return np.bincount(bins, weights=values.ravel(), minlength=nGenes*nColumns).reshape(nGenes, nColumns)
+
+# Median of values over the strains of each gene, for each column of a strains x conditions array (every gene must have at least one strain)
+def gene_medians(values, gene_index, nGenes):
+	starts, counts = gene_offsets(gene_index, nGenes)
+	# sort by gene, then value, as a single integer key: gene * nStrains + rank of the value in its column
+	nStrains = len(values)
+	ranks = np.empty(values.shape, dtype=np.int64)
+	np.put_along_axis(ranks, np.argsort(values, axis=0), np.arange(nStrains)[:,None], axis=0)
+	order = np.argsort(gene_index[:,None]*nStrains + ranks, axis=0)
+	sorted_values = np.take_along_axis(values, order, axis=0)
+	lo = sorted_values[starts + (counts - 1)//2]
+	hi = sorted_values[starts + counts//2]
+	return np.where((counts % 2 == 1)[:,None], lo, (lo + hi)/2)
+
+
+##########################################################################
+# Fitness passes                                                         #
+##########################################################################
+
+# preliminary strain fitness (psf) and preliminary gene fitness (pgf, median psf of each gene) are used to find the pseudocount (psi) of each gene
+#	psi = (2^prelimGeneF)*readRatio for genes with >=3 strains, otherwise psi = readRatio avoids noise in low-count estimates
+def pseudocounts(BL_counts, Enrichment_counts, gene_index, readRatio):
+	nGenes = len(readRatio)
+	ratio_val = readRatio[gene_index]
+	prelimStrainF = np.log2(Enrichment_counts + np.sqrt(ratio_val)) - np.log2(BL_counts + 1/(np.sqrt(ratio_val)))
+	prelimGeneF = gene_medians(prelimStrainF, gene_index, nGenes)
+	strain_number = np.bincount(gene_index, minlength=nGenes)
+	psi = np.where((strain_number >= 3)[:,None], c_pow(2, prelimGeneF)*readRatio, readRatio)
+	return psi, strain_number
+
+# strain fitness using the gene pseudocount values and strain weights, inversely proportional to the naive strain variance
+def strain_fitness(BL_counts, Enrichment_counts, gene_index, psi):
+	gene_pseudocount = psi[gene_index]
+	strainPseudoCount = np.sqrt(gene_pseudocount)
+	BL_PseudoCount = 1/np.sqrt(gene_pseudocount)
+	sf = np.log2(strainPseudoCount + Enrichment_counts) - np.log2(BL_PseudoCount + BL_counts)
+	sv = ((1/(1+Enrichment_counts)) + (1/(1+BL_counts)))/((np.log(2))**2) 	# naive strain variance
+	sw = np.minimum(maxWt, (1/(sv)))
+	return sf, sw
+
+# Computes every per-gene value of the three passes of 5_BarSeqProc_analyzeExp.py for all the conditions of a baseline at once.
+#	BL_counts and f are strain columns grouped by gene (see strain_gene_index), Enrichment_counts is the strains x conditions count matrix in
+#	the same order. BL_Sums are the baseline gene sums and strain_Sums the genes x conditions matrix of condition gene sums.
+#	Genes with a zero sum in a condition are masked in that condition (analyzed is False and their values are NaN) rather than deleted.
+#	uGF1/uGF2 and the halves count sums are only set for genes where both gene halves (f <= 0.5, f > 0.5) have a T=0 count >= 15 (halves).
+def gene_fitness_matrix(BL_counts, Enrichment_counts, gene_index, f, BL_Sums, strain_Sums):
+	nGenes, nConditions = strain_Sums.shape
+	BL_counts = np.asarray(BL_counts)[:,None]
+	analyzed = strain_Sums != 0
+	readRatio = np.where(analyzed, strain_Sums/np.asarray(BL_Sums)[:,None], np.nan)
+	with bm.stage('pseudocounts', rows_in=len(gene_index), conditions=nConditions):
+		psi, strain_number = pseudocounts(BL_counts, Enrichment_counts, gene_index, readRatio)
+
+	with bm.stage('weighting', rows_in=len(gene_index), conditions=nConditions):
+		sf, sw = strain_fitness(BL_counts, Enrichment_counts, gene_index, psi)
+
+		# weighted, unnormalized gene fitness
+		denom = gene_sums(sw, gene_index, nGenes)
+		uGeneFitness = gene_sums(sw*sf, gene_index, nGenes)/denom
+
+		# sumSq, the weighted sum of squared differences of strain fitness for the gene
+		sumSq = gene_sums(sw*c_pow(sf - uGeneFitness[gene_index], 2), gene_index, nGenes)/denom
+
+	# unnormalized gene fitness of each gene half, where both halves have a T=0 count >= 15
+	# Note, unlike the Wetmore et al., 2015 manuscript, strains in the first or last 10% of the gene are still included
+	with bm.stage('halves', rows_in=len(gene_index), conditions=nConditions):
+		first = f <= 0.5
+		second = f > 0.5
+		BL_1 = gene_sums(BL_counts[first], gene_index[first], nGenes)
+		BL_2 = gene_sums(BL_counts[second], gene_index[second], nGenes)
+		Enrichment_1 = gene_sums(Enrichment_counts[first], gene_index[first], nGenes)
+		Enrichment_2 = gene_sums(Enrichment_counts[second], gene_index[second], nGenes)
+		halves = (BL_1 > 14) & (BL_2 > 14) & analyzed
+		uGF1 = np.divide(gene_sums((sw*sf)[first], gene_index[first], nGenes), gene_sums(sw[first], gene_index[first], nGenes), out=np.full((nGenes, nConditions), np.nan), where=halves)
+		uGF2 = np.divide(gene_sums((sw*sf)[second], gene_index[second], nGenes), gene_sums(sw[second], gene_index[second], nGenes), out=np.full((nGenes, nConditions), np.nan), where=halves)
+		Enrichment_sums_halves = np.where(halves, Enrichment_1 + Enrichment_2, 0)
+		BL_sums_halves = np.where(halves, BL_1 + BL_2, 0)
+
+	return {'gene_index': gene_index, 'analyzed': analyzed, 'halves': halves, 'psi': psi, 'strainFitness': sf, 'strainWeight': sw,
+		'uGeneFitness': uGeneFitness, 'sumSq': sumSq, 'number_unique_strains_at_locus': strain_number, 'uGF1': uGF1, 'uGF2': uGF2,
+		'Enrichment_sums_halves': Enrichment_sums_halves, 'BL_sums_halves': BL_sums_halves}
+
+# The values of one condition (column c) of gene_fitness_matrix, for just the genes analyzed in that condition (non-zero sums),
+#	with the half-gene values for just the genes used to estimate Vt
+def condition_fitness(fit, c):
+	analyzed = fit['analyzed'][:,c]
+	halves = fit['halves'][analyzed,c]
+	strains = analyzed[fit['gene_index']]
+	return {'psi': fit['psi'][analyzed,c], 'strainFitness': fit['strainFitness'][strains,c], 'strainWeight': fit['strainWeight'][strains,c],
+		'uGeneFitness': fit['uGeneFitness'][analyzed,c], 'sumSq': fit['sumSq'][analyzed,c],
+		'number_unique_strains_at_locus': fit['number_unique_strains_at_locus'][analyzed],
+		'uGF1': fit['uGF1'][analyzed,c][halves], 'uGF2': fit['uGF2'][analyzed,c][halves],
+		'Enrichment_sums_halves': fit['Enrichment_sums_halves'][analyzed,c][halves], 'BL_sums_halves': fit['BL_sums_halves'][analyzed,c][halves]}
+
+# Per-gene values of the three passes for a single condition, from strain count columns grouped by gene (see strain_gene_index)
+def gene_fitness(BL_counts, Enrichment_counts, gene_index, f, BL_Sums, strain_Sums):
+	fit = gene_fitness_matrix(BL_counts, np.asarray(Enrichment_counts)[:,None], gene_index, f, BL_Sums, np.asarray(strain_Sums)[:,None])
+	return condition_fitness(fit, 0)
+
+
+##########################################################################
+# Normalization and t-like statistic                                     #
+##########################################################################
+
+# Median of a window of `window` values centred on each position (125 values on either side for the 251-gene window), wrapping around the
+#	ends as for a circular chromosome. The window is kept sorted and updated with one removal and one insertion per position, so the whole
+#	array is done in one streaming pass. With fewer values than the window size (e.g. a plasmid scaffold), the window wraps around more than once and
+#	holds some values several times, as np.take(values, ..., mode='wrap') of the original loop did.
+def circular_rolling_median(values, window=251):
+	nValues = len(values)
+	if nValues == 0:
+		return np.zeros(0)
+	left = (window - 1)//2
+	right = window - 1 - left
+	values = list(values)
+	sorted_window = sorted(values[k % nValues] for k in range(-left, right + 1))
+	mid_lo = (window - 1)//2
+	mid_hi = window//2
+	medians = np.zeros(shape=(nValues))
+	for l in range(0,nValues):
+		medians[l] = (sorted_window[mid_lo] + sorted_window[mid_hi])/2
+		if l < nValues - 1:
+			del sorted_window[bisect.bisect_left(sorted_window, values[(l - left) % nValues])]
+			bisect.insort(sorted_window, values[(l + right + 1) % nValues])
+	return medians
+
+# normalize gene fitness by subtracting the median of the window of genes around each gene (251 genes: 125 genes on either side of GOI).
+#	If the scaffold of each gene is given, every scaffold (chromosome, plasmids) is normalized separately with its own circular window.
+def normalize_gene_fitness(uGeneFitness, window=251, scaffolds=None):
+	uGeneFitness = np.asarray(uGeneFitness, dtype=float)
+	if scaffolds is None:
+		return uGeneFitness - circular_rolling_median(uGeneFitness, window)
+	scaffolds = np.asarray(scaffolds)
+	normGeneFitness = np.zeros(shape=(len(uGeneFitness)))
+	for scaffold in pd.unique(scaffolds):
+		on_scaffold = np.flatnonzero(scaffolds == scaffold)
+		normGeneFitness[on_scaffold] = uGeneFitness[on_scaffold] - circular_rolling_median(uGeneFitness[on_scaffold], window)
+	return normGeneFitness
+
+# t-like test statistic, from Wetmore et al., t = normGeneFitness/sqrt(sigma^2 + max(Ve,Vn)). The baseline term of Vn, 1/(1+BL_Sums), can be
+#	given as BL_Vn when it is shared by several conditions (see BarSeq_Baseline.py).
+def gene_tStat(normGeneFitness, fit, BL_Sums, strain_Sums, BL_Vn=None):
+	# eliminates the genes with zero count sums in the halves arrays, as the original loops did
+	Enrichment_sums_halves = fit['Enrichment_sums_halves'][fit['Enrichment_sums_halves'] != 0]
+	BL_sums_halves = fit['BL_sums_halves'][fit['BL_sums_halves'] != 0]
+
+	# Vn, the naive gene variance
+	Vn = ((1/(1+strain_Sums)) + ((1/(1+BL_Sums)) if BL_Vn is None else BL_Vn))/((np.log(2))**2)
+
+	# Vt, variance in typical gene, based on median absolute difference between the two halves, and Vn for just those genes (VnH)
+	madsdiff = np.absolute(fit['uGF1'] - fit['uGF2'])
+	VnH = ((1/(1+Enrichment_sums_halves)) + (1/(1+BL_sums_halves)))/((np.log(2))**2)
+	mad12 = np.median(madsdiff)
+	Vt = (mad12**2)/((2*qnorm)**2)
+
+	# Vg, pseudovariance, Vg = Vt * [Vn/median(VnH)]^2 and Ve, estimated variance, Ve = (sumSq + Vg) / n
+	Vg = Vt*c_pow(Vn/np.median(VnH), 2)
+	Ve = (fit['sumSq'] + Vg)/fit['number_unique_strains_at_locus']
+
+	return np.absolute(normGeneFitness/(np.sqrt((sigma**2) + np.maximum(Ve, Vn))))
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+import numpy as np
+import time
+from matplotlib.patches import FancyArrowPatch
+from scipy.spatial import cKDTree
+
+# Bounded-cost placement of point labels on a matplotlib axes, for 11_2D_Graph.py label_mode=grid, in place of adjust_text, whose repulsion between
+#	every label and every point makes hundreds of labels over thousands of points take minutes. The labels and points are indexed with KD-trees
+#	(in display pixels, with the Chebyshev distance), so each label is only compared with the labels and points close enough to overlap it, and the
+#	points are also counted on a pixel grid (a summed-area table), so the points under any box are counted in constant time:
+#		1. repulsion: each label starts just above its point and is pushed out of the labels and points it overlaps, for at most max_iterations
+#		   iterations and time_budget seconds (stopping early once nothing overlaps)
+#		2. greedy fallback: each label still overlapping something, in label order, is moved to the first free position among a fixed set of
+#		   candidates on rings around its point (or to the candidate with the fewest overlaps, if it has fewer than where the label is)
+#	The cost is at most max_iterations passes over the neighbouring pairs plus, for each label, one check of len(directions) x rings candidates
+#	against the labels around its point and the point grid. Without a time budget (time_budget=None) the placement is deterministic; a time budget that
+#	is reached makes the number of repulsion iterations depend on the machine. Labels that end up away from their point get an arrow to it.
+#
+# Usage (from another script in this directory):
+#	import BarSeq_Labels as bl
+#	texts = bl.place_labels(plt.gca(), x, y, labels, points=(all_x, all_y), point_size=18, arrow_color='blue', weight='bold', c='blue', fontsize=6)
+
+rings = 6
+directions = np.array([(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)], dtype=float)
+
+
+# Boxes (x0, y0, x1, y1) of the given centres and half sizes
+def boxes(centers, half):
+	return np.concatenate([centers - half, centers + half], axis=-1)
+
+# Whether boxes a and b overlap, element by element (with broadcasting)
+def overlapping(a, b):
+	return (a[...,0] < b[...,2]) & (b[...,0] < a[...,2]) & (a[...,1] < b[...,3]) & (b[...,1] < a[...,3])
+
+# Overlap of boxes a and b along x and y (positive where they overlap)
+def overlap_sizes(a, b):
+	return np.minimum(a[...,2], b[...,2]) - np.maximum(a[...,0], b[...,0]), np.minimum(a[...,3], b[...,3]) - np.maximum(a[...,1], b[...,1])
+
+# Move label boxes inside the axes box (x0, y0, x1, y1)
+def clamp(centers, half, bounds):
+	return np.minimum(np.maximum(centers, np.array(bounds[:2]) + half), np.array(bounds[2:]) - half)
+
+# Summed-area table of the number of points in each pixel of the axes box, and the number of points whose centre lies within (x0, y0, x1, y1) boxes
+def point_grid(point_xy, bounds):
+	shape = (int(np.ceil(bounds[2] - bounds[0])) + 1, int(np.ceil(bounds[3] - bounds[1])) + 1)
+	cells = np.floor(point_xy - np.array(bounds[:2])).astype(np.int64)
+	inside = (cells >= 0).all(axis=1) & (cells[:,0] < shape[0]) & (cells[:,1] < shape[1])
+	grid = np.zeros((shape[0]+1, shape[1]+1), dtype=np.int64)
+	np.add.at(grid, (cells[inside,0]+1, cells[inside,1]+1), 1)
+	return grid.cumsum(axis=0).cumsum(axis=1)
+
+def grid_counts(grid, box, bounds):
+	x0, x1 = (np.clip(np.floor(box[...,k] - bounds[0]).astype(np.int64) + (k == 2), 0, grid.shape[0]-1) for k in (0, 2))
+	y0, y1 = (np.clip(np.floor(box[...,k] - bounds[1]).astype(np.int64) + (k == 3), 0, grid.shape[1]-1) for k in (1, 3))
+	return grid[x1, y1] - grid[x0, y1] - grid[x1, y0] + grid[x0, y0]
+
+# Push of each label out of the labels and points it overlaps: along the axis of least overlap, away from the other box (upwards or rightwards on a
+#	tie, so the result is deterministic), half the overlap for each of two labels and the whole overlap for a point. Returns the pushes and the
+#	number of boxes each label overlaps.
+def pushes(centers, half, point_tree, point_boxes, radius):
+	label_boxes = boxes(centers, half)
+	label_tree = cKDTree(centers)  # built once for the label pairs and the label/point pairs
+	push = np.zeros_like(centers)
+	hits = np.zeros(len(centers), dtype=np.int64)
+
+	pairs = label_tree.query_pairs(2*half.max(), p=np.inf, output_type='ndarray')
+	if len(pairs):
+		i, j = pairs[:,0], pairs[:,1]
+		over_x, over_y = overlap_sizes(label_boxes[i], label_boxes[j])
+		hit = (over_x > 0) & (over_y > 0)
+		i, j, over_x, over_y = i[hit], j[hit], over_x[hit], over_y[hit]
+		along_x = over_x < over_y
+		sign = np.where(np.where(along_x, centers[i,0] >= centers[j,0], centers[i,1] >= centers[j,1]), 1.0, -1.0)
+		step = np.where(along_x, over_x, over_y)*sign/2
+		axis = np.where(along_x, 0, 1)
+		np.add.at(push, (i, axis), step)
+		np.add.at(push, (j, axis), -step)
+		np.add.at(hits, i, 1)
+		np.add.at(hits, j, 1)
+
+	if point_tree is not None:
+		near = label_tree.sparse_distance_matrix(point_tree, half.max() + radius, p=np.inf, output_type='ndarray')
+		i, j = near['i'].astype(np.int64), near['j'].astype(np.int64)
+		over_x, over_y = overlap_sizes(label_boxes[i], point_boxes[j])
+		hit = (over_x > 0) & (over_y > 0)
+		i, j, over_x, over_y = i[hit], j[hit], over_x[hit], over_y[hit]
+		point_centers = (point_boxes[j,:2] + point_boxes[j,2:])/2
+		along_x = over_x < over_y
+		sign = np.where(np.where(along_x, centers[i,0] >= point_centers[:,0], centers[i,1] >= point_centers[:,1]), 1.0, -1.0)
+		np.add.at(push, (i, np.where(along_x, 0, 1)), np.where(along_x, over_x, over_y)*sign)
+		np.add.at(hits, i, 1)
+	return push, hits
+
+# Place the labels of the points (x, y) on ax, avoiding each other and the points (the labelled points by default, or points=(x, y) of every
+#	point drawn, with markers of point_size, as for plt.scatter s). Returns the text objects; the other kwargs are passed to ax.text.
+def place_labels(ax, x, y, labels, points=None, point_size=18, max_iterations=50, time_budget=None, arrow_color='blue', **text_kwargs):
+	start = time.perf_counter()
+	x = np.asarray(x, dtype=float)
+	y = np.asarray(y, dtype=float)
+	texts = [ax.text(x[k], y[k], labels[k], ha='center', va='center', **text_kwargs) for k in range(len(labels))]
+	if len(texts) == 0:
+		return texts
+
+	# label sizes and point boxes (s is the marker area in points^2) in display pixels
+	figure = ax.figure
+	renderer = figure.canvas.get_renderer()
+	anchors = ax.transData.transform(np.column_stack([x, y]))
+	# the labels are single lines in one font: their widths from the text metrics of the font and their height from the first label as laid out by
+	#	matplotlib (much quicker than laying out every text)
+	font = texts[0].get_fontproperties()
+	line_height = texts[0].get_window_extent(renderer).height
+	half = np.array([(renderer.get_text_width_height_descent(str(label), font, ismath=False)[0]/2, line_height/2) for label in labels])
+	bounds = tuple(ax.get_window_extent(renderer).extents)
+	radius = np.sqrt(point_size)/2*figure.dpi/72
+	point_xy = anchors if points is None else ax.transData.transform(np.column_stack([np.asarray(points[0], dtype=float), np.asarray(points[1], dtype=float)]))
+	point_xy = point_xy[np.isfinite(point_xy).all(axis=1)]
+	point_boxes = boxes(point_xy, radius)
+	point_tree = cKDTree(point_xy) if len(point_xy) else None
+	points_in = point_grid(point_xy, bounds)
+
+	# 1. repulsion between neighbours, each label starting just above its point
+	centers = clamp(anchors + np.column_stack([np.zeros(len(texts)), half[:,1] + radius]), half, bounds)
+	for iteration in range(max_iterations):
+		if time_budget is not None and time.perf_counter() - start > time_budget:
+			break
+		push, hits = pushes(centers, half, point_tree, point_boxes, radius)
+		if not hits.any():
+			break
+		centers = clamp(centers + push, half, bounds)
+
+	# 2. greedy fallback for the labels still overlapping, on rings of candidates around the point (first ring first), checked against the labels and
+	#	point grid
+	push, hits = pushes(centers, half, point_tree, point_boxes, radius)
+	label_boxes = boxes(centers, half)
+	steps = (np.arange(1, rings+1)[:,None,None]*directions[None,:,:]).reshape(-1, 2)
+	for k in np.flatnonzero(hits):
+		candidates = clamp(anchors[k] + steps*(half[k] + radius), half[k], bounds)
+		candidate_boxes = boxes(np.vstack([centers[k:k+1], candidates]), half[k])
+		reach = rings*(half[k].max() + radius) + half[k].max()
+		others = np.flatnonzero((np.abs(centers - anchors[k]) <= reach + half).all(axis=1))
+		others = others[others != k]
+		counts = overlapping(candidate_boxes[:,None,:], label_boxes[None,others,:]).sum(axis=1)
+		counts += grid_counts(points_in, candidate_boxes + np.array([-radius, -radius, radius, radius]), bounds)
+		best = int(np.argmin(counts[1:])) + 1
+		if counts[best] < counts[0]:
+			centers[k] = candidate_boxes[best,:2] + half[k]
+			label_boxes[k] = candidate_boxes[best]
+
+	# move the texts, with an arrow (as drawn by ax.annotate, without its empty text) from the edge of each label box to its point when the label is
+	#	away from the point
+	edges = np.minimum(np.maximum(anchors, label_boxes[:,:2]), label_boxes[:,2:])
+	arrows = np.hypot(*(edges - anchors).T) > 2*radius
+	centers = ax.transData.inverted().transform(centers)
+	edges = ax.transData.inverted().transform(edges)
+	for k, text in enumerate(texts):
+		text.set_position(tuple(centers[k]))
+		if arrows[k]:
+			ax.add_artist(FancyArrowPatch(tuple(edges[k]), (x[k], y[k]), arrowstyle='->', connectionstyle='arc3,rad=0', color=arrow_color, mutation_scale=10))
+	return texts
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+import sys, os, json, time, socket, resource, cProfile, contextlib
+
+# Stage instrumentation shared by the numbered scripts and BarSeq_Pipeline.py. Each stage (and sub-step) run inside a stage() block is recorded as
+#	one JSON line with its wall time, CPU time, the resident set size of the process at its start and end and the change between the two (from
+#	/proc/self/statm, where available), the high-water mark of the resident set size of the process so far (process_max_rss_mb, which a stage after a
+#	larger one still reports as that earlier peak), the rows in and out, and the bytes read and written (from /proc/self/io), so the metrics of a
+#	batch of runs (or of the pipeline worker processes, which append to the same file) can be aggregated line by line. Nested stages are recorded
+#	with their path, e.g. fitness/pseudocounts.
+#
+#	Metrics are written only when the BARSEQ_METRICS environment variable gives a JSON lines file (or after configure(metrics=PATH), which sets it
+#	for the worker processes too); otherwise stage() does nothing. With BARSEQ_PROFILE set to a directory (or configure(profile=PATH)), every
+#	top-level stage is also run under cProfile and its statistics saved as <directory>/<stage>_<pid>_<start time>.prof (see python3 -m pstats).
+#
+# Usage (from another script in this directory):
+#	import BarSeq_Metrics as bm
+#	with bm.stage('merge', rows_in=len(Table), condition='4') as record:
+#		Summary = ...
+#		record['rows_out'] = len(Summary)
+#
+#	BARSEQ_METRICS=run.jsonl BARSEQ_PROFILE=profiles python3 PATH/7_Replicates_Table.py ...
+#	python3 PATH/BarSeq_Metrics.py <PATH/metrics.jsonl files>		sums the wall and CPU times of each stage over the files
+
+_stack = []
+_stack_pid = [os.getpid()]
+
+
+# Enable metrics (a JSON lines file) and/or profiling (a directory) for this process and the processes it starts
+def configure(metrics=None, profile=None):
+	if metrics:
+		os.environ['BARSEQ_METRICS'] = os.path.abspath(metrics)
+	if profile:
+		os.environ['BARSEQ_PROFILE'] = os.path.abspath(profile)
+
+def enabled():
+	return bool(os.environ.get('BARSEQ_METRICS') or os.environ.get('BARSEQ_PROFILE'))
+
+# Identifier of the current run: the start time, host and process id of the first process that records a stage, shared with the processes it starts
+def run_id():
+	if 'BARSEQ_RUN' not in os.environ:
+		os.environ['BARSEQ_RUN'] = time.strftime('%Y%m%dT%H%M%S') + '_' + socket.gethostname() + '_' + str(os.getpid())
+	return os.environ['BARSEQ_RUN']
+
+# Bytes read and written by the process so far (rchar, wchar of /proc/self/io), None where not available
+def io_counters():
+	try:
+		with open('/proc/self/io') as handle:
+			counters = dict(line.split(':') for line in handle.read().splitlines())
+		return int(counters['rchar']), int(counters['wchar'])
+	except (OSError, KeyError, ValueError):
+		return None, None
+
+# Current resident set size of the process in MB (resident pages of /proc/self/statm), None where not available
+def rss_mb():
+	try:
+		with open('/proc/self/statm') as handle:
+			return round(int(handle.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20, 1)
+	except (OSError, ValueError, IndexError):
+		return None
+
+# High-water mark of the resident set size of the process so far, in MB
+def max_rss_mb():
+	max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return round(max_rss/2**20 if sys.platform == 'darwin' else max_rss/2**10, 1)  # bytes on macOS, kilobytes on Linux
+
+def write_record(record):
+	metrics_file = os.environ.get('BARSEQ_METRICS')
+	if metrics_file:
+		with open(metrics_file, 'a') as handle:
+			handle.write(json.dumps(record, default=str) + '\n')
+
+# Record a stage: yields the record (a dict) so that the block can add rows_out or other fields. Does nothing unless metrics or profiling are enabled.
+@contextlib.contextmanager
+def stage(name, rows_in=None, **fields):
+	if not enabled():
+		yield {}
+		return
+
+	# a forked worker process starts with the stages of its parent open, its own stages are recorded from the top
+	if _stack_pid[0] != os.getpid():
+		_stack.clear()
+		_stack_pid[0] = os.getpid()
+	_stack.append(name)
+	path = '/'.join(_stack)
+	record = dict(run=run_id(), script=os.path.basename(sys.argv[0]), pid=os.getpid(), stage=path, rows_in=rows_in, rows_out=None, **fields)
+	profile_dir = os.environ.get('BARSEQ_PROFILE')
+	profiler = cProfile.Profile() if profile_dir and len(_stack) == 1 else None
+	read_start, written_start = io_counters()
+	rss_start = rss_mb()
+	start = time.time()
+	wall = time.perf_counter()
+	cpu = time.process_time()
+	if profiler is not None:
+		try:
+			profiler.enable()
+		except ValueError:  # another profiler is active (e.g. inherited by a forked worker)
+			profiler = None
+	try:
+		yield record
+	finally:
+		if profiler is not None:
+			profiler.disable()
+		record['wall_s'] = round(time.perf_counter() - wall, 6)
+		record['cpu_s'] = round(time.process_time() - cpu, 6)
+		record['start'] = round(start, 3)
+		rss_end = rss_mb()
+		record['rss_start_mb'] = rss_start
+		record['rss_end_mb'] = rss_end
+		record['rss_delta_mb'] = None if rss_start is None else round(rss_end - rss_start, 1)
+		record['process_max_rss_mb'] = max(max_rss_mb(), rss_end or 0)  # the kernel updates the high-water mark lazily
+		read_end, written_end = io_counters()
+		record['bytes_read'] = None if read_start is None else read_end - read_start
+		record['bytes_written'] = None if written_start is None else written_end - written_start
+		_stack.pop()
+		write_record(record)
+		if profiler is not None:
+			os.makedirs(profile_dir, exist_ok=True)
+			profiler.dump_stats(os.path.join(profile_dir, '%s_%d_%s.prof' % (name, os.getpid(), time.strftime('%Y%m%dT%H%M%S', time.localtime(start)))))
+
+# Wall and CPU time totals of each stage over JSON lines files of metrics: {stage: (count, wall_s, cpu_s)}
+def summarize(metricsFiles):
+	totals = {}
+	for metricsFile in metricsFiles:
+		with open(metricsFile) as handle:
+			for line in handle:
+				if line.strip():
+					record = json.loads(line)
+					count, wall, cpu = totals.get(record['stage'], (0, 0, 0))
+					totals[record['stage']] = (count + 1, wall + record['wall_s'], cpu + record['cpu_s'])
+	return totals
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <PATH/metrics.jsonl files>")
+		sys.exit(0)
+
+	print('%-40s %8s %12s %12s' % ('stage', 'count', 'wall (s)', 'CPU (s)'))
+	for name, (count, wall, cpu) in sorted(summarize(sys.argv[1:]).items()):
+		print('%-40s %8d %12.3f %12.3f' % (name, count, wall, cpu))
@@ -0,0 +1,532 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, json, hashlib, shutil, tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import BarSeq_Annotate as ba
+import BarSeq_Baseline as bb
+import BarSeq_Cache as bc
+import BarSeq_Compare as bcmp
+import BarSeq_Fitness as bf
+import BarSeq_Metrics as bm
+import BarSeq_Pool as bp
+import BarSeq_Results as br
+import BarSeq_Stats as bst
+import BarSeq_Strains as bs
+
+# Importable versions of the processing stages, passing pandas tables from one stage to the next instead of writing and re-reading csv files:
+#	load_pool / split_replicates	4_BarSeqProc_loadExps.py	all.poolcount -> in3genes table of each replicate
+#	gene_sums						5_BarSeqProc_analyzeExp.py	gene sums and <30 read baseline filter
+#	fitness							5_BarSeqProc_analyzeExp.py	normGeneFit and tStat_abs of each gene, for each test condition, from a strain store
+#	exclusion_set					6_Combined_30_Count_Replicates_List.py	genes left out of the replicate merge
+#	merge_replicates				7_Replicates_Table.py		replicate fitness table with mean, one sample t-test and q-values
+#	compare_conditions				8_Fitness_Compare.py		two sample t-test between two conditions
+#	load_features / annotate		9_Summary_annotate.py		gene names and descriptions from the feature table
+# Each stage writes the files of the corresponding script only when write=True, so these are an opt-in debugging aid.
+#
+#	run_pipeline runs every stage for one or more baselines. all.poolcount is read once, its count columns are mapped to sets and replicates from
+#	the SetName field of the experiment metadata file (e.g. 1A, 1B, 1C are replicates A, B and C of set 1, see BarSeq_Pool.py), so any number of
+#	replicates can be used, and each baseline/replicate pair is analyzed in its own worker process. The in-gene strains are kept in a gene-grouped
+#	strain store (BarSeq_Strains.py) that the workers memory-map, and each worker applies the >= 3 baseline reads filter to its replicate before the
+#	stage 5 analysis. The stage 5 result of each baseline/condition/replicate cell is saved with a content hash of its counts and analysis parameters,
+#	so a rerun (e.g. after a test condition is added to all.poolcount) only computes the cells whose inputs changed.
+#	The replicate tables and comparisons of each baseline are written in a BL_<baseline condition> directory, along with the 4_ to 8_ intermediate
+#	files if write_intermediate=True.
+#
+# Usage:
+#	python3 PATH/BarSeq_Pipeline.py <PATH/all.poolcount_file> <baseline condition(s)> <Test Conditions> <kwargs>
+#
+# Inputs:
+#	all.poolcount file is file generated by BarSeqR.pl function
+#	baseline condition(s) chosen as a reference (1, 2, 3, etc.), several baselines can be separated with commas e.g. '1,2'
+#	Test Conditions Chosen '4,5,6,etc.'   NOTE. This is the set number as it appears in the .poolcount file, as for 4_BarSeqProc_loadExps.py
+#
+#	Optional kwargs (given as name=value):
+#		exps=PATH/BarSeq.tsv	experiment metadata file, whose SetName field gives the set and replicate of each count column
+#								(default: the SetName part of the all.poolcount column names)
+#		compare=4:5,4:6			pairs of test conditions to compare (8_Fitness_Compare.py), the first of each pair being Condition_1, or compare=all
+#								to compare every pair of test conditions
+#		reference=4				compare every other test condition to this one (as Condition_2)
+#		format=pairs			pairs: one comparison file per pair, long: one All_Comparisons.csv table of every pair (see BarSeq_Compare.py)
+#		features=PATH/feature_table.txt	feature table used to annotate the comparisons (9_Summary_annotate.py)
+#		workers=N				number of worker processes (default: one per CPU)
+#		window=251				normalization window, as for 5_BarSeqProc_analyzeExp.py
+#		per_scaffold=False		normalize each scaffold separately, as for 5_BarSeqProc_analyzeExp.py
+#		write_intermediate=False	also write the 4_, 5_, 7_ and 8_ intermediate files
+#		cache=True				load all.poolcount from its binary cache, built on first use (see BarSeq_Cache.py)
+#		incremental=True		reuse the saved analysis of each baseline/condition/replicate cell whose counts and parameters are unchanged
+#		metrics=PATH.jsonl		append the wall time, CPU time, memory and rows of each stage to a JSON lines file (see BarSeq_Metrics.py)
+#		profile=PATH			save the cProfile statistics of each top-level stage in this directory
+#
+# Output files (in BL_<baseline condition>):
+#	<condition>_Fitness_Summary.csv, <condition>_Statistics.csv and <condition>_Statistics_sorted.csv, as for 7_Replicates_Table.py
+#	results, the results store of every condition and replicate (see BarSeq_Results.py)
+#	cells, the saved analysis of each condition and replicate (incremental=True)
+#	<Condition_1>_v_<Condition_2>_Annotated_Summary.csv, as for 9_Summary_annotate.py (<Condition_1>_v_<Condition_2>_Summary.csv if no feature table is given)
+#	All_Comparisons.csv instead, with format=long (annotated with the feature table columns, if given)
+
+CELL_VERSION = 1
+cell_columns = ['normGeneFit', 'tStat_abs', 'BL_Sums', 'strain_Sums', 'nStrains']
+
+
+#####################################################################################
+##### Stage 4: load all.poolcount and split it into replicates                  #####
+#####################################################################################
+
+# all.poolcount as a table, from its binary cache (BarSeq_Cache.py) unless cache=False
+def load_pool(poolFile, cache=True):
+	with bm.stage('load', cache=cache) as record:
+		Counts_Table = bc.read_pool(poolFile) if cache else pd.read_csv(poolFile, sep="\t")
+		record['rows_out'] = len(Counts_Table)
+	return Counts_Table
+
+# Split all.poolcount into the in3genes table of each replicate of the baseline: {'A': in3genes_A, 'B': ...}. Each table holds the leading all.poolcount
+#	columns, the baseline column and the test condition columns (those that have the replicate), trimmed to rows where the insertion is within a
+#	gene and has >= 3 reads in the baseline. sets is the set/replicate column mapping of BarSeq_Pool.replicate_columns.
+def split_replicates(Counts_Table, baseline, Test_Conditions, sets=None, write=False, out_dir='.'):
+	if sets is None:
+		sets = bp.replicate_columns(list(Counts_Table.columns))
+	tables = {}
+	for replicate, BL_column in sets[baseline].items():
+		with bm.stage('split', rows_in=len(Counts_Table), baseline=baseline, replicate=replicate) as record:
+			columns = [BL_column] + [sets[t][replicate] for t in Test_Conditions if replicate in sets[t]]
+			ingenes = Counts_Table[[column for column in bp.pool_columns if column in Counts_Table.columns] + columns].dropna(subset=['locusId'])
+			in3genes = ingenes[ingenes[BL_column] >= bf.minStrainReads]
+			record['rows_out'] = len(in3genes)
+		if write:
+			with bm.stage('write', rows_in=len(ingenes) + len(in3genes), baseline=baseline, replicate=replicate):
+				ingenes.to_csv(os.path.join(out_dir, 'BL_'+baseline+replicate+'_counts-in-genes.csv'), index=False, header=True)
+				in3genes.to_csv(os.path.join(out_dir, 'BL_'+baseline+replicate+'_in3genes.csv'), index=False, header=True)
+		tables[replicate] = in3genes
+	return tables
+
+
+#####################################################################################
+##### Stage 5: gene sums, <30 read baseline filter and fitness calculations     #####
+#####################################################################################
+
+# Sum the counts of each gene for every count column of a strain store (BarSeq_Strains.py, the baseline column first) and split off the genes with
+#	< 30 baseline reads (given by the baseline artifact of the store, if any, see BarSeq_Baseline.py). Returns the gene sums table of the genes used
+#	for analysis and that of the <30 genes, both in the order the genes first appear in the counts table.
+def gene_sums(store, write=False, out_dir='.', Baseline=None):
+	BL_column_name = store['columns'][0]
+	with bm.stage('gene_sums', rows_in=len(store['f']), baseline=BL_column_name) as record:
+		# the strains of each gene are contiguous in the store, so all the gene sums are one reduction over the gene offsets
+		Gene_Sums = np.add.reduceat(store['counts'], store['gene_offsets'][:-1], axis=0, dtype=np.int64)
+		less_30 = Gene_Sums[:,0] < bf.minGeneReads if Baseline is None else ~np.asarray(Baseline['used'])
+
+		# ID genes that have <30 reads per gene in Time0 (<30_Unused_BL_genes.csv), and keep the others (GenesUsedforAnalysis.csv)
+		genes = pd.Index(store['genes'], name='locusId')
+		genes_less_30 = pd.DataFrame(Gene_Sums[less_30], index=genes[less_30], columns=store['columns'])
+		NoLess30_Gene_Sums_Table = pd.DataFrame(Gene_Sums[~less_30], index=genes[~less_30], columns=store['columns'])
+		record['rows_out'] = len(NoLess30_Gene_Sums_Table)
+
+	if write:
+		with bm.stage('write', rows_in=len(Gene_Sums), baseline=BL_column_name):
+			genes_less_30.to_csv(os.path.join(out_dir, BL_column_name+'_<30_Unused_BL_genes.csv'), index=True, header=True)
+			NoLess30_Gene_Sums_Table.to_csv(os.path.join(out_dir, BL_column_name+'_GenesUsedforAnalysis.csv'), index=True, header=True)
+	return NoLess30_Gene_Sums_Table, genes_less_30
+
+# Gene fitness of each test condition against the baseline, for the genes of the gene sums table (first column the baseline), from the gene-grouped
+#	strain store of the replicate (BarSeq_Strains.py). Returns {condition column: table of normGeneFit and tStat_abs indexed by geneName, with the
+#	baseline and condition reads (BL_Sums, strain_Sums) and number of strains (nStrains) of each gene} and {condition column: genes removed for zero reads}.
+#	If a cell directory is given, the result of each condition is saved there (see load_cell) and only the conditions whose inputs or analysis
+#	parameters changed since are computed again. With the baseline artifact of the store, its used genes and Vn baseline term are reused.
+def fitness(store, NoLess30_Gene_Sums_Table, window=251, per_scaffold=False, write=False, out_dir='.', cell_dir=None, Baseline=None):
+	# Abstract out the strain counts (prior to being grouped) for all genes with >= 30 baseline reads once, as a baseline column and a strains x conditions
+	# count matrix. The strains of each gene are contiguous in the store and the genes follow the order of the gene sums table, so the gene of each strain
+	# follows from the gene offsets (see BarSeq_Fitness.py)
+	All_Loci_Labels = NoLess30_Gene_Sums_Table.index
+	used = pd.Index(store['genes']).isin(All_Loci_Labels) if Baseline is None else np.asarray(Baseline['used'])
+	Used = bs.select_genes(store, used, list(NoLess30_Gene_Sums_Table.columns))
+	conditions = list(NoLess30_Gene_Sums_Table.columns[1:])
+
+	# conditions with a saved result of the same inputs are not computed again
+	Fitness = {}
+	Unused_0ct = {}
+	if cell_dir is not None:
+		hashes = cell_hashes(Used, cell_params(window, per_scaffold))
+		for condition in conditions:
+			cell = load_cell(cell_path(cell_dir, condition), hashes[condition])
+			if cell is not None:
+				Fitness[condition], Unused_0ct[condition] = cell
+				print('\nReusing the analysis of', condition, '(unchanged inputs)')
+	computed = [i for i in range(1,len(conditions)+1) if conditions[i-1] not in Fitness]
+
+	if computed:
+		gene_index = bs.strain_genes(Used)
+		Used_Strain_Counts_BL = Used['counts'][:,0]
+		Used_Strain_Counts_Enrichment = Used['counts'][:,1:] if len(computed) == len(conditions) else Used['counts'][:,computed]
+		Gene_Positions = Used['f']
+		All_BL_Sums = NoLess30_Gene_Sums_Table.iloc[:,0].values
+		All_strain_Sums = NoLess30_Gene_Sums_Table.iloc[:,computed].values
+		All_nStrains = np.diff(Used['gene_offsets'])
+		All_BL_Vn = 1/(1+All_BL_Sums) if Baseline is None else Baseline['BL_Vn'][used]
+
+		# perform preliminary strain fitness (psf) and preliminary gene fitness (pgf) calculations and use median pgf for each gene to determine their corresponding pseudocount values,
+		# then determine actual strain fitness and use to calculate weighted variance and unnormalized gene fitness (uGeneFitness).
+		# sumSq, the weighted sum of squared differences of strain fitness for the gene, and uGF1/uGF2, the unnormalized gene fitness values for each gene half
+		# (if the T=0 reads count >= 15 in both halves), are calculated over the same strains.
+		# Note, unlike the Wetmore et al., 2015 manuscript, strain counts from transposon insertions in the first or last 10% of the gene are still included
+		# 		from a genetic point of view, if a transposon is inserted in the first 10% of gene there are only rare instances where that is not polar for
+		# 		disruption of gene (both by way of amino acid changes and by way of native promoter to CDS uncoupling)
+		# This is done for every enrichment condition at once; genes with zero reads in a condition are masked out of that condition's values
+		with bm.stage('fitness', rows_in=len(gene_index), baseline=Used['columns'][0], conditions=len(computed)):
+			All_Fitness = bf.gene_fitness_matrix(Used_Strain_Counts_BL, Used_Strain_Counts_Enrichment, gene_index, Gene_Positions, All_BL_Sums, All_strain_Sums)
+
+	# Iterate through each condition to baseline pair to normalize gene fitness and calculate t-like statistics
+	for k, i in enumerate(computed):
+		print('\nStarting Analysis of Set', i)
+		condition = conditions[i-1]
+		analyzed = All_Fitness['analyzed'][:,k]  # eliminate genes if strainSums = 0
+		BL_Sums = All_BL_Sums[analyzed]
+		strain_Sums = All_strain_Sums[analyzed,k]
+		Loci_Labels = All_Loci_Labels[analyzed]
+		Genes_Removed = np.array(All_Loci_Labels[~analyzed])
+		if len(Genes_Removed) > 0:
+			print('\n',len(Genes_Removed),' additional genes contain zero reads in the '+condition+' pool and will be removed.')
+			print("\n Deleted genes include: ",Genes_Removed,'\n')
+
+		fit = bf.condition_fitness(All_Fitness, k)
+		uGeneFitness = fit['uGeneFitness']
+
+		# normalize gene fitness using median of 251-gene window (125 genes on either side of GOI), wrapping around the ends of the chromosome (or of each scaffold)
+		with bm.stage('normalization', rows_in=len(uGeneFitness), condition=condition):
+			if per_scaffold:
+				normGeneFitness = bf.normalize_gene_fitness(uGeneFitness, window, Used['scaffolds'][analyzed])
+			else:
+				normGeneFitness = bf.normalize_gene_fitness(uGeneFitness, window)
+
+		# Vn, the naive gene variance, Vt, the variance in typical gene from the median absolute difference between the two halves (uGF1, uGF2),
+		# Vg = Vt * [Vn/median(Vn)]^2 where median(Vn) is for just the genes used to estimate Vt, and Ve = (sumSq + Vg) / n, where n is the number of different strains.
+		# From Wetmore et al., t = normGeneFitness/sqrt(sigma^2 + max(Ve,Vn)), sigma is a small constant to represent uncertainty in normalization for small fitness values. Set to 0.1
+		with bm.stage('t_stat', rows_in=len(normGeneFitness), condition=condition):
+			tStat_abs = bf.gene_tStat(normGeneFitness, fit, BL_Sums, strain_Sums, All_BL_Vn[analyzed])
+
+		Fitness[condition] = pd.DataFrame({'normGeneFit': normGeneFitness, 'tStat_abs': tStat_abs, 'BL_Sums': BL_Sums, 'strain_Sums': strain_Sums,
+			'nStrains': All_nStrains[analyzed]}, index=pd.Index(Loci_Labels, name='geneName'))
+		Unused_0ct[condition] = Genes_Removed
+		if cell_dir is not None:
+			save_cell(cell_path(cell_dir, condition), hashes[condition], Fitness[condition], Genes_Removed)
+
+	# list of ALL analyzed genes with tStat_abs and normGeneFit value, and of the genes removed for zero reads
+	if write:
+		for condition in conditions:
+			with bm.stage('write', rows_in=len(Fitness[condition]), condition=condition):
+				Loci_Labels = Fitness[condition].index
+				if len(Unused_0ct[condition]) > 0:
+					np.savetxt(os.path.join(out_dir, condition+'_Unused_0ct_Exp_genes.csv'), Unused_0ct[condition], delimiter=',', fmt='%s')
+				np.savetxt(os.path.join(out_dir, condition+'_GenesUsedforAnalysis_noZeroSums.csv'), Loci_Labels, delimiter=',', fmt='%s')
+				structuredArr = np.transpose(np.array([(Loci_Labels), (Fitness[condition]['normGeneFit'].values), (Fitness[condition]['tStat_abs'].values)]))
+				np.savetxt(os.path.join(out_dir, condition+'_allAnalyzedGenes.csv'), structuredArr, delimiter=',', fmt='%s', header='geneName,normGeneFit,tStat_abs', comments='')
+	return {condition: Fitness[condition] for condition in conditions}, {condition: Unused_0ct[condition] for condition in conditions}
+
+# Analysis parameters that a fitness cell depends on, besides its counts
+def cell_params(window, per_scaffold):
+	return {'version': CELL_VERSION, 'minStrainReads': bf.minStrainReads, 'minGeneReads': bf.minGeneReads, 'window': window, 'per_scaffold': per_scaffold,
+		'sigma': bf.sigma}
+
+# Content hash of the fitness cell of each condition of a replicate (a strain store trimmed to the analyzed genes, the baseline count column
+#	first): the sha256 of the analysis parameters, the strains of the analyzed genes (locusId, scaffold, gene offsets, pos and f), the baseline
+#	counts and the counts of the condition
+def cell_hashes(Used, params):
+	sha = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+	for name in ['genes', 'scaffolds']:
+		sha.update('\t'.join(str(value) for value in Used[name]).encode())
+	for name in ['gene_offsets', 'pos', 'f']:
+		sha.update(np.ascontiguousarray(Used[name]).tobytes())
+	sha.update(np.ascontiguousarray(Used['counts'][:,0]).tobytes())
+	hashes = {}
+	for k, column in enumerate(Used['columns'][1:], 1):
+		cell = sha.copy()
+		cell.update(np.ascontiguousarray(Used['counts'][:,k]).tobytes())
+		hashes[column] = cell.hexdigest()
+	return hashes
+
+# A fitness cell is the fitness table and zero read genes of one condition column, saved as <cell_dir>/<condition column>.npz with the hash of its
+#	inputs. load_cell returns them if the saved hash matches, None otherwise; a cell that cannot be saved is simply computed again next time.
+def cell_path(cell_dir, condition):
+	return os.path.join(cell_dir, condition+'.npz')
+
+def load_cell(cell_file, cell_hash):
+	if not os.path.isfile(cell_file):
+		return None
+	with np.load(cell_file) as saved:
+		if str(saved['hash']) != cell_hash:
+			return None
+		Table = pd.DataFrame({name: saved[name] for name in cell_columns}, index=pd.Index(saved['geneName'].astype(object), name='geneName'))
+		return Table, saved['Genes_Removed'].astype(object)
+
+def save_cell(cell_file, cell_hash, Table, Genes_Removed):
+	try:
+		os.makedirs(os.path.dirname(cell_file), exist_ok=True)
+		with open(cell_file + '.tmp', 'wb') as handle:
+			np.savez(handle, hash=np.array(cell_hash), geneName=np.array(list(Table.index), dtype=str), Genes_Removed=np.array(list(Genes_Removed), dtype=str),
+				**{name: Table[name].values for name in cell_columns})
+		os.replace(cell_file + '.tmp', cell_file)
+	except OSError as error:
+		print('Could not save the analysis of', os.path.basename(cell_file), '('+str(error)+')')
+
+# Analyze one in3genes table (a replicate, as written by 4_BarSeqProc_loadExps.py), writing the 5_BarSeqProc_analyzeExp.py output files in out_dir.
+#	count_columns are the baseline column followed by the test condition columns (default: every count column, the first being the baseline).
+#	Returns the fitness tables, the <30 baseline read genes and the zero read genes of each condition.
+def analyze_exp(Counts_Table, count_columns=None, window=251, per_scaffold=False, write=True, out_dir='.', cell_dir=None):
+	return analyze_store(bs.build_store(Counts_Table, count_columns), window, per_scaffold, write, out_dir, cell_dir)
+
+# As analyze_exp, for the strain store of a replicate (the baseline count column first), with the baseline artifact it was trimmed with, if any
+def analyze_store(store, window=251, per_scaffold=False, write=True, out_dir='.', cell_dir=None, Baseline=None):
+	NoLess30_Gene_Sums_Table, genes_less_30 = gene_sums(store, write, out_dir, Baseline)
+	Fitness, Unused_0ct = fitness(store, NoLess30_Gene_Sums_Table, window, per_scaffold, write, out_dir, cell_dir, Baseline)
+	return Fitness, genes_less_30.index, Unused_0ct
+
+
+#####################################################################################
+##### Stages 6 and 7: merge the replicates of a condition                       #####
+#####################################################################################
+
+# Exclusion set of the replicate merge: the union of the locusId column of the <30_Unused_BL_genes.csv files of the baseline replicates and, if given,
+#	of the genes listed in _Unused_0ct_Exp_genes.csv files. The files are read chunk by chunk, keeping only the gene names.
+def exclusion_set(less_30_files, zero_count_files=(), chunksize=100000):
+	genes = set()
+	for less_30_file in less_30_files:
+		for chunk in pd.read_csv(less_30_file, usecols=['locusId'], dtype=str, chunksize=chunksize):
+			genes.update(chunk['locusId'])
+	for zero_count_file in zero_count_files:
+		for chunk in pd.read_csv(zero_count_file, header=None, usecols=[0], dtype=str, chunksize=chunksize):
+			genes.update(chunk[0])
+	return genes
+
+# Write an exclusion set as the sorted gene list of 6_Combined_30_Count_Replicates_List.py, and load such a list back as a set
+def write_exclusion(genes, out_file):
+	np.savetxt(out_file, sorted(genes), delimiter=',', fmt='%s')
+
+def load_exclusion(exclusion_file):
+	if os.path.getsize(exclusion_file) == 0:
+		return set()
+	return set(pd.read_csv(exclusion_file, header=None, dtype=str)[0])
+
+# Merge the fitness tables of the replicates of one condition ({'A': Fitness_A, 'B': ...} as returned by fitness) into one table indexed by
+#	geneName, with the normalized fitness of each replicate (NormGeneFit_A, etc.), their mean, a two-tailed one sample t-test against a fitness
+#	of 0 and the q-values. Genes in Unused_Genes (<30 baseline read genes of any replicate and zero read genes of the condition), or missing
+#	from any replicate, are trimmed. The replicates are joined on their gene index (a hash lookup), so their rows can be in any order; the merged
+#	table follows the gene order of the first replicate. Without any replicate table, the merged table is empty.
+def merge_replicates(Fitness_Tables, Unused_Genes=()):
+	replicates = list(Fitness_Tables)
+	if len(replicates) == 0:
+		return pd.DataFrame(columns=['mean', 't_stat', 'p_value', 'q-value_BH_method', 'adjusted_q-value'], index=pd.Index([], name='geneName'), dtype=float)
+	with bm.stage('merge', rows_in=sum(len(Table) for Table in Fitness_Tables.values()), replicates=len(replicates)) as record:
+		genes = Fitness_Tables[replicates[0]].index
+		genes = pd.Index(genes[~genes.isin(pd.Index(list(Unused_Genes)))], name='geneName')
+		FitVals = np.column_stack([Fitness_Tables[replicate]['normGeneFit'].reindex(genes).to_numpy(dtype=float) for replicate in replicates])
+		Summary = pd.DataFrame(FitVals, index=genes, columns=['NormGeneFit_'+replicate for replicate in replicates]).dropna()
+		FitVals = Summary.values
+		Summary['mean'] = FitVals.mean(axis=1)
+		Summary['t_stat'], Summary['p_value'] = bst.ttest_1samp(FitVals, popmean=0)
+		Summary['q-value_BH_method'], Summary['adjusted_q-value'] = bst.qvalues(Summary['p_value'].values)
+		record['rows_out'] = len(Summary)
+	return Summary
+
+# Write a merged replicate table as the _Fitness_Summary.csv, _Statistics.csv and _Statistics_sorted.csv files of 7_Replicates_Table.py
+def write_replicates_table(Summary, uniqID, out_dir='.'):
+	with bm.stage('write', rows_in=len(Summary), condition=uniqID):
+		replicates = [column.split('_')[1] for column in Summary.columns if column.startswith('NormGeneFit_')]
+		Fit_w_mean = Summary[['NormGeneFit_'+replicate for replicate in replicates] + ['mean']]
+		Fit_w_mean.to_csv(os.path.join(out_dir, uniqID+'_Fitness_Summary.csv'), index_label='# geneName')
+		Stats = Summary.drop(columns=['q-value_BH_method', 'adjusted_q-value'])
+		Stats.columns = ['NormFit_'+replicate for replicate in replicates] + ['mean', 't_stat', 'p_value']
+		Stats.to_csv(os.path.join(out_dir, uniqID+'_Statistics.csv'), index_label='# geneName')
+		Sorted = Summary.sort_values('p_value', kind='stable')
+		Sorted.columns = list(Stats.columns) + ['q-value_BH_method', 'adjusted_q-value']
+		Sorted.to_csv(os.path.join(out_dir, uniqID+'_Statistics_sorted.csv'), index_label='# geneName')
+
+
+#####################################################################################
+##### Stage 8: compare two conditions                                           #####
+#####################################################################################
+
+# Compare the replicate fitness of two conditions (merged tables from merge_replicates) with a two-tailed two sample t-test, for the genes found
+#	in both. Returns a table indexed by Locus_Tag with the replicate and mean fitness of each condition, the t-statistic, p-value and q-values
+#	(capped at 1), sorted by p-value as in the _Summary.csv file of 8_Fitness_Compare.py. Many pairs are compared at once with BarSeq_Compare.py.
+def compare_conditions(Summary_1, Summary_2, Cond1Label, Cond2Label, write=False, out_dir='.'):
+	with bm.stage('compare', rows_in=len(Summary_1) + len(Summary_2), condition_1=Cond1Label, condition_2=Cond2Label) as record:
+		Pair = bcmp.compare_pairs(bcmp.fitness_tensor({0: Summary_1, 1: Summary_2}), [(0, 1)])
+		Comparison = bcmp.pair_table(Summary_1, Summary_2, Cond1Label, Cond2Label, Pair)
+		record['rows_out'] = len(Comparison)
+	if write:
+		write_comparison(Comparison, Summary_1, Summary_2, Cond1Label, Cond2Label, out_dir)
+	return Comparison
+
+# Write a comparison as the _trimmed_genes.csv (genes not found in both conditions) and _Summary.csv files of 8_Fitness_Compare.py
+def write_comparison(Comparison, Summary_1, Summary_2, Cond1Label, Cond2Label, out_dir='.'):
+	with bm.stage('write', rows_in=len(Comparison), condition_1=Cond1Label, condition_2=Cond2Label):
+		GenesRemoved = list(Summary_1.index.difference(Comparison.index)) + list(Summary_2.index.difference(Comparison.index))
+		np.savetxt(os.path.join(out_dir, Cond1Label+'_v_'+Cond2Label+'_trimmed_genes.csv'), np.array(GenesRemoved, dtype=str), delimiter=',', fmt='%s')
+		Comparison.to_csv(os.path.join(out_dir, Cond1Label+'_v_'+Cond2Label+'_Summary.csv'), index_label='# Locus_Tag')
+
+
+#####################################################################################
+##### Stage 9: annotate with the feature table                                  #####
+#####################################################################################
+
+# Annotation index of the feature table (e.g. GCF_000007565.2_ASM756v2_feature_table): the new locus tag, gene name and description of each old and
+#	new locus tag, built once and saved next to the feature table (see BarSeq_Annotate.py)
+def load_features(genesTable):
+	with bm.stage('features'):
+		return ba.load_index(genesTable)
+
+# Add the new locus tag, gene name and description of each gene of a comparison table (or any table indexed by locus tag), left blank if
+#	the gene is not in the feature table
+def annotate(Summary, Features):
+	with bm.stage('annotate', rows_in=len(Summary)):
+		return ba.annotate(Summary, Features)
+
+
+#####################################################################################
+##### Driver: every baseline/replicate pair in its own worker process           #####
+#####################################################################################
+
+# Worker for one baseline/replicate pair. The gene-grouped strain store of all.poolcount is memory-mapped from store_dir (see BarSeq_Strains.py),
+#	its strains are trimmed to those with >= 3 reads in the baseline (the in3genes table of 4_BarSeqProc_loadExps.py) with the saved artifact of the
+#	baseline column (BarSeq_Baseline.py, built on first use) and analyzed with analyze_store.
+def analyze_store_replicate(store_dir, columns, window, per_scaffold, write, out_dir, cell_dir=None):
+	with bm.stage('baseline', baseline=columns[0]) as record:
+		store = bs.load_store(store_dir)
+		Baseline = bb.open_baseline(store_dir, columns[0], store)
+		replicate = bb.baseline_store(store, Baseline, columns)
+		record['rows_in'] = len(store['f'])
+		record['rows_out'] = len(replicate['f'])
+		del store
+
+	if write:
+		os.makedirs(out_dir, exist_ok=True)
+	return analyze_store(replicate, window, per_scaffold, write, out_dir, cell_dir, Baseline)
+
+# Run the analysis of every replicate of each baseline against the test conditions, one worker process per baseline/replicate pair.
+#	Replicates are those of the baseline set; a test condition without that replicate is left out of the pair. The workers share the strain
+#	store of all.poolcount, memory-mapped from the binary cache (or, with cache=False, from a temporary copy of the used columns).
+#	With incremental=True, the fitness cells of each baseline are saved in BL_<baseline>/cells and reused while their inputs are unchanged (see fitness).
+#	Returns {baseline: {replicate: (Fitness, genes_less_30, Unused_0ct)}}, where Fitness and Unused_0ct are keyed by test condition set number.
+def run_replicates(poolFile, baselines, Test_Conditions, expsFile=None, workers=None, window=251, per_scaffold=False, write=True, out_dir='.', cache=True,
+		incremental=True):
+	SetNames = bp.read_setnames(expsFile) if expsFile else None
+	sets = bp.replicate_columns(bp.read_header(poolFile), SetNames)
+
+	pairs = []
+	for baseline in baselines:
+		for replicate, BL_column in sets[baseline].items():
+			columns = [BL_column] + [sets[t][replicate] for t in Test_Conditions if replicate in sets[t]]
+			pairs.append((baseline, replicate, columns))
+	set_of_column = {column: t for t in Test_Conditions for column in sets[t].values()}
+
+	tmp_dir = None
+	with bm.stage('strain_store', cache=cache):
+		if cache:
+			store_dir = bs.open_store(poolFile)
+		else:
+			# only the in-gene rows of the used count columns are loaded
+			used_columns = list(dict.fromkeys(column for baseline, replicate, columns in pairs for column in columns))
+			tmp_dir = tempfile.mkdtemp()
+			store_dir = os.path.join(tmp_dir, 'strains')
+			bs.save_store(bs.build_store(bp.read_counts(poolFile, used_columns, cache=False), used_columns), store_dir)
+
+	results = {baseline: {} for baseline in baselines}
+	try:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			futures = {}
+			for baseline, replicate, columns in pairs:
+				BL_dir = os.path.join(out_dir, 'BL_'+baseline)
+				future = pool.submit(analyze_store_replicate, store_dir, columns, window, per_scaffold, write, BL_dir, os.path.join(BL_dir, 'cells') if incremental else None)
+				futures[future] = (baseline, replicate)
+			for future in as_completed(futures):
+				baseline, replicate = futures[future]
+				Fitness, genes_less_30, Unused_0ct = future.result()
+				results[baseline][replicate] = ({set_of_column[column]: table for column, table in Fitness.items()}, genes_less_30,
+					{set_of_column[column]: genes for column, genes in Unused_0ct.items()})
+				print('Finished baseline', baseline, 'replicate', replicate)
+	finally:
+		if tmp_dir is not None:
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+	return results
+
+# Run stages 4 to 9 for each baseline: the replicate analyses (run_replicates), the merged replicate table of each test condition, and the
+#	comparisons of the test condition pairs in compare ('all' for every pair, or every condition against reference), annotated if a feature table
+#	is given. Only the merged replicate tables and the comparisons are written, unless write_intermediate is True. Returns {baseline: (merged tables
+#	by condition, comparisons by pair)}, or the long-format table of every pair (BarSeq_Compare.py) instead of the comparisons if long_format=True.
+def run_pipeline(poolFile, baselines, Test_Conditions, expsFile=None, compare=(), featureTable=None, workers=None, window=251, per_scaffold=False,
+		write_intermediate=False, out_dir='.', cache=True, reference=None, long_format=False, incremental=True):
+	results = run_replicates(poolFile, baselines, Test_Conditions, expsFile, workers, window, per_scaffold, write_intermediate, out_dir, cache, incremental)
+	Features = load_features(featureTable) if featureTable else None
+
+	pipeline = {}
+	for baseline in baselines:
+		BL_dir = os.path.join(out_dir, 'BL_'+baseline)
+		os.makedirs(BL_dir, exist_ok=True)
+		replicates = results[baseline]
+		Unused_BL = set().union(*[genes_less_30 for Fitness, genes_less_30, Unused_0ct in replicates.values()])
+
+		Summaries = {}
+		for t in Test_Conditions:
+			Fitness_Tables = {replicate: Fitness[t] for replicate, (Fitness, genes_less_30, Unused_0ct) in sorted(replicates.items()) if t in Fitness}
+			if len(Fitness_Tables) == 0:
+				print('\nNo replicate of baseline', baseline, 'has a fitness table for condition', t, '- it is not merged or compared')
+				continue
+			Unused_Genes = Unused_BL.union(*[Unused_0ct[t] for Fitness, genes_less_30, Unused_0ct in replicates.values() if t in Unused_0ct])
+			Summaries[t] = merge_replicates(Fitness_Tables, Unused_Genes)
+			write_replicates_table(Summaries[t], t, BL_dir)
+
+		if len(Summaries) == 0:
+			pipeline[baseline] = (Summaries, {})
+			continue
+
+		# the replicate and merged values of every condition are also kept in one results store (BarSeq_Results.py)
+		with bm.stage('results', baseline=baseline) as record:
+			Results = br.build_results(replicates, Summaries)
+			br.save_results(Results, os.path.join(BL_dir, 'results'), baseline=baseline, window=window, per_scaffold=per_scaffold)
+			record['rows_out'] = len(Results['genes'])
+
+		# every pair is compared at once (BarSeq_Compare.py), then written as one long-format table or one file per pair
+		pairs = bcmp.condition_pairs(list(Summaries), None if compare == 'all' or reference is not None else compare, reference)
+		pairs = [pair for pair in pairs if pair[0] in Summaries and pair[1] in Summaries]
+		if len(pairs) == 0:
+			pipeline[baseline] = (Summaries, {})
+			continue
+		with bm.stage('compare', baseline=baseline, pairs=len(pairs)) as record:
+			All_Comparisons = bcmp.compare_pairs(br.fitness_tensor(Results, list(dict.fromkeys(condition for pair in pairs for condition in pair))), pairs)
+			record['rows_out'] = len(All_Comparisons)
+		if long_format:
+			Table = All_Comparisons
+			if Features is not None:
+				Table = annotate(All_Comparisons.set_index('Locus_Tag'), Features).reset_index()
+			Table.to_csv(os.path.join(BL_dir, 'All_Comparisons.csv'), index=False)
+			pipeline[baseline] = (Summaries, All_Comparisons)
+			continue
+
+		Comparisons = {}
+		for (Cond1, Cond2), Pair in All_Comparisons.groupby(['Condition_1', 'Condition_2'], sort=False):
+			Comparison = bcmp.pair_table(Summaries[Cond1], Summaries[Cond2], Cond1, Cond2, Pair)
+			if write_intermediate:
+				write_comparison(Comparison, Summaries[Cond1], Summaries[Cond2], Cond1, Cond2, BL_dir)
+			if Features is not None:
+				Comparison = annotate(Comparison, Features)
+				Comparison.to_csv(os.path.join(BL_dir, Cond1+'_v_'+Cond2+'_Annotated_Summary.csv'))
+			elif not write_intermediate:
+				Comparison.to_csv(os.path.join(BL_dir, Cond1+'_v_'+Cond2+'_Summary.csv'), index_label='# Locus_Tag')
+			Comparisons[(Cond1, Cond2)] = Comparison
+		pipeline[baseline] = (Summaries, Comparisons)
+	return pipeline
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 4:
+		print("Run this in the directory where you want your output files.")
+		print("Usage: " + sys.argv[0] + " <path to all.poolcount> <baseline condition(s)> <Test Conditions> <kwargs>")
+		sys.exit(0)
+
+	kwargs = dict(arg.split('=') for arg in sys.argv[4:])
+	bm.configure(kwargs.get('metrics'), kwargs.get('profile'))
+	run_pipeline(sys.argv[1], sys.argv[2].split(','), sys.argv[3].split(','), expsFile=kwargs.get('exps'),
+		compare='all' if kwargs.get('compare') == 'all' else [tuple(pair.split(':')) for pair in kwargs['compare'].split(',')] if 'compare' in kwargs else (),
+		featureTable=kwargs.get('features'), workers=int(kwargs['workers']) if 'workers' in kwargs else None,
+		window=int(kwargs.get('window', 251)), per_scaffold=kwargs.get('per_scaffold', 'False') in ('True', 'true', '1'),
+		write_intermediate=kwargs.get('write_intermediate', 'False') in ('True', 'true', '1'), cache=kwargs.get('cache', 'True') in ('True', 'true', '1'),
+		reference=kwargs.get('reference'), long_format=kwargs.get('format', 'pairs') == 'long', incremental=kwargs.get('incremental', 'True') in ('True', 'true', '1'))
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import BarSeq_Cache as bc
+
+# Helpers for reading the all.poolcount file generated by 3_BarSeqR.pl and the experiment metadata file (BarSeq.tsv).
+#
+#	all.poolcount has the columns barcode, rcbarcode, scaffold, strand, pos, locusId and f, followed by one count column per experiment
+#	named SetName.Index (e.g. 1A.ATCACG). The SetName is the set (condition) followed by a one letter replicate suffix, so 1A, 1B and 1C
+#	are replicates A, B and C of set 1.
+#
+#	read_counts loads only the all.poolcount columns needed for an analysis, keeping only the rows within a gene (and, optionally, with enough baseline
+#	reads), either from the binary cache of BarSeq_Cache.py or by streaming the text file in chunks, so that memory use follows the analyzed columns.
+
+# dtypes of the leading all.poolcount columns; the count columns are read as uint32
+pool_dtypes = {'barcode': str, 'rcbarcode': str, 'scaffold': str, 'strand': str, 'pos': np.int64, 'locusId': str, 'f': np.float64}
+
+
+# The columns of all.poolcount that come before the count columns
+pool_columns = bc.pool_columns
+
+# Split a SetName into its set and replicate suffix, e.g. 1A -> ('1', 'A')
+def split_setname(SetName):
+	return SetName[:-1], SetName[-1]
+
+# SetNames listed in the experiment metadata file, in file order
+def read_setnames(expsFile):
+	exps = pd.read_csv(expsFile, sep="\t", dtype=str)
+	return list(exps['SetName'].str.strip())
+
+# Count columns of a table read from all.poolcount (or a replicate table split from it), i.e. every column but the leading all.poolcount columns
+def count_columns(columns):
+	return [column for column in columns if column not in pool_columns]
+
+# Index of the count columns of all.poolcount, built once from its header: {(set number, replicate): column position}, e.g. ('1', 'A') -> 7.
+#	Sets are numbered 1, 2, 3, etc. in the order they first appear in the file, as for the set numbers given to 4_BarSeqProc_loadExps.py, and each set
+#	can have any number of replicates (A, B, C, D, etc.), not necessarily the same for every set. If SetNames from the experiment metadata are given,
+#	only the columns of those SetNames are indexed.
+def column_index(columns, SetNames=None):
+	index = {}
+	set_numbers = {}
+	for position, column in enumerate(columns):
+		if column in pool_columns:
+			continue
+		SetName = column.split('.')[0]
+		if SetNames is not None and SetName not in SetNames:
+			continue
+		setname, replicate = split_setname(SetName)
+		number = set_numbers.setdefault(setname, str(len(set_numbers)+1))
+		if (number, replicate) in index:
+			raise ValueError('SetName ' + SetName + ' has more than one count column: ' + columns[index[(number, replicate)]] + ', ' + column)
+		index[(number, replicate)] = position
+	return index
+
+# Count columns of all.poolcount by set number and replicate: {'1': {'A': '1A.ATCACG', 'B': ...}, '2': {...}}, from the column index
+def replicate_columns(columns, SetNames=None):
+	sets = {}
+	for (number, replicate), position in column_index(columns, SetNames).items():
+		sets.setdefault(number, {})[replicate] = columns[position]
+	return sets
+
+# Column names of all.poolcount, without reading any rows
+def read_header(poolFile):
+	return list(pd.read_csv(poolFile, sep="\t", nrows=0).columns)
+
+# The leading all.poolcount columns (or those in meta_columns) and the count_columns, in file order, for the rows where the insertion is within a gene
+#	and, if BL_column is given, with >= min_BL reads in BL_column. The rows are filtered before the table is assembled: from the memory-mapped cache,
+#	or chunk by chunk of the text file if cache=False (or the cache cannot be written).
+def read_counts(poolFile, count_columns, BL_column=None, min_BL=3, meta_columns=None, cache=True, chunksize=500000):
+	header = read_header(poolFile)
+	if meta_columns is None:
+		meta_columns = pool_columns
+	columns = [column for column in header if column in meta_columns or column in count_columns]
+
+	if cache:
+		try:
+			meta = bc.open_cache(poolFile)
+		except OSError as error:
+			print('Could not cache', poolFile, '('+str(error)+'), reading it directly')
+			cache = False
+	if cache:
+		keep = bc.load_column(meta, 'locusId') >= 0
+		if BL_column is not None:
+			keep &= bc.load_column(meta, BL_column) >= min_BL
+		return bc.read_pool(poolFile, columns, meta['dir'], np.flatnonzero(keep))
+
+	dtypes = {column: pool_dtypes.get(column, bc.count_dtype) for column in columns}
+	pieces = []
+	for chunk in pd.read_csv(poolFile, sep="\t", usecols=columns, dtype=dtypes, chunksize=chunksize):
+		keep = chunk['locusId'].notna()
+		if BL_column is not None:
+			keep &= chunk[BL_column] >= min_BL
+		pieces.append(chunk[keep])
+	return pd.concat(pieces, ignore_index=True)
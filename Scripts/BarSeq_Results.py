@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, json, shutil
+
+# Results store of a baseline: the fitness values of every test condition and replicate in one directory of .npy arrays, instead of the _allAnalyzedGenes.csv,
+#	_Fitness_Summary.csv and _Statistics_sorted.csv files of each condition, so that later stages read only the genes and conditions they need.
+#	The arrays are memory-mapped, with conditions as the outer axis, so the values of a condition are contiguous. A store is a dict of:
+#		genes			locus tag of each gene, in the order the genes first appear in the replicate tables
+#		conditions		test conditions (set numbers)
+#		replicates		replicate letters of all conditions, and condition_replicates, the replicate letters of each condition
+#		normGeneFit, tStat_abs		conditions x genes x replicates fitness and t-like statistic of each replicate (NaN if the gene was not analyzed)
+#		reads			conditions x genes x replicates reads of each gene in the condition (strain_Sums, 0 if the gene was not analyzed)
+#		baseline_reads, strains		genes x replicates baseline reads (BL_Sums) and number of strains with >= 3 baseline reads of each gene
+#		mean, t_stat, p_value, q_value, adjusted_q_value	conditions x genes merged replicate statistics, as in the _Statistics_sorted.csv file of
+#						7_Replicates_Table.py (NaN if the gene was trimmed from the merged table)
+#		positions		conditions x genes row of each gene in the merged table of each condition, -1 if trimmed
+#
+#	The store is written by BarSeq_Pipeline.run_pipeline in BL_<baseline condition>/results.
+#
+# Usage:
+#	python3 PATH/BarSeq_Results.py <PATH/results directory>		prints the shape of the store
+#	python3 PATH/BarSeq_Results.py <PATH/results directory> genes=PP_0001,PP_0002 conditions=4,5 output=PATH/slice.csv
+#		writes the replicate values of the given genes and conditions (default: all) as a long table, one row per condition, gene and replicate
+
+RESULTS_VERSION = 1
+replicate_arrays = ['normGeneFit', 'tStat_abs', 'reads']
+baseline_arrays = ['baseline_reads', 'strains']
+merged_arrays = ['mean', 't_stat', 'p_value', 'q_value', 'adjusted_q_value', 'positions']
+label_arrays = ['genes', 'conditions', 'replicates']
+
+# Merged replicate table column of each merged array (see BarSeq_Pipeline.merge_replicates)
+merged_columns = {'mean': 'mean', 't_stat': 't_stat', 'p_value': 'p_value', 'q_value': 'q-value_BH_method', 'adjusted_q_value': 'adjusted_q-value'}
+
+
+# Build the store of a baseline from the replicate analyses of BarSeq_Pipeline.run_replicates ({replicate: (Fitness, genes_less_30, Unused_0ct)},
+#	Fitness keyed by test condition) and the merged replicate tables of each condition ({condition: table from merge_replicates})
+def build_results(replicates, Summaries):
+	conditions = list(Summaries)
+	letters = sorted(replicates)
+	Tables = {(condition, replicate): replicates[replicate][0][condition] for replicate in letters for condition in conditions if condition in replicates[replicate][0]}
+	genes = pd.Index(pd.unique(np.concatenate([np.asarray(Table.index, dtype=object) for Table in Tables.values()] +
+		[np.asarray(Summary.index, dtype=object) for Summary in Summaries.values()])))
+	shape = (len(conditions), len(genes), len(letters))
+
+	Results = {'genes': genes, 'conditions': conditions, 'replicates': letters,
+		'condition_replicates': [[replicate for replicate in letters if (condition, replicate) in Tables] for condition in conditions],
+		'normGeneFit': np.full(shape, np.nan), 'tStat_abs': np.full(shape, np.nan), 'reads': np.zeros(shape, dtype=np.int64),
+		'baseline_reads': np.zeros(shape[1:], dtype=np.int64), 'strains': np.zeros(shape[1:], dtype=np.int64)}
+	for (condition, replicate), Table in Tables.items():
+		c = conditions.index(condition)
+		r = letters.index(replicate)
+		rows = genes.get_indexer(Table.index)
+		Results['normGeneFit'][c, rows, r] = Table['normGeneFit'].to_numpy(dtype=float)
+		Results['tStat_abs'][c, rows, r] = Table['tStat_abs'].to_numpy(dtype=float)
+		Results['reads'][c, rows, r] = Table['strain_Sums'].to_numpy(dtype=np.int64)
+		Results['baseline_reads'][rows, r] = Table['BL_Sums'].to_numpy(dtype=np.int64)
+		Results['strains'][rows, r] = Table['nStrains'].to_numpy(dtype=np.int64)
+
+	for name in merged_arrays:
+		Results[name] = np.full(shape[:2], -1 if name == 'positions' else np.nan, dtype=np.int64 if name == 'positions' else float)
+	for c, Summary in enumerate(Summaries.values()):
+		rows = genes.get_indexer(Summary.index)
+		for name, column in merged_columns.items():
+			Results[name][c, rows] = Summary[column].to_numpy(dtype=float)
+		Results['positions'][c, rows] = np.arange(len(rows))
+	return Results
+
+# Save a store as .npy files and meta.json, and load it back memory-mapped
+def save_results(Results, results_dir, **meta):
+	tmp_dir = results_dir + '.tmp'
+	shutil.rmtree(tmp_dir, ignore_errors=True)
+	os.makedirs(tmp_dir)
+	for name in label_arrays:
+		np.save(os.path.join(tmp_dir, name+'.npy'), np.array(list(Results[name]), dtype=str))
+	for name in replicate_arrays + baseline_arrays + merged_arrays:
+		np.save(os.path.join(tmp_dir, name+'.npy'), Results[name])
+	with open(os.path.join(tmp_dir, 'meta.json'), 'w') as handle:
+		json.dump(dict(meta, version=RESULTS_VERSION, condition_replicates=Results['condition_replicates']), handle)
+	shutil.rmtree(results_dir, ignore_errors=True)
+	os.rename(tmp_dir, results_dir)
+
+def open_results(results_dir, mmap_mode='r'):
+	with open(os.path.join(results_dir, 'meta.json')) as handle:
+		meta = json.load(handle)
+	if meta.get('version') != RESULTS_VERSION:
+		raise ValueError(results_dir + ' is a results store of version ' + str(meta.get('version')) + ', expected ' + str(RESULTS_VERSION))
+	Results = {name: np.load(os.path.join(results_dir, name+'.npy'), mmap_mode=mmap_mode) for name in replicate_arrays + baseline_arrays + merged_arrays}
+	Results['genes'] = pd.Index(np.load(os.path.join(results_dir, 'genes.npy')).astype(object))
+	Results['conditions'] = list(np.load(os.path.join(results_dir, 'conditions.npy')))
+	Results['replicates'] = list(np.load(os.path.join(results_dir, 'replicates.npy')))
+	Results['condition_replicates'] = meta['condition_replicates']
+	return Results
+
+
+# Store restricted to the given genes and conditions (default: all), in the given order, as in-memory arrays. Only these slices are read from a
+#	memory-mapped store. Genes or conditions missing from the store raise a KeyError.
+def select(Results, genes=None, conditions=None):
+	c = np.arange(len(Results['conditions'])) if conditions is None else label_positions(Results['conditions'], conditions, 'conditions')
+	g = np.arange(len(Results['genes'])) if genes is None else label_positions(Results['genes'], genes, 'genes')
+	whole_genes = genes is None
+	Selected = {'genes': Results['genes'][g], 'conditions': [Results['conditions'][k] for k in c], 'replicates': list(Results['replicates']),
+		'condition_replicates': [Results['condition_replicates'][k] for k in c]}
+	for name in replicate_arrays + merged_arrays:
+		Selected[name] = np.stack([np.asarray(Results[name][k] if whole_genes else Results[name][k][g]) for k in c]) if len(c) else np.asarray(Results[name][:0])
+	for name in baseline_arrays:
+		Selected[name] = np.asarray(Results[name] if whole_genes else Results[name][g])
+	return Selected
+
+def label_positions(labels, selected, name):
+	positions = pd.Index(labels).get_indexer(pd.Index(selected))
+	if (positions < 0).any():
+		raise KeyError('not in the results store ' + name + ': ' + ', '.join(str(label) for label in np.asarray(selected, dtype=object)[positions < 0]))
+	return positions
+
+# Merged replicate table of a condition, as returned by BarSeq_Pipeline.merge_replicates (NormGeneFit_A, etc., mean, t_stat, p_value, q-value_BH_method and
+#	adjusted_q-value, indexed by geneName in the merged table order)
+def summary_table(Results, condition):
+	Condition = select(Results, conditions=[condition])
+	positions = Condition['positions'][0]
+	rows = np.flatnonzero(positions >= 0)
+	rows = rows[np.argsort(positions[rows])]
+	Summary = pd.DataFrame(index=pd.Index(np.asarray(Condition['genes'][rows], dtype=object), name='geneName'))
+	for replicate in Condition['condition_replicates'][0]:
+		Summary['NormGeneFit_'+replicate] = Condition['normGeneFit'][0, rows, Condition['replicates'].index(replicate)]
+	for name, column in merged_columns.items():
+		Summary[column] = Condition[name][0, rows]
+	return Summary
+
+# Fitness tensor of the merged replicate tables of the given conditions (default: all), as BarSeq_Compare.fitness_tensor gives for their tables,
+#	read from the store
+def fitness_tensor(Results, conditions=None):
+	Selected = select(Results, conditions=conditions)
+	merged = Selected['positions'] >= 0
+	nReplicates = max([len(letters) for letters in Selected['condition_replicates']] + [0])
+	fitness = np.full(Selected['positions'].shape + (nReplicates,), np.nan)
+	for c, letters in enumerate(Selected['condition_replicates']):
+		values = Selected['normGeneFit'][c][:, [Selected['replicates'].index(replicate) for replicate in letters]]
+		fitness[c, :, :len(letters)] = np.where(merged[c][:,None], values, np.nan)
+	return {'conditions': Selected['conditions'], 'genes': Selected['genes'], 'replicates': Selected['condition_replicates'], 'fitness': fitness,
+		'means': np.where(merged, Selected['mean'], np.nan), 'positions': Selected['positions']}
+
+# Long table of the replicate values of a store (or of a selection), one row per condition, gene and replicate analyzed
+def replicate_table(Results):
+	c, g, r = np.nonzero(~np.isnan(Results['normGeneFit']))
+	return pd.DataFrame({'condition': np.asarray(Results['conditions'], dtype=object)[c], 'geneName': np.asarray(Results['genes'], dtype=object)[g],
+		'replicate': np.asarray(Results['replicates'], dtype=object)[r], 'normGeneFit': Results['normGeneFit'][c, g, r], 'tStat_abs': Results['tStat_abs'][c, g, r],
+		'reads': Results['reads'][c, g, r], 'baseline_reads': Results['baseline_reads'][g, r], 'strains': Results['strains'][g, r]})
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <path to results directory> <kwargs>")
+		sys.exit(0)
+
+	kwargs = dict(arg.split('=') for arg in sys.argv[2:])
+	Results = open_results(sys.argv[1])
+	if kwargs:
+		Selected = select(Results, kwargs['genes'].split(',') if 'genes' in kwargs else None, kwargs['conditions'].split(',') if 'conditions' in kwargs else None)
+		replicate_table(Selected).to_csv(kwargs.get('output', 'Results_slice.csv'), index=False)
+	else:
+		print(sys.argv[1] + ':', len(Results['genes']), 'genes,', len(Results['conditions']), 'conditions,', len(Results['replicates']), 'replicates')
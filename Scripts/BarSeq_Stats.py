@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+import numpy as np
+from scipy.special import stdtr
+
+# Statistics shared by 7_Replicates_Table.py, 8_Fitness_Compare.py and BarSeq_Pipeline.py, computed for every gene at once.
+#
+#	The t-tests take arrays with the replicates along the last axis (e.g. a genes x replicates fitness matrix, or a stack of them for several
+#	conditions) and return the t statistic and two-tailed p-value of every row, as scipy.stats.ttest_1samp / ttest_ind with axis=-1 would.
+#	Rows with a missing value give NaN.
+#
+#	qvalues gives the positive false discovery rate q-values of Benjamini & Hochberg, 1995 and Storey JD, 2003, and the q-values adjusted for
+#	monotonicity (Yekutieli and Benjamini, 1999) with a reverse cumulative minimum instead of a min(q[i:]) per gene.
+
+
+# Two-tailed p-value of a t statistic with df degrees of freedom
+def t_pvalue(t, df):
+	return 2*stdtr(df, -np.abs(t))
+
+# One sample t-test of the mean of the last axis against popmean
+def ttest_1samp(values, popmean=0):
+	values = np.asarray(values, dtype=float)
+	n = values.shape[-1]
+	with np.errstate(divide='ignore', invalid='ignore'):
+		t = (values.mean(axis=-1) - popmean)/np.sqrt(values.var(axis=-1, ddof=1)/n)
+	return t, t_pvalue(t, n - 1)
+
+# Two sample t-test between the last axes of a and b (the other axes must match), with a pooled variance (equal_var=True, Student) or separate
+#	variances (equal_var=False, Welch)
+def ttest_ind(a, b, equal_var=True):
+	a = np.asarray(a, dtype=float)
+	b = np.asarray(b, dtype=float)
+	n1 = a.shape[-1]
+	n2 = b.shape[-1]
+	v1 = a.var(axis=-1, ddof=1)
+	v2 = b.var(axis=-1, ddof=1)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		if equal_var:
+			df = n1 + n2 - 2
+			denom = np.sqrt(((n1 - 1)*v1 + (n2 - 1)*v2)/df*(1/n1 + 1/n2))
+		else:
+			vn1 = v1/n1
+			vn2 = v2/n2
+			df = (vn1 + vn2)**2/(vn1**2/(n1 - 1) + vn2**2/(n2 - 1))
+			denom = np.sqrt(vn1 + vn2)
+		t = (a.mean(axis=-1) - b.mean(axis=-1))/denom
+	return t, t_pvalue(t, df)
+
+# Storey's estimate of the proportion of true null hypotheses, pi0 = #(p > lambda) / (N * (1 - lambda)), capped at 1, along the last axis
+def storey_pi0(p, lam=0.5):
+	p = np.asarray(p, dtype=float)
+	return np.minimum(1, np.count_nonzero(p > lam, axis=-1)/(p.shape[-1]*(1 - lam)))
+
+# q-values along the last axis of p: q(i) = pi0*p(i)*N/i in order of increasing p-value (the positive Benjamini-Hochberg method for pi0=1, Storey's
+#	for pi0 = storey_pi0(p)), capped at cap if given, and the q-values adjusted for monotonicity, q*(i) = min q(k) for k >= i. Both are returned
+#	in the order of p. Missing p-values sort last and do not lower the adjusted q-values of the others. N is the length of the last axis, unless the
+#	number of tests of each row is given as n (e.g. for rows padded with missing p-values).
+def qvalues(p, cap=None, pi0=1, n=None):
+	p = np.asarray(p, dtype=float)
+	N = p.shape[-1] if n is None else np.expand_dims(n, -1)
+	order = np.argsort(p, axis=-1, kind='stable')
+	q_sorted = np.take_along_axis(p, order, axis=-1)*N/np.arange(1,p.shape[-1]+1)
+	if not np.isscalar(pi0) or pi0 != 1:
+		q_sorted = q_sorted*np.expand_dims(pi0, -1)
+	if cap is not None:
+		q_sorted = np.minimum(q_sorted, cap)
+	adjusted_sorted = np.flip(np.fmin.accumulate(np.flip(q_sorted, axis=-1), axis=-1), axis=-1)
+	q = np.empty(p.shape)
+	adjusted = np.empty(p.shape)
+	np.put_along_axis(q, order, q_sorted, axis=-1)
+	np.put_along_axis(adjusted, order, adjusted_sorted, axis=-1)
+	return q, adjusted
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os, json, shutil
+import BarSeq_Cache as bc
+import BarSeq_Pool as bp
+
+# Gene-grouped strain store: the in-gene strains of all.poolcount sorted by gene, then by position, with CSR-style gene offsets, so that the strains of
+#	a gene are a slice of every strain array and the strains of a replicate are a slice of the count matrix. A store is a dict of:
+#		genes			locusId of each gene, in the order the genes first appear in all.poolcount
+#		scaffolds		scaffold of each gene
+#		gene_offsets	the strains of gene g are rows gene_offsets[g]:gene_offsets[g+1] (length number of genes + 1)
+#		pos, f			position and fraction of the gene of each strain
+#		counts			strains x count columns uint32 matrix, stored column by column so that each count column is contiguous
+#		columns			names of the count columns
+#
+#	open_store builds the store of an all.poolcount file once, in the strains directory of its binary cache (BarSeq_Cache.py), and later memory-maps it.
+#
+# Usage:
+#	python3 PATH/BarSeq_Strains.py <PATH/all.poolcount_file>		builds (or checks) the strain store of the file
+
+STORE_VERSION = 1
+store_arrays = ['genes', 'scaffolds', 'gene_offsets', 'pos', 'f', 'counts']
+
+
+# Build a store from a table read from all.poolcount (or a replicate table split from it), with the given count columns (default: all count columns).
+#	Rows outside of genes are left out.
+def build_store(Counts_Table, count_columns=None):
+	if count_columns is None:
+		count_columns = bp.count_columns(Counts_Table.columns)
+	in_genes = Counts_Table['locusId'].notna().values
+	codes, genes = pd.factorize(Counts_Table['locusId'].values[in_genes])
+	pos = Counts_Table['pos'].values[in_genes] if 'pos' in Counts_Table.columns else np.zeros(len(codes), dtype=np.int64)
+	order = np.lexsort((pos, codes))
+
+	gene_offsets = np.zeros(len(genes)+1, dtype=np.int64)
+	gene_offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(genes)))
+	first_strains = order[gene_offsets[:-1]]
+	return {'genes': np.asarray(genes, dtype=object), 'scaffolds': np.asarray(Counts_Table['scaffold'].values[in_genes][first_strains], dtype=object),
+		'gene_offsets': gene_offsets, 'pos': pos[order], 'f': Counts_Table['f'].values[in_genes][order].astype(float),
+		'counts': np.asfortranarray(Counts_Table[count_columns].to_numpy(dtype=bc.count_dtype)[in_genes][order]), 'columns': list(count_columns)}
+
+# Gene of each strain, as a position in store['genes']
+def strain_genes(store):
+	return np.repeat(np.arange(len(store['genes'])), np.diff(store['gene_offsets']))
+
+def gene_strains(store, g):
+	return slice(store['gene_offsets'][g], store['gene_offsets'][g+1])
+
+# Store restricted to the strains in keep (a boolean mask) and to the given count columns (default: all); genes left without strains are dropped
+def select_strains(store, keep, columns=None):
+	positions = list(range(len(store['columns']))) if columns is None else [store['columns'].index(column) for column in columns]
+	strain_counts = np.bincount(strain_genes(store)[keep], minlength=len(store['genes']))
+	kept_genes = strain_counts > 0
+	gene_offsets = np.zeros(np.count_nonzero(kept_genes)+1, dtype=np.int64)
+	gene_offsets[1:] = np.cumsum(strain_counts[kept_genes])
+	return {'genes': store['genes'][kept_genes], 'scaffolds': store['scaffolds'][kept_genes], 'gene_offsets': gene_offsets,
+		'pos': store['pos'][keep], 'f': store['f'][keep], 'counts': np.asfortranarray(store['counts'][:,positions][keep]),
+		'columns': [store['columns'][k] for k in positions]}
+
+# Store restricted to whole genes (a boolean mask over store['genes']) and to the given count columns (default: all)
+def select_genes(store, kept_genes, columns=None):
+	keep = np.repeat(kept_genes, np.diff(store['gene_offsets']))
+	return select_strains(store, keep, columns)
+
+# Strain table of a store, with the scaffold, locusId, pos and f of each strain followed by the count columns
+def store_table(store):
+	gene_of_strain = strain_genes(store)
+	Table = pd.DataFrame({'scaffold': store['scaffolds'][gene_of_strain], 'locusId': store['genes'][gene_of_strain], 'pos': store['pos'], 'f': store['f']})
+	for k, column in enumerate(store['columns']):
+		Table[column] = store['counts'][:,k]
+	return Table
+
+# Save a store as .npy files (the count matrix in column order) and meta.json, and load it back memory-mapped
+def save_store(store, store_dir, **meta):
+	tmp_dir = store_dir + '.tmp'
+	shutil.rmtree(tmp_dir, ignore_errors=True)
+	os.makedirs(tmp_dir)
+	for name in store_arrays:
+		values = store[name]
+		if values.dtype == object:
+			values = np.array(values, dtype=str)
+		np.save(os.path.join(tmp_dir, name+'.npy'), values)
+	with open(os.path.join(tmp_dir, 'meta.json'), 'w') as handle:
+		json.dump(dict(meta, version=STORE_VERSION, columns=store['columns']), handle)
+	shutil.rmtree(store_dir, ignore_errors=True)
+	os.rename(tmp_dir, store_dir)
+
+def load_store(store_dir, mmap_mode='r'):
+	with open(os.path.join(store_dir, 'meta.json')) as handle:
+		meta = json.load(handle)
+	store = {name: np.load(os.path.join(store_dir, name+'.npy'), mmap_mode=mmap_mode) for name in store_arrays}
+	store['genes'] = np.asarray(store['genes'], dtype=object)
+	store['scaffolds'] = np.asarray(store['scaffolds'], dtype=object)
+	store['columns'] = meta['columns']
+	return store
+
+# Directory of the strain store of an all.poolcount file, built from the binary cache if it is missing or out of date
+def open_store(poolFile, cache_dir=None):
+	meta = bc.open_cache(poolFile, cache_dir)
+	store_dir = os.path.join(meta['dir'], 'strains')
+	store_meta = None
+	if os.path.isfile(os.path.join(store_dir, 'meta.json')):
+		with open(os.path.join(store_dir, 'meta.json')) as handle:
+			store_meta = json.load(handle)
+	if store_meta is None or store_meta.get('version') != STORE_VERSION or store_meta.get('sha256') != meta['sha256']:
+		columns = [column['name'] for column in meta['columns']]
+		save_store(build_store(bp.read_counts(poolFile, bp.count_columns(columns))), store_dir, sha256=meta['sha256'])
+	return store_dir
+
+
+if __name__=='__main__':
+	if len(sys.argv) < 2:
+		print("Usage: " + sys.argv[0] + " <path to all.poolcount>")
+		sys.exit(0)
+
+	store_dir = open_store(sys.argv[1])
+	store = load_store(store_dir)
+	print(store_dir + ':', len(store['f']), 'strains in', len(store['genes']), 'genes,', len(store['columns']), 'count columns')
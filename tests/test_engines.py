@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+import numpy as np
+import pandas as pd
+import sys, os
+import pytest
+from scipy import stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scripts'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Benchmarks'))
+import BarSeq_Compare as bcmp
+import BarSeq_Fitness as bf
+import BarSeq_Pipeline as bpl
+import BarSeq_Pool as bp
+import BarSeq_Stats as bst
+import BarSeq_Strains as bs
+import synthetic_pool as sp
+from bench_fitness_engine import legacy_gene_fitness
+from bench_stats import legacy_pair, legacy_qvalues
+
+# Regression tests of the vectorized engines against the per-gene loops of the original scripts (or their reimplementations in Benchmarks/),
+#	on a small synthetic pool (Benchmarks/synthetic_pool.py). The low depth leaves some genes under 30 baseline reads and some with zero reads.
+#
+# Usage:
+#	python3 -m pytest PATH/tests
+
+baseline = '1'
+Test_Conditions = ['2', '3']
+
+
+@pytest.fixture(scope='module')
+def Pool():
+	Pool, Exps = sp.synthetic_pool(20000, nGenes=400, depth=4, seed=1)
+	return Pool
+
+@pytest.fixture(scope='module')
+def replicates(Pool):
+	tables = bpl.split_replicates(Pool, baseline, Test_Conditions)
+	return {replicate: bpl.analyze_exp(in3genes, write=False) for replicate, in3genes in tables.items()}
+
+# The original rolling median: the median of np.take(values, ..., mode='wrap') at every position
+def legacy_rolling_median(values, window=251):
+	left = (window - 1)//2
+	return np.array([np.median(np.take(values, np.arange(l - left, l - left + window), mode='wrap')) for l in range(len(values))])
+
+# The merge of the original 7_Replicates_Table.py: the eliminated genes removed from each replicate and the rows put side by side by position,
+#	which only holds when every replicate lists the same genes in the same order
+def legacy_merge(Fitness_Tables, eliminate):
+	Reps = [Table[~Table.index.isin(list(eliminate))] for Table in Fitness_Tables.values()]
+	for Rep in Reps[1:]:
+		assert list(Rep.index) == list(Reps[0].index)
+	FitVals = np.column_stack([Rep['normGeneFit'].values for Rep in Reps])
+	return Reps[0].index, FitVals, np.mean(FitVals, axis=1)
+
+
+def test_gene_sums(Pool):
+	in_genes = Pool[Pool['locusId'].notna()]
+	columns = bp.count_columns(Pool.columns)
+	Reference = in_genes.groupby('locusId', sort=False)[columns].sum()
+	NoLess30_Gene_Sums_Table, genes_less_30 = bpl.gene_sums(bs.build_store(Pool, columns))
+	used = Reference.iloc[:,0] >= bf.minGeneReads
+	assert len(genes_less_30) > 0
+	pd.testing.assert_frame_equal(NoLess30_Gene_Sums_Table, Reference[used].rename_axis('locusId'), check_dtype=False)
+	pd.testing.assert_frame_equal(genes_less_30, Reference[~used].rename_axis('locusId'), check_dtype=False)
+
+def test_gene_fitness(Pool):
+	BL_column, Enrichment_column = '1A.IDX1A', '2A.IDX2A'
+	in3genes = Pool[Pool['locusId'].notna() & (Pool[BL_column] >= bf.minStrainReads)]
+	store = bs.build_store(in3genes, [BL_column, Enrichment_column])
+	NoLess30_Gene_Sums_Table, genes_less_30 = bpl.gene_sums(store)
+	NoLess30_Gene_Sums_Table = NoLess30_Gene_Sums_Table[NoLess30_Gene_Sums_Table.iloc[:,1] > 0]
+	Used = bs.select_genes(store, pd.Index(store['genes']).isin(NoLess30_Gene_Sums_Table.index))
+	BL = Used['counts'][:,0].astype(np.int64)
+	Enrichment = Used['counts'][:,1].astype(np.int64)
+	BL_Sums = NoLess30_Gene_Sums_Table.iloc[:,0].values
+	strain_Sums = NoLess30_Gene_Sums_Table.iloc[:,1].values
+
+	fit = bf.gene_fitness(BL, Enrichment, bs.strain_genes(Used), Used['f'], BL_Sums, strain_Sums)
+	psi, uGeneFitness, sumSq, uGF1, uGF2 = legacy_gene_fitness(Used['genes'][bs.strain_genes(Used)], pd.Index(Used['genes']), BL, Enrichment,
+		Used['f'], BL_Sums, strain_Sums)
+	np.testing.assert_allclose(fit['psi'], psi, rtol=1e-12)
+	np.testing.assert_allclose(fit['uGeneFitness'], uGeneFitness, rtol=1e-9, atol=1e-12)
+	np.testing.assert_allclose(fit['sumSq'], sumSq, rtol=1e-9, atol=1e-12)
+	np.testing.assert_allclose(fit['uGF1'], uGF1, rtol=1e-9, atol=1e-12)
+	np.testing.assert_allclose(fit['uGF2'], uGF2, rtol=1e-9, atol=1e-12)
+
+@pytest.mark.parametrize('nValues', [1, 2, 3, 7, 120, 250, 251, 252, 600])
+def test_circular_rolling_median(nValues):
+	values = np.random.default_rng(nValues).normal(size=nValues)
+	np.testing.assert_array_equal(bf.circular_rolling_median(values), legacy_rolling_median(values))
+	np.testing.assert_array_equal(bf.circular_rolling_median(values, window=10), legacy_rolling_median(values, window=10))
+
+# a chromosome and two plasmids shorter than the window, their genes interleaved
+def test_normalize_short_scaffolds():
+	rng = np.random.default_rng(0)
+	scaffolds = rng.permutation(np.array(['chromosome']*700 + ['plasmid_1']*40 + ['plasmid_2']*3, dtype=object))
+	uGeneFitness = rng.normal(size=len(scaffolds))
+	normGeneFitness = bf.normalize_gene_fitness(uGeneFitness, 251, scaffolds)
+	for scaffold in ['chromosome', 'plasmid_1', 'plasmid_2']:
+		on_scaffold = scaffolds == scaffold
+		np.testing.assert_array_equal(normGeneFitness[on_scaffold], uGeneFitness[on_scaffold] - legacy_rolling_median(uGeneFitness[on_scaffold]))
+	np.testing.assert_array_equal(bf.normalize_gene_fitness(uGeneFitness), uGeneFitness - legacy_rolling_median(uGeneFitness))
+
+@pytest.mark.parametrize('condition', Test_Conditions)
+def test_merge_replicates(replicates, condition):
+	Fitness_Tables = {replicate: Fitness[condition+replicate+'.IDX'+condition+replicate] for replicate, (Fitness, genes_less_30, Unused_0ct) in replicates.items()}
+	Unused_Genes = set()
+	for replicate, (Fitness, genes_less_30, Unused_0ct) in replicates.items():
+		Unused_Genes.update(genes_less_30)
+		for genes in Unused_0ct.values():
+			Unused_Genes.update(genes)
+	genes, FitVals, mean = legacy_merge(Fitness_Tables, Unused_Genes)
+
+	# the same tables with the rows of every replicate but the first shuffled
+	rng = np.random.default_rng(0)
+	Shuffled = {replicate: Table if k == 0 else Table.iloc[rng.permutation(len(Table))] for k, (replicate, Table) in enumerate(Fitness_Tables.items())}
+	for Tables in [Fitness_Tables, Shuffled]:
+		Summary = bpl.merge_replicates(Tables, Unused_Genes)
+		assert list(Summary.index) == list(genes)
+		np.testing.assert_array_equal(Summary[['NormGeneFit_A', 'NormGeneFit_B', 'NormGeneFit_C']].values, FitVals)
+		np.testing.assert_allclose(Summary['mean'].values, mean, rtol=1e-12)
+		t, p = stats.ttest_1samp(FitVals, popmean=0, axis=1)
+		np.testing.assert_allclose(Summary['t_stat'].values, t, rtol=1e-9)
+		np.testing.assert_allclose(Summary['p_value'].values, p, rtol=1e-9)
+
+def test_merge_no_replicates():
+	Summary = bpl.merge_replicates({})
+	assert len(Summary) == 0
+	assert list(Summary.columns) == ['mean', 't_stat', 'p_value', 'q-value_BH_method', 'adjusted_q-value']
+
+def test_compare_pairs(replicates):
+	Summaries = {}
+	for condition in Test_Conditions:
+		Summaries[condition] = bpl.merge_replicates({replicate: Fitness[condition+replicate+'.IDX'+condition+replicate]
+			for replicate, (Fitness, genes_less_30, Unused_0ct) in replicates.items()})
+	Summary_1, Summary_2 = Summaries['2'], Summaries['3']
+	Comparison = bcmp.compare_all(Summaries, pairs=[('2', '3')])
+
+	genes = Summary_1.index[Summary_1.index.isin(Summary_2.index)]
+	A = Summary_1.loc[genes, ['NormGeneFit_A', 'NormGeneFit_B', 'NormGeneFit_C']].values
+	B = Summary_2.loc[genes, ['NormGeneFit_A', 'NormGeneFit_B', 'NormGeneFit_C']].values
+	tscoreArray, pvalueArray, order, qVals, sort_qVal = legacy_pair(A, B)
+	assert list(Comparison['Locus_Tag']) == list(genes[order])
+	np.testing.assert_allclose(Comparison['t-statistic'].values, tscoreArray[order], rtol=1e-9)
+	np.testing.assert_allclose(Comparison['p-value'].values, pvalueArray[order], rtol=1e-9)
+	np.testing.assert_allclose(Comparison['q-value'].values, qVals, rtol=1e-9)
+	np.testing.assert_allclose(Comparison['adjusted_q-value'].values, sort_qVal, rtol=1e-9)
+	np.testing.assert_array_equal(Comparison['Condition_1_mean'].values, Summary_1.loc[genes[order], 'mean'].values)
+
+def test_qvalues():
+	rng = np.random.default_rng(0)
+	p = np.concatenate([rng.uniform(size=500), rng.uniform(0, 1e-3, size=50), np.full(10, 0.5)])
+	order = np.argsort(p, kind='stable')
+	qVals, sort_qVal = legacy_qvalues(p[order])
+	q, adjusted = bst.qvalues(p, cap=1)
+	np.testing.assert_allclose(q[order], qVals, rtol=1e-12)
+	np.testing.assert_allclose(adjusted[order], sort_qVal, rtol=1e-12)